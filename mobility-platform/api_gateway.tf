@@ -119,6 +119,12 @@ resource "aws_api_gateway_method" "vehicles_get" {
   request_parameters = {
     "method.request.querystring.bbox"         = false
     "method.request.querystring.last_updated" = false
+    "method.request.querystring.aggregate"    = false
+    "method.request.querystring.resolution"   = false
+    "method.request.querystring.device_id"    = false
+    "method.request.querystring.start_time"   = false
+    "method.request.querystring.end_time"     = false
+    "method.request.querystring.interval"     = false
   }
 }
 
@@ -10,11 +10,13 @@ resource "aws_lambda_function" "auth_lambda" {
   runtime         = var.lambda_runtime
   timeout         = var.lambda_timeout
   memory_size     = var.lambda_memory_size
+  layers          = [aws_lambda_layer_version.shared_layer.arn]
 
   environment {
     variables = {
-      MDS_VERSION = var.mds_version
-      PROVIDER_ID = var.provider_id
+      MDS_VERSION     = var.mds_version
+      PROVIDER_ID     = var.provider_id
+      PREWARM_ON_INIT = tostring(var.prewarm_on_init)
     }
   }
 
@@ -33,6 +35,7 @@ resource "aws_lambda_function" "vehicles_lambda" {
   runtime         = var.lambda_runtime
   timeout         = var.lambda_timeout
   memory_size     = var.lambda_memory_size
+  layers          = [aws_lambda_layer_version.shared_layer.arn]
 
   vpc_config {
     subnet_ids         = aws_subnet.private_subnet[*].id
@@ -41,20 +44,40 @@ resource "aws_lambda_function" "vehicles_lambda" {
 
   environment {
     variables = {
-      DB_SECRET_ARN = aws_secretsmanager_secret.db_credentials.arn
-      MDS_VERSION   = var.mds_version
-      PROVIDER_ID   = var.provider_id
-      PROVIDER_NAME = var.provider_name
+      DB_SECRET_ARN              = aws_secretsmanager_secret.db_credentials.arn
+      MDS_VERSION                = var.mds_version
+      PROVIDER_ID                = var.provider_id
+      PROVIDER_NAME              = var.provider_name
+      ARTIFACT_BUCKET            = aws_s3_bucket.response_artifacts.id
+      ARTIFACT_URL_TTL           = var.artifact_url_ttl_seconds
+      SPILLOVER_THRESHOLD_BYTES  = var.spillover_threshold_bytes
+      PREWARM_ON_INIT            = tostring(var.prewarm_on_init)
+      QUERY_CACHE_URL            = local.query_cache_url
+      QUERY_CACHE_TTL            = var.vehicles_cache_ttl_seconds
+      FLEET_CACHE_TTL            = var.vehicles_fleet_cache_ttl_seconds
+      DATA_SOURCE                = var.data_source
+      DB_REPLICA_HOSTS           = join(",", aws_db_instance.mds_replica[*].endpoint)
+      DB_MAX_REPLICA_LAG_SECONDS = var.db_max_replica_lag_seconds
+      QUERY_PROFILING            = tostring(var.query_profiling_enabled)
+      SLOW_QUERY_MS              = var.slow_query_ms
+      TELEMETRY_STORE_DIR        = "/mnt/event-store/telemetry"
+      TELEMETRY_MAX_POINTS       = var.telemetry_max_points
     }
   }
 
+  file_system_config {
+    arn              = aws_efs_access_point.event_store.arn
+    local_mount_path = "/mnt/event-store"
+  }
+
   tags = {
     Name = "${var.project_name}-vehicles-lambda"
   }
 
   depends_on = [
     aws_iam_role_policy_attachment.lambda_vpc_policy,
-    aws_cloudwatch_log_group.vehicles_lambda_logs
+    aws_cloudwatch_log_group.vehicles_lambda_logs,
+    aws_efs_mount_target.event_store
   ]
 }
 
@@ -68,6 +91,7 @@ resource "aws_lambda_function" "trips_lambda" {
   runtime         = var.lambda_runtime
   timeout         = var.lambda_timeout
   memory_size     = var.lambda_memory_size
+  layers          = [aws_lambda_layer_version.shared_layer.arn]
 
   vpc_config {
     subnet_ids         = aws_subnet.private_subnet[*].id
@@ -76,20 +100,39 @@ resource "aws_lambda_function" "trips_lambda" {
 
   environment {
     variables = {
-      DB_SECRET_ARN = aws_secretsmanager_secret.db_credentials.arn
-      MDS_VERSION   = var.mds_version
-      PROVIDER_ID   = var.provider_id
-      PROVIDER_NAME = var.provider_name
+      DB_SECRET_ARN              = aws_secretsmanager_secret.db_credentials.arn
+      MDS_VERSION                = var.mds_version
+      PROVIDER_ID                = var.provider_id
+      PROVIDER_NAME              = var.provider_name
+      ARTIFACT_BUCKET            = aws_s3_bucket.response_artifacts.id
+      ARTIFACT_URL_TTL           = var.artifact_url_ttl_seconds
+      SPILLOVER_THRESHOLD_BYTES  = var.spillover_threshold_bytes
+      PREWARM_ON_INIT            = tostring(var.prewarm_on_init)
+      QUERY_CACHE_URL            = local.query_cache_url
+      QUERY_CACHE_TTL            = var.trips_cache_ttl_seconds
+      QUERY_TIMEOUT_MS           = var.query_timeout_ms
+      DATA_SOURCE                = var.data_source
+      DB_REPLICA_HOSTS           = join(",", aws_db_instance.mds_replica[*].endpoint)
+      DB_MAX_REPLICA_LAG_SECONDS = var.db_max_replica_lag_seconds
+      QUERY_PROFILING            = tostring(var.query_profiling_enabled)
+      SLOW_QUERY_MS              = var.slow_query_ms
+      TRIP_STORE_DIR             = "/mnt/event-store/trips"
     }
   }
 
+  file_system_config {
+    arn              = aws_efs_access_point.event_store.arn
+    local_mount_path = "/mnt/event-store"
+  }
+
   tags = {
     Name = "${var.project_name}-trips-lambda"
   }
 
   depends_on = [
     aws_iam_role_policy_attachment.lambda_vpc_policy,
-    aws_cloudwatch_log_group.trips_lambda_logs
+    aws_cloudwatch_log_group.trips_lambda_logs,
+    aws_efs_mount_target.event_store
   ]
 }
 
@@ -103,6 +146,7 @@ resource "aws_lambda_function" "events_lambda" {
   runtime         = var.lambda_runtime
   timeout         = var.lambda_timeout
   memory_size     = var.lambda_memory_size
+  layers          = [aws_lambda_layer_version.shared_layer.arn]
 
   vpc_config {
     subnet_ids         = aws_subnet.private_subnet[*].id
@@ -111,20 +155,36 @@ resource "aws_lambda_function" "events_lambda" {
 
   environment {
     variables = {
-      DB_SECRET_ARN = aws_secretsmanager_secret.db_credentials.arn
-      MDS_VERSION   = var.mds_version
-      PROVIDER_ID   = var.provider_id
-      PROVIDER_NAME = var.provider_name
+      DB_SECRET_ARN              = aws_secretsmanager_secret.db_credentials.arn
+      MDS_VERSION                = var.mds_version
+      PROVIDER_ID                = var.provider_id
+      PROVIDER_NAME              = var.provider_name
+      ARTIFACT_BUCKET            = aws_s3_bucket.response_artifacts.id
+      ARTIFACT_URL_TTL           = var.artifact_url_ttl_seconds
+      SPILLOVER_THRESHOLD_BYTES  = var.spillover_threshold_bytes
+      PREWARM_ON_INIT            = tostring(var.prewarm_on_init)
+      EVENT_STORE_DIR            = "/mnt/event-store"
+      DATA_SOURCE                = var.data_source
+      DB_REPLICA_HOSTS           = join(",", aws_db_instance.mds_replica[*].endpoint)
+      DB_MAX_REPLICA_LAG_SECONDS = var.db_max_replica_lag_seconds
+      QUERY_PROFILING            = tostring(var.query_profiling_enabled)
+      SLOW_QUERY_MS              = var.slow_query_ms
     }
   }
 
+  file_system_config {
+    arn              = aws_efs_access_point.event_store.arn
+    local_mount_path = "/mnt/event-store"
+  }
+
   tags = {
     Name = "${var.project_name}-events-lambda"
   }
 
   depends_on = [
     aws_iam_role_policy_attachment.lambda_vpc_policy,
-    aws_cloudwatch_log_group.events_lambda_logs
+    aws_cloudwatch_log_group.events_lambda_logs,
+    aws_efs_mount_target.event_store
   ]
 }
 
@@ -138,6 +198,7 @@ resource "aws_lambda_function" "reports_lambda" {
   runtime         = var.lambda_runtime
   timeout         = var.lambda_timeout
   memory_size     = var.lambda_memory_size
+  layers          = [aws_lambda_layer_version.shared_layer.arn]
 
   vpc_config {
     subnet_ids         = aws_subnet.private_subnet[*].id
@@ -146,10 +207,11 @@ resource "aws_lambda_function" "reports_lambda" {
 
   environment {
     variables = {
-      DB_SECRET_ARN = aws_secretsmanager_secret.db_credentials.arn
-      MDS_VERSION   = var.mds_version
-      PROVIDER_ID   = var.provider_id
-      PROVIDER_NAME = var.provider_name
+      DB_SECRET_ARN   = aws_secretsmanager_secret.db_credentials.arn
+      MDS_VERSION     = var.mds_version
+      PROVIDER_ID     = var.provider_id
+      PROVIDER_NAME   = var.provider_name
+      PREWARM_ON_INIT = tostring(var.prewarm_on_init)
     }
   }
 
@@ -173,12 +235,14 @@ resource "aws_lambda_function" "status_lambda" {
   runtime         = var.lambda_runtime
   timeout         = var.lambda_timeout
   memory_size     = var.lambda_memory_size
+  layers          = [aws_lambda_layer_version.shared_layer.arn]
 
   environment {
     variables = {
-      MDS_VERSION   = var.mds_version
-      PROVIDER_ID   = var.provider_id
-      PROVIDER_NAME = var.provider_name
+      MDS_VERSION     = var.mds_version
+      PROVIDER_ID     = var.provider_id
+      PROVIDER_NAME   = var.provider_name
+      PREWARM_ON_INIT = tostring(var.prewarm_on_init)
     }
   }
 
@@ -191,7 +255,67 @@ resource "aws_lambda_function" "status_lambda" {
   ]
 }
 
+# Lambda Function for event store compaction, trip assembly, telemetry rollup and retention (scheduled, not routed)
+resource "aws_lambda_function" "compaction_lambda" {
+  filename         = "lambda/compaction.zip"
+  function_name    = "${var.project_name}-compaction"
+  role            = aws_iam_role.lambda_role.arn
+  handler         = "compaction.lambda_handler"
+  source_code_hash = data.archive_file.compaction_zip.output_base64sha256
+  runtime         = var.lambda_runtime
+  timeout         = 900
+  memory_size     = var.lambda_memory_size
+  layers          = [aws_lambda_layer_version.shared_layer.arn]
+
+  vpc_config {
+    subnet_ids         = aws_subnet.private_subnet[*].id
+    security_group_ids = [aws_security_group.lambda_sg.id]
+  }
+
+  environment {
+    variables = {
+      EVENT_STORE_DIR              = "/mnt/event-store"
+      EVENT_RETENTION_DAYS         = var.event_retention_days
+      TELEMETRY_STORE_DIR          = "/mnt/event-store/telemetry"
+      TELEMETRY_RAW_RETENTION_DAYS = var.telemetry_raw_retention_days
+      TELEMETRY_1M_RETENTION_DAYS  = var.telemetry_1m_retention_days
+      TELEMETRY_15M_RETENTION_DAYS = var.telemetry_15m_retention_days
+      TRIP_STORE_DIR               = "/mnt/event-store/trips"
+      PROVIDER_ID                  = var.provider_id
+    }
+  }
+
+  file_system_config {
+    arn              = aws_efs_access_point.event_store.arn
+    local_mount_path = "/mnt/event-store"
+  }
+
+  tags = {
+    Name = "${var.project_name}-compaction-lambda"
+  }
+
+  depends_on = [
+    aws_iam_role_policy_attachment.lambda_vpc_policy,
+    aws_cloudwatch_log_group.compaction_lambda_logs,
+    aws_efs_mount_target.event_store
+  ]
+}
+
+# Shared layer with helpers used by the endpoint functions (mds_shared package)
+resource "aws_lambda_layer_version" "shared_layer" {
+  filename            = "lambda/shared.zip"
+  layer_name          = "${var.project_name}-shared"
+  source_code_hash    = data.archive_file.shared_zip.output_base64sha256
+  compatible_runtimes = [var.lambda_runtime]
+}
+
 # Archive data sources for Lambda deployment packages
+data "archive_file" "shared_zip" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda/shared"
+  output_path = "${path.module}/lambda/shared.zip"
+}
+
 data "archive_file" "auth_zip" {
   type        = "zip"
   source_dir  = "${path.module}/lambda/auth"
@@ -228,6 +352,69 @@ data "archive_file" "status_zip" {
   output_path = "${path.module}/lambda/status.zip"
 }
 
+data "archive_file" "compaction_zip" {
+  type        = "zip"
+  source_dir  = "${path.module}/lambda/compaction"
+  output_path = "${path.module}/lambda/compaction.zip"
+}
+
+# Scheduled compaction of closed event segments, followed by retention
+resource "aws_cloudwatch_event_rule" "compaction_schedule" {
+  name                = "${var.project_name}-compaction"
+  description         = "Compact closed MDS event segments and apply retention"
+  schedule_expression = var.compaction_schedule_expression
+}
+
+resource "aws_cloudwatch_event_target" "compaction_target" {
+  rule = aws_cloudwatch_event_rule.compaction_schedule.name
+  arn  = aws_lambda_function.compaction_lambda.arn
+}
+
+resource "aws_lambda_permission" "compaction_permission" {
+  statement_id  = "AllowExecutionFromCompactionSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.compaction_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.compaction_schedule.arn
+}
+
+# Scheduled warm-up pings so idle functions keep a warm container
+resource "aws_cloudwatch_event_rule" "warmup_schedule" {
+  count               = var.enable_warmup_schedule ? 1 : 0
+  name                = "${var.project_name}-warmup"
+  description         = "Warm-up ping for the MDS endpoint functions"
+  schedule_expression = var.warmup_schedule_expression
+}
+
+resource "aws_cloudwatch_event_target" "warmup_target" {
+  for_each = var.enable_warmup_schedule ? local.warmup_functions : {}
+
+  rule  = aws_cloudwatch_event_rule.warmup_schedule[0].name
+  arn   = each.value.arn
+  input = jsonencode({ warmup = true })
+}
+
+resource "aws_lambda_permission" "warmup_permission" {
+  for_each = var.enable_warmup_schedule ? local.warmup_functions : {}
+
+  statement_id  = "AllowExecutionFromWarmupSchedule"
+  action        = "lambda:InvokeFunction"
+  function_name = each.value.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.warmup_schedule[0].arn
+}
+
+locals {
+  warmup_functions = {
+    auth     = aws_lambda_function.auth_lambda
+    vehicles = aws_lambda_function.vehicles_lambda
+    trips    = aws_lambda_function.trips_lambda
+    events   = aws_lambda_function.events_lambda
+    reports  = aws_lambda_function.reports_lambda
+    status   = aws_lambda_function.status_lambda
+  }
+}
+
 # Lambda Permissions for API Gateway
 resource "aws_lambda_permission" "auth_lambda_permission" {
   statement_id  = "AllowExecutionFromAPIGateway"
@@ -306,4 +493,9 @@ resource "aws_cloudwatch_log_group" "reports_lambda_logs" {
 resource "aws_cloudwatch_log_group" "status_lambda_logs" {
   name              = "/aws/lambda/${var.project_name}-status"
   retention_in_days = var.log_retention_days
+}
+
+resource "aws_cloudwatch_log_group" "compaction_lambda_logs" {
+  name              = "/aws/lambda/${var.project_name}-compaction"
+  retention_in_days = var.log_retention_days
 }
\ No newline at end of file
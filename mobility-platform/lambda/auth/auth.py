@@ -7,6 +7,8 @@ import json
 import logging
 from typing import Dict, Any
 
+from mds_shared.warmup import Warmer, is_warmup_event
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -36,6 +38,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         IAM policy document allowing or denying access
     """
+    if is_warmup_event(event):
+        return warmer.warm()
+    
     try:
         logger.info(f"Authorization request: {json.dumps(event, default=str)}")
         
@@ -146,4 +151,8 @@ def get_permissions_for_endpoint(endpoint: str) -> str:
         'reports': 'reports:read',
         'status': 'status:read'
     }
-    return permission_map.get(endpoint, 'unknown:read')
\ No newline at end of file
+    return permission_map.get(endpoint, 'unknown:read')
+
+# Warm-up steps run on scheduled pings, or during init when PREWARM_ON_INIT is set
+warmer = Warmer('auth')
+warmer.warm_on_init()
@@ -0,0 +1,108 @@
+"""
+Circuit Provider API Event Compaction
+Scheduled job that compacts closed event segments, assembles trips and
+rolls up vehicle telemetry from them, and applies retention
+"""
+
+import json
+import os
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any
+
+from mds_shared.event_store import EventStore
+from mds_shared.jurisdictions import get_membership_index
+from mds_shared.telemetry_store import TelemetryStore, point_from_mds
+from mds_shared.trip_assembler import TripAssembler
+from mds_shared.trip_store import TripStore
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+EVENT_STORE_DIR = os.environ.get('EVENT_STORE_DIR')
+EVENT_RETENTION_DAYS = int(os.environ.get('EVENT_RETENTION_DAYS', 90))
+COMPACTION_GRACE_SECONDS = int(os.environ.get('COMPACTION_GRACE_SECONDS', 300))
+TELEMETRY_STORE_DIR = os.environ.get('TELEMETRY_STORE_DIR')
+TRIP_STORE_DIR = os.environ.get('TRIP_STORE_DIR')
+PROVIDER_ID = os.environ.get('PROVIDER_ID')
+# Reported for trips whose locations carry no horizontal_accuracy
+TRIP_ACCURACY_METERS = int(os.environ.get('TRIP_ACCURACY_METERS', 10))
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Handle scheduled compaction run
+
+    Args:
+        event: EventBridge scheduled event
+        context: Lambda context
+
+    Returns:
+        Compaction and retention metrics
+    """
+    if not EVENT_STORE_DIR:
+        raise RuntimeError('EVENT_STORE_DIR is not configured')
+
+    # Agencies are recorded with each event, point and trip as it is written
+    membership = get_membership_index()
+    store = EventStore(EVENT_STORE_DIR, membership=membership)
+    now_ms = int(datetime.now(timezone.utc).timestamp() * 1000)
+    grace_ms = COMPACTION_GRACE_SECONDS * 1000
+
+    telemetry = TelemetryStore(TELEMETRY_STORE_DIR, membership=membership) if TELEMETRY_STORE_DIR else None
+    trip_store = TripStore(TRIP_STORE_DIR, membership=membership) if TRIP_STORE_DIR else None
+    assembler = None
+    if trip_store:
+        assembler = TripAssembler(PROVIDER_ID, default_accuracy=TRIP_ACCURACY_METERS)
+        assembler.restore(trip_store.load_state())
+
+    # Segments about to be compacted feed the telemetry store and the trip
+    # assembler. Event locations and battery levels are the vehicle telemetry
+    # samples; rollup drops repeated points, and the assembler drops events
+    # older than what it has already seen for the device.
+    trips_appended = 0
+    if telemetry or assembler:
+        for segment in store.hot_segments():
+            if segment + store.segment_ms + grace_ms <= now_ms:
+                events = store.query(segment, segment + store.segment_ms - 1)
+                if telemetry:
+                    telemetry.append(filter(None, (point_from_mds(event) for event in events)))
+                if assembler:
+                    trips_appended += trip_store.append(assembler.process_batch(events))
+    if assembler:
+        # Closed segments are complete, so nothing is left to reorder
+        trips_appended += trip_store.append(assembler.flush())
+        assembler.expire(now_ms)
+        trip_store.save_state(assembler.snapshot())
+
+    compaction = store.compact(now_ms, grace_ms=grace_ms)
+    retention = store.apply_retention(now_ms, EVENT_RETENTION_DAYS * 86400 * 1000)
+
+    metrics = {
+        'compaction': compaction,
+        'retention': retention,
+        'bytes_reclaimed': compaction['bytes_reclaimed'] + retention['bytes_reclaimed']
+    }
+    if telemetry:
+        # Rollup first, so raw points are in the 1-minute tier before retention drops them
+        telemetry_rollup = telemetry.rollup(now_ms, grace_ms=grace_ms)
+        telemetry_retention = telemetry.apply_retention(now_ms)
+        metrics['telemetry'] = {
+            'rollup': telemetry_rollup,
+            'retention': telemetry_retention
+        }
+        metrics['bytes_reclaimed'] += telemetry_retention['bytes_reclaimed']
+    if trip_store:
+        trip_retention = trip_store.apply_retention(now_ms, EVENT_RETENTION_DAYS * 86400 * 1000)
+        metrics['trips'] = {
+            'appended': trips_appended,
+            'open': assembler.open_trip_count,
+            'assembler': assembler.stats,
+            'retention': trip_retention
+        }
+        metrics['bytes_reclaimed'] += trip_retention['bytes_reclaimed']
+
+    # Logged as one JSON line so CloudWatch Logs Insights can chart it
+    logger.info(json.dumps({'event_store_metrics': metrics}))
+    return metrics
@@ -8,6 +8,15 @@ import os
 import logging
 from datetime import datetime, timezone
 from typing import Dict, Any, List, Optional
+from decimal import Decimal
+
+from mds_shared.warmup import Warmer, is_warmup_event
+from mds_shared.formats import negotiate_format, encode_body, NotAcceptableError
+from mds_shared.spillover import spill_if_oversized
+from mds_shared.event_store import EventStore
+from mds_shared.jurisdictions import get_agency_id, get_membership_index, UnmappedAgencyError
+from mds_shared.db import use_database, execute_hot_query
+from mds_shared.profiling import is_profile_report_event, get_profiler, profile_request, profile_step
 
 # Configure logging
 logger = logging.getLogger()
@@ -16,6 +25,10 @@ logger.setLevel(logging.INFO)
 # Environment variables
 MDS_VERSION = os.environ.get('MDS_VERSION', '2.0.2')
 PROVIDER_ID = os.environ.get('PROVIDER_ID')
+EVENT_STORE_DIR = os.environ.get('EVENT_STORE_DIR')
+
+# Opened on first use; reads span the hot and compacted tiers
+_event_store = None
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
@@ -28,12 +41,23 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         API Gateway proxy response
     """
+    if is_warmup_event(event):
+        return warmer.warm()
+    if is_profile_report_event(event):
+        return get_profiler().report()
+    
     try:
         logger.info(f"Events request: {json.dumps(event, default=str)}")
         
         # Extract required query parameters
         query_params = event.get('queryStringParameters') or {}
         start_time = query_params.get('start_time')
+        end_time = query_params.get('end_time')
+        bbox = query_params.get('bbox')
+        device_id = query_params.get('device_id')
+        
+        # Scope results to the jurisdiction of the calling agency
+        agency_id = get_agency_id(event)
         
         # Validate required parameters
         if not start_time:
@@ -49,29 +73,84 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
         
-        # Build MDS compliant response with sample data
+        # Negotiate output format (JSON, NDJSON or Arrow)
+        output_format = negotiate_format(event)
+        
+        # Get events data
+        with profile_request('events', {'start_time': start_time, 'end_time': end_time, 'bbox': bbox,
+                                        'device_id': device_id, 'agency_id': agency_id}):
+            events_data = get_events(
+                start_time=start_time,
+                end_time=end_time,
+                bbox=bbox,
+                device_id=device_id,
+                agency_id=agency_id
+            )
+        
+        # Build MDS compliant response
         response_data = {
             'version': MDS_VERSION,
             'data': {
-                'events': []  # Placeholder - would contain actual events data
+                'events': events_data
             },
             'last_updated': int(datetime.now(timezone.utc).timestamp() * 1000),
             'ttl': 3600
         }
         
+        encoded = encode_body(response_data, 'events', output_format, default=decimal_default)
         response = {
             'statusCode': 200,
             'headers': {
-                'Content-Type': 'application/json',
+                **encoded['headers'],
                 'Access-Control-Allow-Origin': '*',
                 'Cache-Control': 'max-age=3600'
             },
-            'body': json.dumps(response_data)
+            'body': encoded['body'],
+            'isBase64Encoded': encoded['isBase64Encoded']
         }
         
-        logger.info("Events request completed successfully")
-        return response
+        logger.info(f"Returning {len(events_data)} events as {output_format}")
+        return spill_if_oversized(response, 'events')
         
+    except NotAcceptableError as e:
+        logger.warning(f"Unsupported Accept header: {str(e)}")
+        return {
+            'statusCode': 406,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Not Acceptable',
+                'message': str(e)
+            })
+        }
+    except UnmappedAgencyError as e:
+        logger.warning(f"Refused request: {str(e)}")
+        return {
+            'statusCode': 403,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Forbidden',
+                'message': str(e)
+            })
+        }
+    except ValueError as e:
+        logger.warning(f"Invalid request parameters: {str(e)}")
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Bad Request',
+                'message': str(e)
+            })
+        }
     except Exception as e:
         logger.error(f"Error processing events request: {str(e)}")
         return {
@@ -84,4 +163,92 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'error': 'Internal server error',
                 'message': 'Failed to retrieve events data'
             })
-        }
\ No newline at end of file
+        }
+
+def get_events(start_time: str, end_time: Optional[str] = None,
+               bbox: Optional[str] = None, device_id: Optional[str] = None,
+               agency_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Get events data from database
+    
+    Args:
+        start_time: Unix timestamp for start of time range
+        end_time: Unix timestamp for end of time range (optional)
+        bbox: Bounding box filter (min_lon,min_lat,max_lon,max_lat)
+        device_id: Specific device ID to filter by
+        agency_id: Only return events located inside this agency's jurisdiction
+        
+    Returns:
+        List of events in MDS format
+    """
+    # Parse timestamps
+    try:
+        start_timestamp = int(start_time)
+        if end_time:
+            end_timestamp = int(end_time)
+        else:
+            # Default to current time if end_time not provided
+            end_timestamp = int(datetime.now(timezone.utc).timestamp() * 1000)
+    except ValueError:
+        raise ValueError("Invalid timestamp format")
+    
+    # The event store filters on time, device and the agencies recorded with each
+    # event; without one, read the events table
+    store = get_event_store()
+    if store is not None:
+        with profile_step('events.store_query') as step:
+            filtered_events = store.query(start_timestamp, end_timestamp, device_id=device_id, agency_id=agency_id)
+            step.returned = len(filtered_events)
+    elif use_database():
+        rows = execute_hot_query('events_by_time', (PROVIDER_ID, start_timestamp, end_timestamp))
+        with profile_step('events.device_filter', len(rows)) as step:
+            filtered_events = [row for row in rows if device_id is None or row['device_id'] == device_id]
+            step.returned = len(filtered_events)
+        
+        # Events are scoped by where they happened; an agency without a jurisdiction sees none.
+        # Rows are indexed the first time this container loads them, then scoped by set lookup.
+        if agency_id:
+            membership = get_membership_index()
+            for e in filtered_events:
+                membership.add_event(e['event_id'], *e['event_location']['coordinates'][:2])
+            members = membership.event_ids(agency_id)
+            with profile_step('events.agency_filter', len(filtered_events)) as step:
+                filtered_events = [e for e in filtered_events if e['event_id'] in members]
+                step.returned = len(filtered_events)
+    else:
+        return []
+    
+    # Apply bbox filter if provided
+    if bbox:
+        try:
+            min_lon, min_lat, max_lon, max_lat = map(float, bbox.split(','))
+            with profile_step('events.bbox_filter', len(filtered_events)) as step:
+                bbox_filtered = []
+                for e in filtered_events:
+                    lon, lat = e['event_location']['coordinates'][:2]
+                    if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat:
+                        bbox_filtered.append(e)
+                filtered_events = bbox_filtered
+                step.returned = len(filtered_events)
+        except (ValueError, IndexError):
+            logger.warning(f"Invalid bbox format: {bbox}")
+    
+    return filtered_events
+
+def get_event_store() -> Optional[EventStore]:
+    """Return the event store, or None when EVENT_STORE_DIR is not configured"""
+    global _event_store
+    if _event_store is None and EVENT_STORE_DIR:
+        _event_store = EventStore(EVENT_STORE_DIR, membership=get_membership_index())
+    return _event_store
+
+def decimal_default(obj):
+    """JSON serializer for objects not serializable by default json code"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+# Warm-up steps run on scheduled pings, or during init when PREWARM_ON_INIT is set
+warmer = Warmer('events')
+warmer.register('query_path', lambda: get_events(start_time='0', end_time='0'))
+warmer.warm_on_init()
@@ -9,6 +9,8 @@ import logging
 from datetime import datetime, timezone
 from typing import Dict, Any
 
+from mds_shared.warmup import Warmer, is_warmup_event
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -28,6 +30,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         API Gateway proxy response
     """
+    if is_warmup_event(event):
+        return warmer.warm()
+    
     try:
         logger.info(f"Reports request: {json.dumps(event, default=str)}")
         
@@ -84,4 +89,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'error': 'Internal server error',
                 'message': 'Failed to retrieve reports data'
             })
-        }
\ No newline at end of file
+        }
+
+# Warm-up steps run on scheduled pings, or during init when PREWARM_ON_INIT is set
+warmer = Warmer('reports')
+warmer.warm_on_init()
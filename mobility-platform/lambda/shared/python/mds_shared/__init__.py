@@ -0,0 +1,4 @@
+"""
+Circuit Provider API Shared Layer
+Helpers shared by the MDS endpoint Lambda functions
+"""
@@ -0,0 +1,355 @@
+"""
+Circuit Provider API Database Access
+Prepared hot queries and read-replica routing with lag-aware fallback
+
+The vehicles, trips and events queries run on every poll, so each is
+prepared once per connection (PREPARE/EXECUTE) and connections are kept
+for the life of the container, one per thread. Reads go to the read
+replicas in turn; a replica whose replication lag exceeds the limit, or
+that fails, is skipped and the primary serves the query instead.
+"""
+
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Callable, Sequence
+
+from mds_shared.profiling import QUERY_PROFILING, get_profiler
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+DATA_SOURCE = os.environ.get('DATA_SOURCE', 'sample')
+DB_SECRET_ARN = os.environ.get('DB_SECRET_ARN')
+DB_REPLICA_HOSTS = os.environ.get('DB_REPLICA_HOSTS', '')
+DB_MAX_REPLICA_LAG_SECONDS = float(os.environ.get('DB_MAX_REPLICA_LAG_SECONDS', 5))
+DB_LAG_CHECK_SECONDS = float(os.environ.get('DB_LAG_CHECK_SECONDS', 10))
+DB_REPLICA_RETRY_SECONDS = float(os.environ.get('DB_REPLICA_RETRY_SECONDS', 30))
+
+# Hot queries, against the schema in DEPLOYMENT.md. Columns are aliased to MDS field names.
+# Required MDS fields the schema has no column for are derived as the sample data and the
+# trip assembler produce them: the provider is its own data provider, the fleet is electric,
+# a trip is published when it ends, and its accuracy is the configured default ($4).
+HOT_QUERIES = {
+    'vehicles_current': """
+        SELECT device_id, provider_id::text, provider_id::text AS data_provider_id, vehicle_id,
+               vehicle_type, ARRAY['electric']::text[] AS propulsion_types, vehicle_state,
+               current_location, battery_percent,
+               (EXTRACT(EPOCH FROM last_updated) * 1000)::bigint AS last_event_time
+        FROM vehicles
+        WHERE provider_id = $1
+    """,
+    'trips_by_time': """
+        SELECT trip_id::text, provider_id::text, provider_id::text AS data_provider_id, device_id,
+               trip_duration, trip_distance, $4::integer AS accuracy,
+               (EXTRACT(EPOCH FROM start_time) * 1000)::bigint AS start_time,
+               (EXTRACT(EPOCH FROM end_time) * 1000)::bigint AS end_time,
+               (EXTRACT(EPOCH FROM end_time) * 1000)::bigint AS publication_time,
+               start_location, end_location
+        FROM trips
+        WHERE provider_id = $1 AND start_time BETWEEN to_timestamp($2 / 1000.0) AND to_timestamp($3 / 1000.0)
+    """,
+    'trip_routes_by_time': """
+        SELECT trip_id::text, route
+        FROM trips
+        WHERE provider_id = $1 AND start_time BETWEEN to_timestamp($2 / 1000.0) AND to_timestamp($3 / 1000.0)
+          AND route IS NOT NULL
+    """,
+    'trip_costs_by_time': """
+        SELECT trip_id::text, standard_cost, actual_cost, currency
+        FROM trips
+        WHERE provider_id = $1 AND start_time BETWEEN to_timestamp($2 / 1000.0) AND to_timestamp($3 / 1000.0)
+    """,
+    'events_by_time': """
+        SELECT event_id::text, provider_id::text, device_id, event_types,
+               (EXTRACT(EPOCH FROM event_time) * 1000)::bigint AS timestamp,
+               event_location, battery_percent,
+               CASE WHEN associated_trip IS NULL THEN NULL ELSE ARRAY[associated_trip::text] END AS trip_ids
+        FROM events
+        WHERE provider_id = $1 AND event_time BETWEEN to_timestamp($2 / 1000.0) AND to_timestamp($3 / 1000.0)
+        ORDER BY event_time
+    """
+}
+
+# Seconds behind the primary; 0 when everything received has been replayed
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+def use_database() -> bool:
+    """Whether handlers read from PostgreSQL rather than sample data"""
+    return DATA_SOURCE == 'database'
+
+class PreparedConnection:
+    """DB-API connection that prepares each hot query on first use"""
+
+    def __init__(self, connection, queries: Dict[str, str] = HOT_QUERIES,
+                 explainer: Optional[Callable[[str, Sequence[Any], bool], Any]] = None):
+        self.connection = connection
+        self.queries = queries
+        self.prepared = set()
+        # Runs profiling EXPLAINs elsewhere than on this connection, which requests are using
+        self.explainer = explainer or self.explain
+
+    def execute(self, name: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        """
+        Execute a hot query by name
+
+        Args:
+            name: Key in HOT_QUERIES
+            params: Positional parameters ($1, $2, ...)
+
+        Returns:
+            Rows as dicts keyed by column name
+        """
+        if not QUERY_PROFILING:
+            return self._execute(name, params)
+        started = time.perf_counter()
+        rows = self._execute(name, params)
+        get_profiler().record(f"sql:{name}", (time.perf_counter() - started) * 1000, rows_returned=len(rows),
+                              explain=lambda analyze: self.explainer(name, params, analyze))
+        return rows
+
+    def _execute(self, name: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+        with self.connection.cursor() as cursor:
+            self._prepare(cursor, name)
+            cursor.execute(f"EXECUTE {name}{self._arguments(params)}", tuple(params))
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    def explain(self, name: str, params: Sequence[Any], analyze: bool = True) -> Any:
+        """
+        EXPLAIN a hot query with the given parameters
+
+        Args:
+            name: Key in HOT_QUERIES
+            params: Positional parameters
+            analyze: Run the query to get actual row counts and timings
+
+        Returns:
+            Parsed EXPLAIN (FORMAT JSON) output
+        """
+        options = 'ANALYZE, BUFFERS, FORMAT JSON' if analyze else 'FORMAT JSON'
+        with self.connection.cursor() as cursor:
+            self._prepare(cursor, name)
+            cursor.execute(f"EXPLAIN ({options}) EXECUTE {name}{self._arguments(params)}", tuple(params))
+            plan = cursor.fetchone()[0]
+            return json.loads(plan) if isinstance(plan, str) else plan
+
+    def _prepare(self, cursor, name: str):
+        if name not in self.prepared:
+            cursor.execute(f"PREPARE {name} AS {self.queries[name]}")
+            self.prepared.add(name)
+
+    @staticmethod
+    def _arguments(params: Sequence[Any]) -> str:
+        return f"({', '.join(['%s'] * len(params))})" if params else ''
+
+    def scalar(self, sql: str) -> Any:
+        """Run an ad hoc query returning a single value"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(sql)
+            return cursor.fetchone()[0]
+
+    def close(self):
+        try:
+            self.connection.close()
+        except Exception:
+            pass
+
+class DatabaseEndpoint:
+    """Primary or replica, with per-thread connections and health state"""
+
+    def __init__(self, name: str, params: Dict[str, Any], connect: Callable[[Dict[str, Any]], Any]):
+        self.name = name
+        self.params = params
+        self.connect = connect
+        self.local = threading.local()
+        self._explain: Optional[PreparedConnection] = None
+        self.lag_seconds: Optional[float] = None
+        self.lag_checked_at = 0.0
+        self.down_until = 0.0
+
+    def connection(self) -> PreparedConnection:
+        """Connection for the calling thread, opened on first use"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            connection = self.local.connection = PreparedConnection(
+                self.connect(self.params), explainer=self.explain)
+        return connection
+
+    def explain(self, name: str, params: Sequence[Any], analyze: bool) -> Any:
+        """EXPLAIN a hot query on a connection kept for the profiler's EXPLAIN thread"""
+        if self._explain is None:
+            self._explain = PreparedConnection(self.connect(self.params))
+        try:
+            return self._explain.explain(name, params, analyze)
+        except Exception:
+            self._explain.close()
+            self._explain = None
+            raise
+
+    def reset(self):
+        """Drop this thread's connection after an error"""
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+class ReadReplicaRouter:
+    """Routes reads to replicas within the lag limit, falling back to the primary"""
+
+    def __init__(self, primary: DatabaseEndpoint, replicas: List[DatabaseEndpoint],
+                 max_lag_seconds: float = DB_MAX_REPLICA_LAG_SECONDS,
+                 lag_check_seconds: float = DB_LAG_CHECK_SECONDS,
+                 retry_seconds: float = DB_REPLICA_RETRY_SECONDS):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag_seconds = max_lag_seconds
+        self.lag_check_seconds = lag_check_seconds
+        self.retry_seconds = retry_seconds
+        self._next = itertools.cycle(range(len(replicas))) if replicas else None
+        self._lock = threading.Lock()
+        self.stats = {'primary': 0, 'replica': 0, 'fallback': 0, 'replica_errors': 0}
+
+    def execute(self, name: str, params: Sequence[Any], read_only: bool = True) -> List[Dict[str, Any]]:
+        """
+        Execute a hot query on a replica if one is usable, else on the primary
+
+        Args:
+            name: Key in HOT_QUERIES
+            params: Positional parameters
+            read_only: False forces the primary
+
+        Returns:
+            Rows as dicts
+        """
+        if read_only:
+            for replica in self._replica_order():
+                if not self._usable(replica):
+                    continue
+                try:
+                    rows = replica.connection().execute(name, params)
+                    self.stats['replica'] += 1
+                    return rows
+                except Exception as e:
+                    self._mark_down(replica, e)
+            if self.replicas:
+                self.stats['fallback'] += 1
+
+        try:
+            rows = self.primary.connection().execute(name, params)
+        except Exception:
+            self.primary.reset()
+            raise
+        self.stats['primary'] += 1
+        return rows
+
+    def _replica_order(self) -> List[DatabaseEndpoint]:
+        if not self.replicas:
+            return []
+        with self._lock:
+            start = next(self._next)
+        return self.replicas[start:] + self.replicas[:start]
+
+    def _usable(self, replica: DatabaseEndpoint) -> bool:
+        now = time.monotonic()
+        if replica.down_until > now:
+            return False
+        if now - replica.lag_checked_at >= self.lag_check_seconds:
+            try:
+                replica.lag_seconds = float(replica.connection().scalar(REPLICA_LAG_SQL))
+            except Exception as e:
+                self._mark_down(replica, e)
+                return False
+            replica.lag_checked_at = now
+            if replica.lag_seconds > self.max_lag_seconds:
+                logger.warning(f"Replica {replica.name} is {replica.lag_seconds:.1f}s behind; reading from primary")
+        return replica.lag_seconds is not None and replica.lag_seconds <= self.max_lag_seconds
+
+    def _mark_down(self, replica: DatabaseEndpoint, error: Exception):
+        logger.error(f"Replica {replica.name} failed, retrying in {self.retry_seconds:.0f}s: {str(error)}")
+        self.stats['replica_errors'] += 1
+        replica.reset()
+        replica.down_until = time.monotonic() + self.retry_seconds
+        replica.lag_checked_at = 0.0
+
+def connect_postgres(params: Dict[str, Any]):
+    """Open a psycopg2 connection in autocommit mode (reads never hold a transaction)"""
+    import psycopg2
+
+    connection = psycopg2.connect(connect_timeout=3, **params)
+    connection.autocommit = True
+    return connection
+
+def parse_host(address: str, default_port: int = 5432) -> Dict[str, Any]:
+    """Split 'host' or 'host:port' (RDS endpoints include the port)"""
+    host, _, port = address.partition(':')
+    return {'host': host, 'port': int(port) if port else default_port}
+
+_db_credentials: Optional[Dict[str, Any]] = None
+
+def get_db_credentials() -> Dict[str, Any]:
+    """
+    Get database credentials from Secrets Manager, cached per container
+
+    Returns:
+        Secret with host, port, dbname, username and password
+    """
+    global _db_credentials
+    if _db_credentials is None:
+        import boto3
+
+        response = boto3.client('secretsmanager').get_secret_value(SecretId=DB_SECRET_ARN)
+        _db_credentials = json.loads(response['SecretString'])
+    return _db_credentials
+
+_router: Optional[ReadReplicaRouter] = None
+
+def get_router() -> ReadReplicaRouter:
+    """
+    Router for this container, built from the credentials secret and DB_REPLICA_HOSTS
+
+    Returns:
+        Read-replica router
+    """
+    global _router
+    if _router is None:
+        secret = get_db_credentials()
+        login = {'dbname': secret['dbname'], 'user': secret['username'], 'password': secret['password']}
+        primary = DatabaseEndpoint('primary', {**login, **parse_host(secret['host'], int(secret['port']))},
+                                   connect_postgres)
+        replicas = [
+            DatabaseEndpoint(f"replica-{i + 1}", {**login, **parse_host(address, int(secret['port']))},
+                             connect_postgres)
+            for i, address in enumerate(filter(None, (a.strip() for a in DB_REPLICA_HOSTS.split(','))))
+        ]
+        _router = ReadReplicaRouter(primary, replicas)
+        logger.info(f"Database router: primary and {len(replicas)} replica(s)")
+    return _router
+
+def set_router(router: Optional[ReadReplicaRouter]):
+    """Override the router (local runs and tests)"""
+    global _router
+    _router = router
+
+def execute_hot_query(name: str, params: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    Run a hot read query through the router
+
+    Args:
+        name: Key in HOT_QUERIES
+        params: Positional parameters
+
+    Returns:
+        Rows as dicts
+    """
+    return get_router().execute(name, params)
@@ -0,0 +1,447 @@
+"""
+Circuit Provider API Event Store
+Tiered storage for MDS events: hot append-only segments and compacted files
+
+Events are appended to hourly hot segments (plain NDJSON). Once a segment
+is closed, compaction rewrites it sorted by device and time as an immutable
+file of independently gzip-compressed blocks plus a JSON index recording
+each block's offset, time range and device ids. Queries read both tiers
+transparently and, for compacted segments, only decompress the blocks
+whose index entry can match. Retention deletes whole segments older than
+the configured window.
+
+With a membership index, each stored event records the agencies whose
+jurisdiction contains its location (an "_agencies" list, never returned
+to callers). It is computed on append, or on compaction for events
+appended without it. Compaction also records the agencies present in
+each block, so agency-scoped queries are a set lookup per event and
+skip blocks without the agency.
+
+Layout under the store root:
+    hot/<segment>.ndjson                  live appends
+    hot/<segment>.<generation>.compacting hot data being compacted
+    compacted/<segment>.<generation>.ndjson.gz
+    compacted/<segment>.idx.json          index, names the current data file
+
+Compaction renames the live hot file aside under a new generation number
+before reading it, so late appends start a fresh hot file. Readers
+ignore compacting files whose generation the index already covers, so a
+compaction that crashes at any point loses no events and duplicates none.
+Readers skip a final line that is still being appended; compaction
+instead leaves a segment whose renamed hot file ends mid-line for the
+next run, as an appender that opened it before the rename is still
+writing.
+
+Compaction deletes the files it supersedes right after the index switch.
+A reader racing it can therefore find a data file gone, or miss a hot
+file renamed aside after it listed the compacting files; it detects
+either case by the segment's index generation or compacting files having
+changed while it read, and reads the segment again.
+"""
+
+import gzip
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+from mds_shared.jurisdictions import MembershipIndex
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SEGMENT_MS = 3600 * 1000
+BLOCK_SIZE = 1000
+MAX_BLOCK_DEVICES = 256
+
+# Times a segment is re-read when a compaction changes it mid-read
+READ_ATTEMPTS = 3
+
+HOT_DIR = 'hot'
+COMPACTED_DIR = 'compacted'
+
+# Stored with each event: agencies whose jurisdiction contains event_location
+AGENCIES_KEY = '_agencies'
+
+_COMPACTING_RE = re.compile(r'^(\d+)\.(\d+)\.compacting$')
+
+class EventStore:
+    """Filesystem event store with hot and compacted tiers"""
+
+    def __init__(self, root_dir: str, segment_ms: int = SEGMENT_MS, block_size: int = BLOCK_SIZE,
+                 membership: Optional[MembershipIndex] = None):
+        self.root_dir = root_dir
+        self.segment_ms = segment_ms
+        self.block_size = block_size
+        self.membership = membership
+        self.hot_dir = os.path.join(root_dir, HOT_DIR)
+        self.compacted_dir = os.path.join(root_dir, COMPACTED_DIR)
+        os.makedirs(self.hot_dir, exist_ok=True)
+        os.makedirs(self.compacted_dir, exist_ok=True)
+
+    def segment_start(self, timestamp: int) -> int:
+        """Start of the segment containing a timestamp"""
+        return timestamp - timestamp % self.segment_ms
+
+    def _hot_path(self, segment: int) -> str:
+        return os.path.join(self.hot_dir, f"{segment}.ndjson")
+
+    def _compacting_path(self, segment: int, generation: int) -> str:
+        return os.path.join(self.hot_dir, f"{segment}.{generation}.compacting")
+
+    def _data_name(self, segment: int, generation: int) -> str:
+        return f"{segment}.{generation}.ndjson.gz"
+
+    def _index_path(self, segment: int) -> str:
+        return os.path.join(self.compacted_dir, f"{segment}.idx.json")
+
+    def append(self, events: Iterable[Dict[str, Any]]):
+        """
+        Append events to their hot segments
+
+        Each segment receives one write per call so concurrent appenders
+        do not interleave partial lines.
+
+        Args:
+            events: MDS events with 'timestamp' and 'device_id'
+        """
+        by_segment: Dict[int, List[str]] = {}
+        for event in events:
+            if self.membership is not None:
+                event = self._classify(dict(event))
+            segment = self.segment_start(int(event['timestamp']))
+            by_segment.setdefault(segment, []).append(json.dumps(event, separators=(',', ':')))
+
+        for segment, lines in by_segment.items():
+            with open(self._hot_path(segment), 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+
+    def _classify(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        coordinates = (event.get('event_location') or {}).get('coordinates')
+        event[AGENCIES_KEY] = sorted(self.membership.agencies_at(*coordinates[:2])) if coordinates else []
+        return event
+
+    def _in_agency(self, event: Dict[str, Any], agency_id: str) -> bool:
+        if AGENCIES_KEY not in event:
+            # Appended without a membership index; compaction records it
+            if self.membership is None:
+                return False
+            self._classify(event)
+        return agency_id in event[AGENCIES_KEY]
+
+    def _compacting_files(self) -> Dict[int, List[Tuple[int, str]]]:
+        files: Dict[int, List[Tuple[int, str]]] = {}
+        for name in os.listdir(self.hot_dir):
+            match = _COMPACTING_RE.match(name)
+            if match:
+                files.setdefault(int(match.group(1)), []).append(
+                    (int(match.group(2)), os.path.join(self.hot_dir, name)))
+        return files
+
+    def _load_index(self, segment: int) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._index_path(segment)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def hot_segments(self) -> List[int]:
+        """Segments with live or compacting hot files"""
+        segments = {int(name.split('.')[0]) for name in os.listdir(self.hot_dir)
+                    if name.endswith('.ndjson')}
+        return sorted(segments | set(self._compacting_files()))
+
+    def compacted_segments(self) -> List[int]:
+        """Segments with a compacted index"""
+        return sorted(int(name.split('.')[0]) for name in os.listdir(self.compacted_dir)
+                      if name.endswith('.idx.json'))
+
+    def query(self, start_ms: int, end_ms: int, device_id: Optional[str] = None,
+              agency_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Read events in [start_ms, end_ms] from both tiers
+
+        Args:
+            start_ms: Range start (inclusive)
+            end_ms: Range end (inclusive)
+            device_id: Only return events for this device
+            agency_id: Only return events inside this agency's jurisdiction
+
+        Returns:
+            Matching events ordered by timestamp
+        """
+        segments = sorted(set(self.compacted_segments()) | set(self.hot_segments()))
+
+        events = []
+        for segment in segments:
+            if segment + self.segment_ms <= start_ms or segment > end_ms:
+                continue
+            events.extend(self._query_segment(segment, start_ms, end_ms, device_id, agency_id))
+
+        for event in events:
+            event.pop(AGENCIES_KEY, None)
+        events.sort(key=lambda event: event['timestamp'])
+        return events
+
+    def _segment_state(self, segment: int) -> Tuple[Optional[Dict[str, Any]], List[Tuple[int, str]]]:
+        # Index before compacting files: a hot file renamed aside after the
+        # index was loaded then shows up in the listing
+        index = self._load_index(segment)
+        return index, sorted(self._compacting_files().get(segment, []))
+
+    def _query_segment(self, segment: int, start_ms: int, end_ms: int, device_id: Optional[str],
+                       agency_id: Optional[str]) -> List[Dict[str, Any]]:
+        for _ in range(READ_ATTEMPTS):
+            index, compacting = self._segment_state(segment)
+            covered = index['generation'] if index else 0
+            events = []
+            try:
+                if index:
+                    events.extend(self._read_compacted(index, start_ms, end_ms, device_id, agency_id))
+                for generation, path in compacting:
+                    if generation > covered:
+                        events.extend(self._read_hot(path, start_ms, end_ms, device_id))
+                events.extend(self._read_hot(self._hot_path(segment), start_ms, end_ms, device_id))
+            except FileNotFoundError:
+                # The data file was superseded by a compaction after the index was loaded
+                continue
+            after, after_compacting = self._segment_state(segment)
+            if (after['generation'] if after else 0) == covered and after_compacting == compacting:
+                if agency_id is not None:
+                    events = [event for event in events if self._in_agency(event, agency_id)]
+                return events
+        raise RuntimeError(f"Segment {segment} changed during {READ_ATTEMPTS} consecutive reads")
+
+    def _read_hot(self, path: str, start_ms: int, end_ms: int, device_id: Optional[str],
+                  complete: bool = False) -> Iterator[Dict[str, Any]]:
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                # A line without its newline is still being appended
+                if not line.endswith('\n'):
+                    if complete:
+                        raise RuntimeError(f"{path} ends in a partially written line")
+                    break
+                if not line.strip():
+                    continue
+                event = json.loads(line)
+                if start_ms <= event['timestamp'] <= end_ms and (device_id is None or event['device_id'] == device_id):
+                    yield event
+
+    def _read_compacted(self, index: Dict[str, Any], start_ms: int, end_ms: int, device_id: Optional[str],
+                        agency_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        with open(os.path.join(self.compacted_dir, index['data_file']), 'rb') as f:
+            for block in index['blocks']:
+                if block['max_ts'] < start_ms or block['min_ts'] > end_ms:
+                    continue
+                if device_id is not None and block['devices'] is not None and device_id not in block['devices']:
+                    continue
+                if agency_id is not None and block.get('agencies') is not None and agency_id not in block['agencies']:
+                    continue
+                f.seek(block['offset'])
+                for line in gzip.decompress(f.read(block['length'])).splitlines():
+                    event = json.loads(line)
+                    if start_ms <= event['timestamp'] <= end_ms and (device_id is None or event['device_id'] == device_id):
+                        yield event
+
+    def compact_segment(self, segment: int) -> Dict[str, Any]:
+        """
+        Rewrite a closed hot segment as an immutable compressed, indexed file
+
+        Events already compacted for the segment (from an earlier run) are
+        merged in, so late arrivals are folded into a new generation.
+
+        Args:
+            segment: Segment start
+
+        Returns:
+            Event count and bytes before and after
+        """
+        index = self._load_index(segment)
+        covered = index['generation'] if index else 0
+
+        pending = []
+        for generation, path in self._compacting_files().get(segment, []):
+            if generation > covered:
+                pending.append((generation, path))
+            else:
+                # Left over from a run that crashed after writing its index
+                os.remove(path)
+        generation = max([covered] + [g for g, _ in pending]) + 1
+        if os.path.exists(self._hot_path(segment)):
+            aside = self._compacting_path(segment, generation)
+            os.replace(self._hot_path(segment), aside)
+            pending.append((generation, aside))
+        if not pending:
+            return {'segment': segment, 'events': 0, 'bytes_before': 0, 'bytes_after': 0}
+        generation = max(g for g, _ in pending)
+
+        full_range = (segment, segment + self.segment_ms - 1)
+        bytes_before = sum(os.path.getsize(path) for _, path in pending)
+        events = []
+        for _, path in pending:
+            # An appender that opened the hot file before it was renamed aside
+            # may still be writing; the segment is retried on the next run
+            events.extend(self._read_hot(path, *full_range, None, complete=True))
+        if index:
+            bytes_before += (os.path.getsize(os.path.join(self.compacted_dir, index['data_file'])) +
+                             os.path.getsize(self._index_path(segment)))
+            events.extend(self._read_compacted(index, *full_range, None))
+        if self.membership is not None:
+            for event in events:
+                if AGENCIES_KEY not in event:
+                    self._classify(event)
+        # Device-major order keeps each block to a handful of devices, so the
+        # per-block device list prunes most blocks for device-scoped queries
+        events.sort(key=lambda event: (event['device_id'], event['timestamp']))
+
+        data_name = self._data_name(segment, generation)
+        data_path = os.path.join(self.compacted_dir, data_name)
+        blocks = []
+        with open(f"{data_path}.tmp", 'wb') as f:
+            for i in range(0, len(events), self.block_size):
+                chunk = events[i:i + self.block_size]
+                payload = gzip.compress(
+                    '\n'.join(json.dumps(event, separators=(',', ':')) for event in chunk).encode('utf-8'),
+                    mtime=0)
+                devices = sorted({event['device_id'] for event in chunk})
+                classified = all(AGENCIES_KEY in event for event in chunk)
+                blocks.append({
+                    'offset': f.tell(),
+                    'length': len(payload),
+                    'count': len(chunk),
+                    'min_ts': min(event['timestamp'] for event in chunk),
+                    'max_ts': max(event['timestamp'] for event in chunk),
+                    'devices': devices if len(devices) <= MAX_BLOCK_DEVICES else None,
+                    'agencies': sorted({a for event in chunk for a in event[AGENCIES_KEY]}) if classified else None
+                })
+                f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(f"{data_path}.tmp", 0o444)
+        os.replace(f"{data_path}.tmp", data_path)
+
+        new_index = {
+            'segment_start': segment,
+            'segment_end': segment + self.segment_ms,
+            'generation': generation,
+            'data_file': data_name,
+            'count': len(events),
+            'blocks': blocks
+        }
+        index_path = self._index_path(segment)
+        with open(f"{index_path}.tmp", 'w') as f:
+            json.dump(new_index, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        # The index switch is the commit point for this generation
+        os.replace(f"{index_path}.tmp", index_path)
+
+        for _, path in pending:
+            os.remove(path)
+        if index and index['data_file'] != data_name:
+            os.remove(os.path.join(self.compacted_dir, index['data_file']))
+
+        return {
+            'segment': segment,
+            'events': len(events),
+            'bytes_before': bytes_before,
+            'bytes_after': os.path.getsize(data_path) + os.path.getsize(index_path)
+        }
+
+    def compact(self, now_ms: int, grace_ms: int = 5 * 60 * 1000) -> Dict[str, Any]:
+        """
+        Compact every hot segment that closed more than grace_ms ago
+
+        Query latency over the compacted range is measured before and
+        after, using a single-device probe as agencies typically issue.
+
+        Args:
+            now_ms: Current time in Unix milliseconds
+            grace_ms: Time to wait after a segment closes for late events
+
+        Returns:
+            Compaction metrics
+        """
+        closed = [segment for segment in self.hot_segments() if segment + self.segment_ms + grace_ms <= now_ms]
+        metrics = {
+            'segments_compacted': 0,
+            'events_compacted': 0,
+            'bytes_before': 0,
+            'bytes_after': 0,
+            'bytes_reclaimed': 0,
+            'query_ms_before': None,
+            'query_ms_after': None
+        }
+        if not closed:
+            return metrics
+
+        probe_start, probe_end = closed[0], closed[-1] + self.segment_ms - 1
+        probe_device = self._sample_device(closed[0])
+        metrics['query_ms_before'] = self._time_query(probe_start, probe_end, probe_device)
+
+        for segment in closed:
+            try:
+                result = self.compact_segment(segment)
+            except Exception as e:
+                logger.error(f"Failed to compact segment {segment}: {str(e)}")
+                continue
+            metrics['segments_compacted'] += 1
+            metrics['events_compacted'] += result['events']
+            metrics['bytes_before'] += result['bytes_before']
+            metrics['bytes_after'] += result['bytes_after']
+
+        metrics['bytes_reclaimed'] = metrics['bytes_before'] - metrics['bytes_after']
+        metrics['query_ms_after'] = self._time_query(probe_start, probe_end, probe_device)
+        return metrics
+
+    def apply_retention(self, now_ms: int, retention_ms: int) -> Dict[str, Any]:
+        """
+        Delete segments that ended before now_ms - retention_ms
+
+        Args:
+            now_ms: Current time in Unix milliseconds
+            retention_ms: How long to keep events
+
+        Returns:
+            Retention metrics
+        """
+        cutoff = now_ms - retention_ms
+        metrics = {'segments_deleted': 0, 'bytes_reclaimed': 0}
+        compacting = self._compacting_files()
+        for segment in sorted(set(self.hot_segments()) | set(self.compacted_segments())):
+            if segment + self.segment_ms > cutoff:
+                continue
+            index = self._load_index(segment)
+            # Index first, so readers never open a data file without one
+            paths = [self._index_path(segment)]
+            if index:
+                paths.append(os.path.join(self.compacted_dir, index['data_file']))
+            paths.append(self._hot_path(segment))
+            paths.extend(path for _, path in compacting.get(segment, []))
+            for path in paths:
+                if os.path.exists(path):
+                    metrics['bytes_reclaimed'] += os.path.getsize(path)
+                    os.remove(path)
+            metrics['segments_deleted'] += 1
+        return metrics
+
+    def _sample_device(self, segment: int) -> Optional[str]:
+        # The first event of a single hot file; reading every closed segment
+        # here would cost as much as the query being timed
+        paths = [self._hot_path(segment)] + [path for _, path in sorted(self._compacting_files().get(segment, []))]
+        for path in paths:
+            for event in self._read_hot(path, segment, segment + self.segment_ms - 1, None):
+                return event['device_id']
+        return None
+
+    def _time_query(self, start_ms: int, end_ms: int, device_id: Optional[str]) -> float:
+        started = time.perf_counter()
+        self.query(start_ms, end_ms, device_id)
+        return round((time.perf_counter() - started) * 1000, 3)
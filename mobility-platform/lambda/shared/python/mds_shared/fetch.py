@@ -0,0 +1,150 @@
+"""
+Circuit Provider API Concurrent Fetch
+Runs a handler's independent data-access calls concurrently
+
+Database drivers used by the handlers are blocking, so each query is
+offloaded to a shared thread pool and awaited with asyncio, with its own
+timeout. Handlers stay synchronous: fetch_all() runs the event loop and
+returns once every query has finished, failed or timed out.
+
+A timeout does not stop the query: a worker thread cannot be interrupted,
+so it keeps running (and holds its database connection) until the driver
+returns, and the result is discarded. A timed-out query that had not yet
+started is cancelled instead. The workers still busy with abandoned
+queries are tracked; while every worker of the pool is held by one, a
+query would only queue behind them until its own timeout, so it fails at
+once with PoolExhaustedError (a QueryTimeoutError) and the pool recovers
+as the abandoned queries return.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Callable, Set
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+FETCH_MAX_WORKERS = int(os.environ.get('FETCH_MAX_WORKERS', 8))
+QUERY_TIMEOUT_MS = int(os.environ.get('QUERY_TIMEOUT_MS', 5000))
+
+class QueryTimeoutError(Exception):
+    """A required query did not finish within its timeout"""
+
+class PoolExhaustedError(QueryTimeoutError):
+    """Every fetch worker is still running a query that timed out earlier"""
+
+class Query:
+    """One independent data-access call"""
+
+    def __init__(self, name: str, fn: Callable[[], Any], timeout_ms: Optional[int] = None,
+                 required: bool = True, default: Any = None):
+        """
+        Args:
+            name: Key of the result in fetch_all()'s return value
+            fn: Blocking call that runs the query
+            timeout_ms: Per-query timeout (QUERY_TIMEOUT_MS if None)
+            required: Raise if the query fails or times out; otherwise use default
+            default: Result used when an optional query fails or times out
+        """
+        self.name = name
+        self.fn = fn
+        self.timeout_ms = QUERY_TIMEOUT_MS if timeout_ms is None else timeout_ms
+        self.required = required
+        self.default = default
+
+# Shared across invocations so warm containers reuse their threads
+_executor: Optional[ThreadPoolExecutor] = None
+
+# Queries that timed out while running; each holds a worker until it returns
+_abandoned: Set[Future] = set()
+_abandoned_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """Thread pool used for query offload, created on first use"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=FETCH_MAX_WORKERS, thread_name_prefix='mds-fetch')
+    return _executor
+
+def abandoned_workers() -> int:
+    """Number of workers still running a query that timed out"""
+    with _abandoned_lock:
+        return len(_abandoned)
+
+def _abandon(future: Future):
+    with _abandoned_lock:
+        _abandoned.add(future)
+    # Runs at once if the query finished in the meantime
+    future.add_done_callback(_release)
+
+def _release(future: Future):
+    with _abandoned_lock:
+        _abandoned.discard(future)
+
+async def _run(query: Query, timings: Dict[str, float]) -> Any:
+    started = time.perf_counter()
+    try:
+        abandoned = abandoned_workers()
+        if abandoned >= FETCH_MAX_WORKERS:
+            raise PoolExhaustedError(f"Query '{query.name}' not run: all {abandoned} fetch workers "
+                                     f"are still running timed-out queries")
+        # Run in a copy of the caller's context so request-scoped state (profiling) follows the query
+        context = contextvars.copy_context()
+        future = get_executor().submit(context.run, query.fn)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), query.timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            # A query still queued is cancelled; a running one is abandoned
+            if not future.cancel():
+                _abandon(future)
+            raise
+    except asyncio.TimeoutError:
+        if query.required:
+            raise QueryTimeoutError(f"Query '{query.name}' timed out after {query.timeout_ms} ms")
+        logger.warning(f"Optional query '{query.name}' timed out after {query.timeout_ms} ms")
+        return query.default
+    except Exception as e:
+        if query.required:
+            raise
+        logger.warning(f"Optional query '{query.name}' failed: {str(e)}")
+        return query.default
+    finally:
+        timings[query.name] = round((time.perf_counter() - started) * 1000, 3)
+
+async def fetch_all_async(queries: List[Query]) -> Dict[str, Any]:
+    """
+    Run queries concurrently from within an event loop
+
+    Args:
+        queries: Independent queries
+
+    Returns:
+        Results keyed by query name
+    """
+    timings: Dict[str, float] = {}
+    results = await asyncio.gather(*(_run(query, timings) for query in queries))
+    logger.info(f"Fetched {', '.join(f'{name}={ms}ms' for name, ms in timings.items())}")
+    return {query.name: result for query, result in zip(queries, results)}
+
+def fetch_all(queries: List[Query]) -> Dict[str, Any]:
+    """
+    Run queries concurrently from synchronous code
+
+    Args:
+        queries: Independent queries
+
+    Returns:
+        Results keyed by query name
+
+    Raises:
+        QueryTimeoutError: A required query timed out, or could not start because
+            every worker is held by a timed-out query (PoolExhaustedError)
+    """
+    return asyncio.run(fetch_all_async(queries))
@@ -0,0 +1,197 @@
+"""
+Circuit Provider API Response Formats
+Content negotiation for bulk MDS responses (JSON, NDJSON, Apache Arrow)
+"""
+
+import base64
+import io
+import json
+import logging
+from typing import Dict, Any, List, Optional, Callable
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+FORMAT_JSON = 'json'
+FORMAT_NDJSON = 'ndjson'
+FORMAT_ARROW = 'arrow'
+
+# Media types accepted in the Accept header for each output format
+MEDIA_TYPES = {
+    'application/json': FORMAT_JSON,
+    'application/vnd.mds+json': FORMAT_JSON,
+    'application/x-ndjson': FORMAT_NDJSON,
+    'application/ndjson': FORMAT_NDJSON,
+    'application/vnd.apache.arrow.stream': FORMAT_ARROW
+}
+
+CONTENT_TYPES = {
+    FORMAT_JSON: 'application/json',
+    FORMAT_NDJSON: 'application/x-ndjson',
+    FORMAT_ARROW: 'application/vnd.apache.arrow.stream'
+}
+
+class NotAcceptableError(Exception):
+    """Raised when no supported representation matches the Accept header"""
+
+def get_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    """
+    Look up a request header case-insensitively
+
+    Args:
+        event: API Gateway proxy event
+        name: Header name
+
+    Returns:
+        Header value if present, None otherwise
+    """
+    headers = event.get('headers') or {}
+    name = name.lower()
+    for key, value in headers.items():
+        if key.lower() == name:
+            return value
+    return None
+
+def negotiate_format(event: Dict[str, Any]) -> str:
+    """
+    Pick the output format from the request Accept header
+
+    Media ranges are ranked by their q value; JSON is returned when the
+    header is missing or only contains wildcards.
+
+    Args:
+        event: API Gateway proxy event
+
+    Returns:
+        One of FORMAT_JSON, FORMAT_NDJSON or FORMAT_ARROW
+
+    Raises:
+        NotAcceptableError: If the client accepts none of the supported types
+    """
+    accept = get_header(event, 'Accept')
+    if not accept:
+        return FORMAT_JSON
+
+    ranked = []
+    for position, media_range in enumerate(accept.split(',')):
+        parts = [part.strip() for part in media_range.split(';')]
+        media_type = parts[0].lower()
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranked.append((-quality, position, media_type))
+
+    for _, _, media_type in sorted(ranked):
+        if media_type in MEDIA_TYPES:
+            return MEDIA_TYPES[media_type]
+        if media_type in ('*/*', 'application/*'):
+            return FORMAT_JSON
+
+    raise NotAcceptableError(f"Supported media types: {', '.join(sorted(CONTENT_TYPES.values()))}")
+
+def encode_body(response_data: Dict[str, Any], records_key: str, output_format: str,
+                default: Optional[Callable[[Any], Any]] = None) -> Dict[str, Any]:
+    """
+    Serialize an MDS response payload in the negotiated format
+
+    JSON keeps the full MDS envelope. NDJSON and Arrow carry only the
+    records; the envelope fields are returned as headers so the body can
+    be consumed one record (or one record batch) at a time.
+
+    Args:
+        response_data: MDS response with ``data[records_key]`` records
+        records_key: Name of the record list, e.g. 'trips' or 'events'
+        output_format: Format returned by negotiate_format
+        default: JSON serializer for non-native types
+
+    Returns:
+        Partial API Gateway proxy response with 'headers', 'body' and
+        'isBase64Encoded'
+    """
+    headers = {
+        'Content-Type': CONTENT_TYPES[output_format],
+        'Vary': 'Accept'
+    }
+
+    if output_format == FORMAT_JSON:
+        return {
+            'headers': headers,
+            'body': json.dumps(response_data, default=default),
+            'isBase64Encoded': False
+        }
+
+    records = response_data['data'][records_key]
+    headers['X-MDS-Version'] = str(response_data['version'])
+    headers['X-MDS-Last-Updated'] = str(response_data['last_updated'])
+
+    if output_format == FORMAT_NDJSON:
+        body = ''.join(json.dumps(record, default=default) + '\n' for record in records)
+        return {
+            'headers': headers,
+            'body': body,
+            'isBase64Encoded': False
+        }
+
+    return {
+        'headers': headers,
+        'body': base64.b64encode(encode_arrow(records, default)).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def encode_arrow(records: List[Dict[str, Any]], default: Optional[Callable[[Any], Any]] = None) -> bytes:
+    """
+    Encode records as an Apache Arrow IPC stream
+
+    Nested MDS objects (GeoJSON locations, attributes) become struct
+    columns. pyarrow is only needed for this format, so it is imported
+    lazily and must be installed into the shared layer to enable it.
+
+    Args:
+        records: MDS records
+        default: Serializer applied to non-native values (e.g. Decimal)
+
+    Returns:
+        Arrow IPC stream bytes
+
+    Raises:
+        NotAcceptableError: If pyarrow is not available
+    """
+    try:
+        import pyarrow as pa
+    except ImportError:
+        logger.warning("Arrow output requested but pyarrow is not installed")
+        raise NotAcceptableError('Apache Arrow output is not enabled for this deployment')
+
+    if default is not None:
+        records = json.loads(json.dumps(records, default=default))
+
+    table = records_table(pa, records)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue()
+
+def records_table(pa, records: List[Dict[str, Any]]):
+    """
+    Build an Arrow table whose columns cover every field of every record
+
+    pa.Table.from_pylist takes its columns from the first record only, so
+    optional MDS fields (e.g. trip_ids, parking_verification_url) absent
+    from it would be dropped for all rows. Each column's type is inferred
+    from all of its values, so nested objects also keep every key.
+
+    Args:
+        pa: The pyarrow module
+        records: JSON-native MDS records
+
+    Returns:
+        Arrow table with columns in first-seen order; missing values are null
+    """
+    names = list(dict.fromkeys(name for record in records for name in record))
+    return pa.Table.from_pydict({name: pa.array([record.get(name) for record in records]) for name in names})
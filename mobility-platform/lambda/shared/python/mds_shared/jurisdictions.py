@@ -0,0 +1,274 @@
+"""
+Circuit Provider API Jurisdictions
+Per-agency jurisdiction polygons and precomputed vehicle/trip/event membership
+
+Each agency sees only vehicles, trips, events and telemetry inside its
+jurisdiction. Rather than running point-in-polygon tests per request,
+membership is computed once, when the data is ingested, and handlers
+scope their results with set lookups:
+
+- The event, telemetry and trip stores record the agencies of each
+  event, point and trip when it is appended; compaction and rollup fill
+  them in for data appended without a membership index. A jurisdiction
+  change applies to data ingested after it.
+- Vehicle positions are indexed here on each fleet reload.
+- Trips and events read from PostgreSQL are written outside this
+  service, so each is indexed here by id the first time a container
+  loads it.
+
+Scoping fails closed: an authenticated caller whose authorizer context
+names no agency is refused, and an agency without a jurisdiction sees
+no data.
+"""
+
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set, FrozenSet, Iterable, Tuple
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+JURISDICTIONS_FILE = os.environ.get('JURISDICTIONS_FILE')
+
+# Jurisdictions for the agencies known to the authorizer in lambda/auth/auth.py.
+# Geometries are GeoJSON Polygon or MultiPolygon; JURISDICTIONS_FILE replaces them.
+DEFAULT_JURISDICTIONS = [
+    {
+        'agency_id': 'city-of-example',
+        'name': 'City of Example',
+        'geometry': {
+            'type': 'Polygon',
+            'coordinates': [[
+                [-122.5150, 37.7080], [-122.3570, 37.7080], [-122.3570, 37.8120],
+                [-122.5150, 37.8120], [-122.5150, 37.7080]
+            ]]
+        }
+    },
+    {
+        'agency_id': 'city-of-demo',
+        'name': 'City of Demo (Downtown)',
+        'geometry': {
+            'type': 'Polygon',
+            'coordinates': [[
+                [-122.4150, 37.7760], [-122.3880, 37.7760], [-122.3880, 37.8000],
+                [-122.4150, 37.8000], [-122.4150, 37.7760]
+            ]]
+        }
+    }
+]
+
+# Trips and events loaded from the database remembered per container; the oldest are forgotten first
+MAX_TRIPS = 1000000
+MAX_EVENTS = 1000000
+
+class UnmappedAgencyError(Exception):
+    """Raised when an authenticated caller is not mapped to an agency"""
+
+def get_agency_id(event: Dict[str, Any]) -> Optional[str]:
+    """
+    Agency the request was authorized for
+
+    Args:
+        event: API Gateway proxy event
+
+    Returns:
+        agency_id from the authorizer context, or None for calls that did not
+        pass through an authorizer (direct invocations and local tools)
+
+    Raises:
+        UnmappedAgencyError: The authorizer context has no agency_id
+    """
+    authorizer = (event.get('requestContext') or {}).get('authorizer')
+    if not authorizer:
+        return None
+    agency_id = authorizer.get('agency_id')
+    if not agency_id:
+        raise UnmappedAgencyError('Caller is not mapped to an agency')
+    return agency_id
+
+def _ring_contains(ring: List[List[float]], lon: float, lat: float) -> bool:
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i][0], ring[i][1]
+        xj, yj = ring[j][0], ring[j][1]
+        if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+class Jurisdiction:
+    """One agency's jurisdiction polygon(s) with a bounding box for quick rejection"""
+
+    def __init__(self, agency_id: str, geometry: Dict[str, Any], name: Optional[str] = None):
+        self.agency_id = agency_id
+        self.name = name or agency_id
+        if geometry['type'] == 'Polygon':
+            self.polygons = [geometry['coordinates']]
+        elif geometry['type'] == 'MultiPolygon':
+            self.polygons = geometry['coordinates']
+        else:
+            raise ValueError(f"Unsupported jurisdiction geometry for {agency_id}: {geometry['type']}")
+
+        points = [point for polygon in self.polygons for point in polygon[0]]
+        self.bbox = (
+            min(point[0] for point in points), min(point[1] for point in points),
+            max(point[0] for point in points), max(point[1] for point in points)
+        )
+
+    def contains(self, lon: float, lat: float) -> bool:
+        """Whether a point lies inside the jurisdiction (holes excluded)"""
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        if not (min_lon <= lon <= max_lon and min_lat <= lat <= max_lat):
+            return False
+        for polygon in self.polygons:
+            if _ring_contains(polygon[0], lon, lat) and not any(_ring_contains(hole, lon, lat) for hole in polygon[1:]):
+                return True
+        return False
+
+def load_jurisdictions(path: Optional[str] = JURISDICTIONS_FILE) -> List[Jurisdiction]:
+    """
+    Load jurisdiction definitions
+
+    Args:
+        path: JSON file with a list of {agency_id, name, geometry}; defaults are used if unset
+
+    Returns:
+        Jurisdictions
+    """
+    definitions = DEFAULT_JURISDICTIONS
+    if path:
+        with open(path) as f:
+            definitions = json.load(f)
+    return [Jurisdiction(d['agency_id'], d['geometry'], d.get('name')) for d in definitions]
+
+class _RecordMembership:
+    """Record ids per agency, forgetting the oldest records past max_records"""
+
+    def __init__(self, agency_ids: Iterable[str], max_records: int):
+        self.max_records = max_records
+        self.ids: Dict[str, Set[str]] = {agency_id: set() for agency_id in agency_ids}
+        self._agencies: 'OrderedDict[str, FrozenSet[str]]' = OrderedDict()
+
+    def __contains__(self, record_id: str) -> bool:
+        return record_id in self._agencies
+
+    def add(self, record_id: str, agencies: FrozenSet[str]):
+        for agency_id in agencies:
+            self.ids[agency_id].add(record_id)
+        self._agencies[record_id] = agencies
+
+        while len(self._agencies) > self.max_records:
+            old_id, old_agencies = self._agencies.popitem(last=False)
+            for agency_id in old_agencies:
+                self.ids[agency_id].discard(old_id)
+
+class MembershipIndex:
+    """Vehicle, trip and event membership per agency, maintained incrementally on ingest"""
+
+    def __init__(self, jurisdictions: List[Jurisdiction], max_trips: int = MAX_TRIPS,
+                 max_events: int = MAX_EVENTS):
+        self.jurisdictions = {jurisdiction.agency_id: jurisdiction for jurisdiction in jurisdictions}
+        self.vehicles: Dict[str, Set[str]] = {agency_id: set() for agency_id in self.jurisdictions}
+        self.trips = _RecordMembership(self.jurisdictions, max_trips)
+        self.events = _RecordMembership(self.jurisdictions, max_events)
+        self._vehicle_agencies: Dict[str, FrozenSet[str]] = {}
+
+    def agencies_at(self, lon: float, lat: float) -> FrozenSet[str]:
+        """Agencies whose jurisdiction contains a point"""
+        return frozenset(agency_id for agency_id, jurisdiction in self.jurisdictions.items()
+                         if jurisdiction.contains(lon, lat))
+
+    def agencies_along(self, points: Iterable[Tuple[float, float]]) -> FrozenSet[str]:
+        """Agencies whose jurisdiction contains any of the points"""
+        agencies = set()
+        for lon, lat in points:
+            agencies.update(self.agencies_at(lon, lat))
+            if len(agencies) == len(self.jurisdictions):
+                break
+        return frozenset(agencies)
+
+    def update_vehicle(self, device_id: str, lon: Optional[float], lat: Optional[float]):
+        """
+        Record a vehicle's latest position
+
+        Only the agencies whose membership changed are touched.
+
+        Args:
+            device_id: Vehicle device id
+            lon: Current longitude (None if unknown)
+            lat: Current latitude (None if unknown)
+        """
+        agencies = frozenset() if lon is None or lat is None else self.agencies_at(lon, lat)
+        previous = self._vehicle_agencies.get(device_id, frozenset())
+        if agencies == previous:
+            return
+        for agency_id in previous - agencies:
+            self.vehicles[agency_id].discard(device_id)
+        for agency_id in agencies - previous:
+            self.vehicles[agency_id].add(device_id)
+        self._vehicle_agencies[device_id] = agencies
+
+    def remove_vehicle(self, device_id: str):
+        """Forget a vehicle that left the fleet"""
+        for agency_id in self._vehicle_agencies.pop(device_id, frozenset()):
+            self.vehicles[agency_id].discard(device_id)
+
+    def add_trip(self, trip_id: str, points: Iterable[Tuple[float, float]]):
+        """
+        Record a trip loaded from the database
+
+        A trip belongs to every agency whose jurisdiction contains its start,
+        end or any route point. Trips already indexed are left unchanged.
+
+        Args:
+            trip_id: Trip id
+            points: (lon, lat) pairs covering the trip
+        """
+        if trip_id not in self.trips:
+            self.trips.add(trip_id, self.agencies_along(points))
+
+    def add_event(self, event_id: str, lon: float, lat: float):
+        """
+        Record an event loaded from the database
+
+        Events already indexed are left unchanged.
+
+        Args:
+            event_id: Event id
+            lon: Event longitude
+            lat: Event latitude
+        """
+        if event_id not in self.events:
+            self.events.add(event_id, self.agencies_at(lon, lat))
+
+    def vehicle_ids(self, agency_id: str) -> Set[str]:
+        """Devices currently inside an agency's jurisdiction (empty for unknown agencies)"""
+        return self.vehicles.get(agency_id, set())
+
+    def trip_ids(self, agency_id: str) -> Set[str]:
+        """Database trips touching an agency's jurisdiction (empty for unknown agencies)"""
+        return self.trips.ids.get(agency_id, set())
+
+    def event_ids(self, agency_id: str) -> Set[str]:
+        """Database events inside an agency's jurisdiction (empty for unknown agencies)"""
+        return self.events.ids.get(agency_id, set())
+
+_membership = None
+
+def get_membership_index() -> MembershipIndex:
+    """Membership index for this container, created on first use"""
+    global _membership
+    if _membership is None:
+        _membership = MembershipIndex(load_jurisdictions())
+        logger.info(f"Loaded jurisdictions for {len(_membership.jurisdictions)} agencies")
+    return _membership
+
+def set_membership_index(index: Optional[MembershipIndex]):
+    """Override the membership index (local runs and tests)"""
+    global _membership
+    _membership = index
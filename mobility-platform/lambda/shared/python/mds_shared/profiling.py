@@ -0,0 +1,401 @@
+"""
+Circuit Provider API Query Profiling
+Opt-in profiling of data access per endpoint, with slow-query capture
+
+With QUERY_PROFILING enabled, every data-access call and in-memory filter
+run while serving a request is timed, and its rows scanned and returned
+are recorded under the request's endpoint and parameter shape (which
+parameters were given and the width of the time range, never their
+values). SQL slower than SLOW_QUERY_MS is explained so the plan, including
+any sequential scans, is kept with the timing. EXPLAIN runs on a
+background thread over its own database connection, at most once per
+EXPLAIN_INTERVAL_SECONDS for each endpoint, shape and statement, so it
+does not count against a query timeout or hold up the connection the
+request's queries use. Lambda freezes the container between
+invocations, so a queued EXPLAIN may finish during a later request; it
+then shares the database and CPU with it, but no connection.
+
+Each operation is logged as one "Query profile:" line for CloudWatch Logs
+Insights, and aggregated per container; invoking a function with
+{"profile_report": true} returns the container's aggregate.
+"""
+
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable, Tuple
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+QUERY_PROFILING = os.environ.get('QUERY_PROFILING', 'false').lower() == 'true'
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 250))
+SLOW_QUERY_EXPLAIN = os.environ.get('SLOW_QUERY_EXPLAIN', 'plan')  # plan, analyze or off
+SLOW_QUERY_SAMPLES = int(os.environ.get('SLOW_QUERY_SAMPLES', 20))
+EXPLAIN_INTERVAL_SECONDS = float(os.environ.get('EXPLAIN_INTERVAL_SECONDS', 300))
+
+# Slow statements waiting for EXPLAIN; further ones are not explained while it is full
+EXPLAIN_QUEUE_SIZE = 16
+
+# Time range widths distinguished in parameter shapes
+SPAN_BUCKETS = [(3600000, '<=1h'), (86400000, '<=1d'), (604800000, '<=7d'), (2592000000, '<=30d')]
+
+# Endpoint and parameter shape of the request being served. Context variables
+# follow the request into fetch_all() worker threads.
+_request: contextvars.ContextVar = contextvars.ContextVar('profiled_request', default=None)
+
+def is_profile_report_event(event: Any) -> bool:
+    """Check whether an invocation asks for this container's profile report"""
+    return isinstance(event, dict) and event.get('profile_report') is True
+
+def param_shape(params: Dict[str, Any]) -> str:
+    """
+    Describe which parameters a request used, without their values
+
+    Args:
+        params: Request parameters
+
+    Returns:
+        Sorted parameter names, with the time range width when start_time is given,
+        e.g. 'bbox,start_time span<=1d'
+    """
+    shape = ','.join(sorted(name for name, value in params.items() if value not in (None, ''))) or '-'
+    if params.get('start_time'):
+        try:
+            end = int(params['end_time']) if params.get('end_time') else int(time.time() * 1000)
+            span = end - int(params['start_time'])
+        except ValueError:
+            return shape
+        # Slack so "the last 24 hours" with a defaulted end_time still reads as <=1d
+        shape += ' span' + next((label for limit, label in SPAN_BUCKETS if span <= limit * 1.1), '>30d')
+    return shape
+
+def summarize_plan(plan: Any) -> Dict[str, Any]:
+    """
+    Reduce an EXPLAIN (FORMAT JSON) result to what matters for indexing
+
+    Args:
+        plan: Parsed EXPLAIN output (a one-element list holding {'Plan': ...})
+
+    Returns:
+        Root node type, estimated cost, rows scanned (actual with ANALYZE, the
+        planner's estimate otherwise), relations read by sequential scan, and the
+        plan itself
+    """
+    root = plan[0]['Plan'] if isinstance(plan, list) else plan['Plan']
+    analyzed = 'Actual Rows' in root
+    scanned = 0
+    seq_scans = []
+    nodes = [root]
+    while nodes:
+        node = nodes.pop()
+        nodes.extend(node.get('Plans', []))
+        node_type = node.get('Node Type', '')
+        # Bitmap index scans only produce row pointers; the heap scan above them reads the rows
+        if not node_type.endswith('Scan') or node_type == 'Bitmap Index Scan':
+            continue
+        if node_type == 'Seq Scan':
+            seq_scans.append(node.get('Relation Name'))
+        if analyzed:
+            rows = (node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0) +
+                    node.get('Rows Removed by Index Recheck', 0))
+            scanned += rows * node.get('Actual Loops', 1)
+        else:
+            # Estimated rows produced by the scan; rows its filter removes are not estimated
+            scanned += node.get('Plan Rows', 0)
+    return {
+        'node_type': root.get('Node Type'),
+        'total_cost': root.get('Total Cost'),
+        'rows_scanned': scanned,
+        'rows_estimated': not analyzed,
+        'seq_scans': sorted(set(filter(None, seq_scans))),
+        'plan': plan
+    }
+
+class OperationStats:
+    """Aggregate timings and row counts for one (endpoint, shape, operation)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.rows_returned = 0
+        self.rows_scanned = 0
+        self.scanned_calls = 0
+        self.seq_scans = set()
+
+    def add(self, duration_ms: float, slow: bool, rows_returned: Optional[int], rows_scanned: Optional[int]):
+        self.calls += 1
+        self.total_ms += duration_ms
+        self.max_ms = max(self.max_ms, duration_ms)
+        self.slow += int(slow)
+        if rows_returned is not None:
+            self.rows_returned += rows_returned
+        if rows_scanned is not None:
+            self.rows_scanned += rows_scanned
+            self.scanned_calls += 1
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'total_ms': round(self.total_ms, 3),
+            'mean_ms': round(self.total_ms / self.calls, 3),
+            'max_ms': round(self.max_ms, 3),
+            'slow': self.slow,
+            'rows_returned': self.rows_returned,
+            # Only calls whose scanned count is known (filters, EXPLAINed SQL)
+            'rows_scanned': self.rows_scanned if self.scanned_calls else None,
+            'seq_scans': sorted(self.seq_scans)
+        }
+
+class QueryProfiler:
+    """Per-container profile of data access, keyed by endpoint, parameter shape and operation"""
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, explain_mode: str = SLOW_QUERY_EXPLAIN,
+                 max_samples: int = SLOW_QUERY_SAMPLES, explain_interval_seconds: float = EXPLAIN_INTERVAL_SECONDS):
+        self.slow_query_ms = slow_query_ms
+        self.explain_mode = explain_mode
+        self.explain_interval_seconds = explain_interval_seconds
+        self.requests: Dict[Tuple[str, str], OperationStats] = {}
+        self.operations: Dict[Tuple[str, str, str], OperationStats] = {}
+        self.slow_queries = deque(maxlen=max_samples)
+        self._lock = threading.Lock()
+        self._explained_at: Dict[Tuple[str, str, str], float] = {}
+        self._explain_queue: queue.Queue = queue.Queue(maxsize=EXPLAIN_QUEUE_SIZE)
+        self._explain_thread: Optional[threading.Thread] = None
+
+    def record_request(self, endpoint: str, shape: str, duration_ms: float):
+        """Record one served request (including cache hits that did no data access)"""
+        with self._lock:
+            stats = self.requests.get((endpoint, shape))
+            if stats is None:
+                stats = self.requests[(endpoint, shape)] = OperationStats()
+            stats.add(duration_ms, False, None, None)
+
+    def record(self, operation: str, duration_ms: float, rows_returned: Optional[int] = None,
+               rows_scanned: Optional[int] = None, explain: Optional[Callable[[bool], Any]] = None):
+        """
+        Record one data-access call
+
+        Args:
+            operation: Operation name, e.g. 'sql:trips_by_time' or 'vehicles.bbox_filter'
+            duration_ms: Wall time of the call
+            rows_returned: Rows produced
+            rows_scanned: Rows examined, if known
+            explain: For SQL, runs EXPLAIN (argument: whether to ANALYZE) and returns the
+                parsed JSON plan; called on the background thread when the call was slow
+        """
+        endpoint, shape = _request.get() or ('-', '-')
+        key = (endpoint, shape, operation)
+        slow = duration_ms >= self.slow_query_ms
+
+        entry = {
+            'endpoint': endpoint,
+            'shape': shape,
+            'operation': operation,
+            'duration_ms': round(duration_ms, 3),
+            'rows_scanned': rows_scanned,
+            'rows_returned': rows_returned
+        }
+        logger.info(f"Query profile: {json.dumps(entry)}")
+
+        capture = None
+        with self._lock:
+            stats = self.operations.get(key)
+            if stats is None:
+                stats = self.operations[key] = OperationStats()
+            stats.add(duration_ms, slow, rows_returned, rows_scanned)
+            if slow:
+                capture = {**entry, 'captured_at': int(time.time() * 1000), 'explain': None}
+                self.slow_queries.append(capture)
+        if not slow:
+            return
+        logger.warning(f"Slow query: {json.dumps(entry)}")
+        if explain is not None and self.explain_mode in ('analyze', 'plan') and self._explain_due(key):
+            self._start_explain_thread()
+            try:
+                self._explain_queue.put_nowait((capture, stats, explain))
+            except queue.Full:
+                logger.warning(f"EXPLAIN queue full, not explaining {operation}")
+
+    def _explain_due(self, key: Tuple[str, str, str]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            last = self._explained_at.get(key)
+            if last is not None and now - last < self.explain_interval_seconds:
+                return False
+            self._explained_at[key] = now
+            return True
+
+    def _start_explain_thread(self):
+        with self._lock:
+            if self._explain_thread is None:
+                self._explain_thread = threading.Thread(target=self._explain_worker, name='explain', daemon=True)
+                self._explain_thread.start()
+
+    def _explain_worker(self):
+        while True:
+            capture, stats, explain = self._explain_queue.get()
+            try:
+                plan = summarize_plan(explain(self.explain_mode == 'analyze'))
+            except Exception as e:
+                logger.warning(f"EXPLAIN failed for {capture['operation']}: {str(e)}")
+                continue
+            finally:
+                self._explain_queue.task_done()
+            with self._lock:
+                capture['explain'] = plan
+                stats.seq_scans.update(plan['seq_scans'])
+                if capture['rows_scanned'] is None and plan['rows_scanned'] is not None:
+                    capture['rows_scanned'] = plan['rows_scanned']
+                    stats.rows_scanned += plan['rows_scanned']
+                    stats.scanned_calls += 1
+            logger.warning(f"Slow query plan: {json.dumps(capture, default=str)}")
+
+    def flush(self, timeout_seconds: float = 10.0) -> bool:
+        """
+        Wait for pending EXPLAINs (local runs, before reading the report)
+
+        Returns:
+            True if none are left
+        """
+        deadline = time.monotonic() + timeout_seconds
+        while self._explain_queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return not self._explain_queue.unfinished_tasks
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Aggregated profile for this container
+
+        Returns:
+            Requests and per-operation stats grouped by endpoint and parameter shape,
+            slowest total time first, plus the most recent slow queries
+        """
+        with self._lock:
+            shapes: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            for (endpoint, shape), stats in self.requests.items():
+                shapes[(endpoint, shape)] = {
+                    'endpoint': endpoint, 'shape': shape, 'requests': stats.calls,
+                    'request_mean_ms': round(stats.total_ms / stats.calls, 3), 'operations': {}
+                }
+            for (endpoint, shape, operation), stats in self.operations.items():
+                group = shapes.setdefault((endpoint, shape), {
+                    'endpoint': endpoint, 'shape': shape, 'requests': 0, 'request_mean_ms': None, 'operations': {}
+                })
+                group['operations'][operation] = stats.to_dict()
+            slow_queries = list(self.slow_queries)
+
+        groups = sorted(
+            shapes.values(),
+            key=lambda group: -sum(stats['total_ms'] for stats in group['operations'].values())
+        )
+        return {
+            'enabled': QUERY_PROFILING,
+            'slow_query_ms': self.slow_query_ms,
+            'shapes': groups,
+            'slow_queries': slow_queries
+        }
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.operations.clear()
+            self.slow_queries.clear()
+            self._explained_at.clear()
+
+_profiler: Optional[QueryProfiler] = None
+
+def get_profiler() -> QueryProfiler:
+    """Profiler for this container, created on first use"""
+    global _profiler
+    if _profiler is None:
+        _profiler = QueryProfiler()
+    return _profiler
+
+def set_profiler(profiler: Optional[QueryProfiler]):
+    """Override the profiler (local runs and tests)"""
+    global _profiler
+    _profiler = profiler
+
+@contextmanager
+def profile_request(endpoint: str, params: Dict[str, Any]):
+    """
+    Attribute the data access inside the block to an endpoint and parameter shape
+
+    Args:
+        endpoint: Endpoint name
+        params: Request parameters (only their names and time range width are kept)
+    """
+    if not QUERY_PROFILING:
+        yield
+        return
+    shape = param_shape(params)
+    token = _request.set((endpoint, shape))
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _request.reset(token)
+        get_profiler().record_request(endpoint, shape, (time.perf_counter() - started) * 1000)
+
+class ProfileStep:
+    """Rows produced by a profiled step; set returned before the block ends"""
+
+    def __init__(self):
+        self.returned: Optional[int] = None
+
+@contextmanager
+def profile_step(operation: str, rows_scanned: Optional[int] = None):
+    """
+    Time an in-memory filter or other step
+
+    Usage:
+        with profile_step('vehicles.bbox_filter', len(vehicles)) as step:
+            vehicles = [...]
+            step.returned = len(vehicles)
+
+    Args:
+        operation: Operation name
+        rows_scanned: Rows the step examines
+    """
+    step = ProfileStep()
+    if not QUERY_PROFILING:
+        yield step
+        return
+    started = time.perf_counter()
+    try:
+        yield step
+    finally:
+        get_profiler().record(operation, (time.perf_counter() - started) * 1000,
+                              rows_returned=step.returned, rows_scanned=rows_scanned)
+
+def profiled(operation: str) -> Callable:
+    """
+    Decorator that profiles a data-access function; rows returned is len() of its result
+
+    Args:
+        operation: Operation name
+    """
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not QUERY_PROFILING:
+                return fn(*args, **kwargs)
+            started = time.perf_counter()
+            result = fn(*args, **kwargs)
+            get_profiler().record(operation, (time.perf_counter() - started) * 1000,
+                                  rows_returned=len(result) if hasattr(result, '__len__') else None)
+            return result
+        return wrapper
+    return decorate
@@ -0,0 +1,330 @@
+"""
+Circuit Provider API Query Cache
+Cross-container query result cache with single-flight request coalescing
+
+Results are keyed by endpoint and normalized query parameters and stored
+in a backend shared by every container: Redis (QUERY_CACHE_URL) in AWS or
+a directory (QUERY_CACHE_DIR) for local runs. When a key is missing, only
+the container holding the key's lock runs the query; the others serve the
+previous (stale) result if one is still retained, or wait for the new one.
+When the backend is unavailable, queries run uncached (BYPASS).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Dict, Any, Optional, Callable, Tuple
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+QUERY_CACHE_URL = os.environ.get('QUERY_CACHE_URL')
+QUERY_CACHE_DIR = os.environ.get('QUERY_CACHE_DIR')
+QUERY_CACHE_NAMESPACE = os.environ.get('QUERY_CACHE_NAMESPACE', 'mds')
+QUERY_CACHE_STALE_SECONDS = int(os.environ.get('QUERY_CACHE_STALE_SECONDS', 300))
+QUERY_CACHE_LOCK_SECONDS = int(os.environ.get('QUERY_CACHE_LOCK_SECONDS', 30))
+QUERY_CACHE_WAIT_MS = int(os.environ.get('QUERY_CACHE_WAIT_MS', 2000))
+QUERY_CACHE_RETRY_SECONDS = int(os.environ.get('QUERY_CACHE_RETRY_SECONDS', 60))
+
+# Cache status values, also returned to clients in the X-Cache header
+CACHE_HIT = 'HIT'
+CACHE_MISS = 'MISS'
+CACHE_COALESCED = 'COALESCED'
+CACHE_STALE = 'STALE'
+CACHE_BYPASS = 'BYPASS'
+
+POLL_INTERVAL_MS = 50
+
+# Parameters whose values are numbers or numeric lists; all others are identifiers kept verbatim
+NUMERIC_PARAMS = {'bbox', 'start_time', 'end_time', 'last_updated', 'resolution', 'interval'}
+
+class RedisCacheBackend:
+    """Redis (or any Redis-compatible server) backend"""
+
+    # Delete the lock only if this container still holds it
+    RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, url: str):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=1.0, socket_connect_timeout=1.0)
+
+    def ping(self):
+        self.client.ping()
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(key)
+
+    def set(self, key: str, value: bytes, ttl_ms: int):
+        self.client.set(key, value, px=ttl_ms)
+
+    def acquire(self, key: str, token: str, ttl_ms: int) -> bool:
+        return bool(self.client.set(key, token, nx=True, px=ttl_ms))
+
+    def release(self, key: str, token: str):
+        self.client.eval(self.RELEASE_SCRIPT, 1, key, token)
+
+class FileCacheBackend:
+    """Directory backend for local runs (shared between processes on one host)"""
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        os.makedirs(root_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root_dir, hashlib.sha256(key.encode('utf-8')).hexdigest())
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                expires_at = int(f.readline())
+                value = f.read()
+        except (FileNotFoundError, ValueError):
+            return None
+        if expires_at < time.time() * 1000:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            return None
+        return value
+
+    def set(self, key: str, value: bytes, ttl_ms: int):
+        path = self._path(key)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(f"{int(time.time() * 1000) + ttl_ms}\n".encode('ascii'))
+            f.write(value)
+        os.replace(tmp_path, path)
+
+    def acquire(self, key: str, token: str, ttl_ms: int) -> bool:
+        path = f"{self._path(key)}.lock"
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                expired = os.path.getmtime(path) * 1000 + ttl_ms < time.time() * 1000
+            except FileNotFoundError:
+                expired = True
+            if not expired:
+                return False
+            # Holder died; only one contender wins the rename of a stale lock
+            try:
+                os.replace(path, f"{path}.{token}.stale")
+                os.remove(f"{path}.{token}.stale")
+            except FileNotFoundError:
+                pass
+            return self.acquire(key, token, ttl_ms)
+        with os.fdopen(fd, 'w') as f:
+            f.write(token)
+        return True
+
+    def release(self, key: str, token: str):
+        path = f"{self._path(key)}.lock"
+        try:
+            with open(path) as f:
+                holder = f.read()
+            if holder == token:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def normalize_params(params: Dict[str, Any]) -> Dict[str, str]:
+    """
+    Canonical form of query parameters for cache keys
+
+    Empty values are dropped and the values of NUMERIC_PARAMS are
+    reformatted, so "-122.40,37.7" and "-122.4,37.70" share a key. Other
+    values such as device ids are kept as given: "0012" and "12" differ.
+
+    Args:
+        params: Query parameters
+
+    Returns:
+        Normalized parameters
+    """
+    normalized = {}
+    for name, value in params.items():
+        if value is None:
+            continue
+        value = str(value).strip()
+        if not value:
+            continue
+        if name in NUMERIC_PARAMS:
+            try:
+                value = ','.join(repr(round(float(part), 6)) for part in value.split(','))
+            except ValueError:
+                pass
+        normalized[name] = value
+    return normalized
+
+class QueryCache:
+    """Shared result cache with single-flight computation of missing keys"""
+
+    def __init__(self, backend, namespace: str = QUERY_CACHE_NAMESPACE,
+                 stale_seconds: int = QUERY_CACHE_STALE_SECONDS,
+                 lock_seconds: int = QUERY_CACHE_LOCK_SECONDS,
+                 wait_ms: int = QUERY_CACHE_WAIT_MS):
+        self.backend = backend
+        self.namespace = namespace
+        self.stale_ms = stale_seconds * 1000
+        self.lock_ms = lock_seconds * 1000
+        self.wait_ms = wait_ms
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'stale': 0, 'bypassed': 0, 'errors': 0}
+
+    def make_key(self, endpoint: str, params: Dict[str, Any]) -> str:
+        """Cache key for an endpoint and its query parameters"""
+        canonical = json.dumps(normalize_params(params), sort_keys=True, separators=(',', ':'))
+        return f"{self.namespace}:{endpoint}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+    def get_or_compute(self, endpoint: str, params: Dict[str, Any], compute: Callable[[], Any],
+                       ttl_seconds: int, default: Optional[Callable] = None) -> Tuple[Any, str]:
+        """
+        Return the cached result for a query, computing it at most once across containers
+
+        Backend failures never fail the request: the query runs uncached
+        and the status is BYPASS.
+
+        Args:
+            endpoint: Endpoint name
+            params: Query parameters that determine the result
+            compute: Runs the query
+            ttl_seconds: How long a result is fresh
+            default: JSON serializer for values json cannot encode
+
+        Returns:
+            (result, cache status)
+        """
+        key = self.make_key(endpoint, params)
+        lock_key, token = f"{key}:lock", uuid.uuid4().hex
+        status = CACHE_MISS
+        try:
+            entry = self._load(key)
+            if entry and entry['fresh_until'] > _now_ms():
+                return self._count(CACHE_HIT, entry['value'])
+            acquired = self.backend.acquire(lock_key, token, self.lock_ms)
+            if not acquired:
+                # Another container is computing this key
+                if entry:
+                    return self._count(CACHE_STALE, entry['value'])
+                entry = self._wait(key)
+                if entry:
+                    return self._count(CACHE_COALESCED, entry['value'])
+                logger.warning(f"Timed out waiting for {endpoint} query in another container")
+        except Exception as e:
+            self._backend_error(endpoint, e)
+            acquired = False
+            status = CACHE_BYPASS
+
+        try:
+            value = compute()
+            if acquired:
+                try:
+                    self._store(key, value, ttl_seconds, default)
+                except Exception as e:
+                    self._backend_error(endpoint, e)
+        finally:
+            if acquired:
+                try:
+                    self.backend.release(lock_key, token)
+                except Exception as e:
+                    self._backend_error(endpoint, e)
+        return self._count(status, value)
+
+    def _wait(self, key: str) -> Optional[Dict[str, Any]]:
+        deadline = time.monotonic() + self.wait_ms / 1000
+        while time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL_MS / 1000)
+            entry = self._load(key)
+            if entry:
+                return entry
+        return None
+
+    def _backend_error(self, endpoint: str, error: Exception):
+        logger.error(f"Query cache error for {endpoint}: {str(error)}")
+        self.stats['errors'] += 1
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.backend.get(key)
+        return json.loads(raw) if raw else None
+
+    def _store(self, key: str, value: Any, ttl_seconds: int, default: Optional[Callable]):
+        now = _now_ms()
+        entry = {'stored_at': now, 'fresh_until': now + ttl_seconds * 1000, 'value': value}
+        raw = json.dumps(entry, default=default, separators=(',', ':')).encode('utf-8')
+        # Kept past freshness so waiting containers can serve it while one refreshes
+        self.backend.set(key, raw, ttl_seconds * 1000 + self.stale_ms)
+
+    def _count(self, status: str, value: Any) -> Tuple[Any, str]:
+        self.stats[{CACHE_HIT: 'hits', CACHE_MISS: 'misses', CACHE_COALESCED: 'coalesced',
+                    CACHE_STALE: 'stale', CACHE_BYPASS: 'bypassed'}[status]] += 1
+        return value, status
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+_cache = None
+
+# When set, Redis could not be reached and is not retried before this time (epoch seconds)
+_unavailable_until = 0.0
+
+def get_query_cache() -> Optional[QueryCache]:
+    """
+    Get the query cache configured for this function
+
+    QUERY_CACHE_URL selects Redis, QUERY_CACHE_DIR the filesystem backend.
+    If the Redis client is not installed or the server does not answer, the
+    error is logged and caching is skipped for QUERY_CACHE_RETRY_SECONDS.
+
+    Returns:
+        Query cache, or None if caching is not configured or unavailable
+    """
+    global _cache, _unavailable_until
+    if _cache is None:
+        if QUERY_CACHE_URL:
+            if time.time() < _unavailable_until:
+                return None
+            try:
+                backend = RedisCacheBackend(QUERY_CACHE_URL)
+                backend.ping()
+            except Exception as e:
+                logger.error(f"Query cache unavailable, running queries uncached: {str(e)}")
+                _unavailable_until = time.time() + QUERY_CACHE_RETRY_SECONDS
+                return None
+            _cache = QueryCache(backend)
+        elif QUERY_CACHE_DIR:
+            _cache = QueryCache(FileCacheBackend(QUERY_CACHE_DIR))
+    return _cache
+
+def set_query_cache(cache: Optional[QueryCache]):
+    """Override the query cache (local runs and tests)"""
+    global _cache
+    _cache = cache
+
+def cached_query(endpoint: str, params: Dict[str, Any], compute: Callable[[], Any],
+                 ttl_seconds: int, default: Optional[Callable] = None) -> Tuple[Any, str]:
+    """
+    Run a query through the shared cache, or directly if none is configured
+
+    Args:
+        endpoint: Endpoint name
+        params: Query parameters that determine the result
+        compute: Runs the query
+        ttl_seconds: How long a result is fresh
+        default: JSON serializer for values json cannot encode
+
+    Returns:
+        (result, cache status)
+    """
+    cache = get_query_cache()
+    if cache is None:
+        return compute(), CACHE_BYPASS
+    result, status = cache.get_or_compute(endpoint, params, compute, ttl_seconds, default)
+    logger.info(json.dumps({'query_cache': {'endpoint': endpoint, 'status': status, **cache.stats}}))
+    return result, status
@@ -0,0 +1,274 @@
+"""
+Circuit Provider API Compact Records
+Memory-efficient vehicle and trip records converted to MDS dicts on output
+
+Enumerated MDS strings (vehicle_type, vehicle_state, propulsion_types,
+event_types, currency) are stored as small integer codes or bitmasks into
+shared lookup tables, coordinates as plain floats or a flat array
+(longitude and latitude only; a GeoJSON altitude is dropped), and each
+record uses __slots__ instead of a per-instance dict.
+"""
+
+import sys
+from array import array
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+class EnumTable:
+    """
+    Interned table of enumerated MDS values
+
+    Values are assigned codes in the order first seen, seeded with the
+    MDS 2.0 values, so unknown values from newer feeds still round-trip.
+    """
+
+    def __init__(self, values: Iterable[str]):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+        for value in values:
+            self.code(value)
+
+    def code(self, value: str) -> int:
+        """Get the code for a value, assigning one if it is new"""
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            value = sys.intern(value)
+            self.values.append(value)
+            self.codes[value] = code
+        return code
+
+    def value(self, code: int) -> str:
+        """Get the value for a code"""
+        return self.values[code]
+
+    def mask(self, values: Optional[Iterable[str]]) -> int:
+        """Encode a list of values as a bitmask"""
+        mask = 0
+        for value in values or ():
+            mask |= 1 << self.code(value)
+        return mask
+
+    def unmask(self, mask: int) -> List[str]:
+        """Decode a bitmask into values in table order"""
+        return [value for code, value in enumerate(self.values) if mask >> code & 1]
+
+VEHICLE_TYPES = EnumTable([
+    'bicycle', 'bus', 'cargo_bicycle', 'car', 'delivery_robot', 'moped',
+    'motorcycle', 'scooter_standing', 'scooter_seated', 'truck', 'scooter', 'other'
+])
+
+VEHICLE_STATES = EnumTable([
+    'available', 'elsewhere', 'non_operational', 'on_trip', 'removed',
+    'reserved', 'unknown', 'stopped', 'non_contactable', 'missing'
+])
+
+PROPULSION_TYPES = EnumTable([
+    'human', 'electric_assist', 'electric', 'combustion', 'combustion_diesel',
+    'hybrid', 'hydrogen_fuel_cell', 'plug_in_hybrid'
+])
+
+EVENT_TYPES = EnumTable([
+    'agency_drop_off', 'agency_pick_up', 'battery_charged', 'battery_low',
+    'changed_geographies', 'charging_start', 'charging_end', 'comms_lost',
+    'comms_restored', 'compliance_pick_up', 'decommissioned', 'located',
+    'maintenance', 'maintenance_pick_up', 'maintenance_end', 'driver_cancellation',
+    'order_drop_off', 'order_pick_up', 'customer_cancellation', 'provider_cancellation',
+    'recommission', 'reservation_start', 'reservation_stop', 'reserved',
+    'service_end', 'service_start', 'trip_end', 'trip_enter_jurisdiction',
+    'trip_leave_jurisdiction', 'trip_resume', 'trip_start', 'trip_pause',
+    'unspecified'
+])
+
+CURRENCIES = EnumTable(['USD', 'CAD', 'EUR', 'GBP'])
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else value
+
+def _point(coordinates: Optional[List[float]]) -> Optional[Dict[str, Any]]:
+    if coordinates is None:
+        return None
+    return {'type': 'Point', 'coordinates': coordinates}
+
+class VehicleRecord:
+    """Compact MDS vehicle status record"""
+
+    __slots__ = (
+        'device_id', 'provider_id', 'data_provider_id', 'vehicle_id',
+        'vehicle_type_code', 'propulsion_mask', 'vehicle_attributes',
+        'vehicle_state_code', 'last_event_mask', 'last_event_time',
+        'last_event_lon', 'last_event_lat', 'lon', 'lat',
+        'battery_percent', 'rental_uris'
+    )
+
+    @classmethod
+    def from_mds(cls, vehicle: Dict[str, Any]) -> 'VehicleRecord':
+        """
+        Build a record from an MDS vehicle dict
+
+        Args:
+            vehicle: MDS 2.0 vehicle status
+
+        Returns:
+            Compact record
+        """
+        record = cls()
+        record.device_id = vehicle['device_id']
+        record.provider_id = _intern(vehicle.get('provider_id'))
+        record.data_provider_id = _intern(vehicle.get('data_provider_id'))
+        record.vehicle_id = vehicle.get('vehicle_id')
+        record.vehicle_type_code = VEHICLE_TYPES.code(vehicle['vehicle_type'])
+        record.propulsion_mask = PROPULSION_TYPES.mask(vehicle.get('propulsion_types'))
+        record.vehicle_attributes = vehicle.get('vehicle_attributes') or None
+        record.vehicle_state_code = VEHICLE_STATES.code(vehicle['vehicle_state'])
+        record.last_event_mask = EVENT_TYPES.mask(vehicle.get('last_event_types'))
+        record.last_event_time = vehicle.get('last_event_time')
+
+        last_event_location = vehicle.get('last_event_location')
+        if last_event_location:
+            record.last_event_lon, record.last_event_lat = last_event_location['coordinates'][:2]
+        else:
+            record.last_event_lon = record.last_event_lat = None
+
+        current_location = vehicle.get('current_location')
+        if current_location:
+            record.lon, record.lat = current_location['coordinates'][:2]
+        else:
+            record.lon = record.lat = None
+
+        record.battery_percent = vehicle.get('battery_percent')
+        record.rental_uris = vehicle.get('rental_uris')
+        return record
+
+    @property
+    def vehicle_type(self) -> str:
+        return VEHICLE_TYPES.value(self.vehicle_type_code)
+
+    @property
+    def vehicle_state(self) -> str:
+        return VEHICLE_STATES.value(self.vehicle_state_code)
+
+    def to_mds(self) -> Dict[str, Any]:
+        """
+        Serialize to an MDS vehicle dict
+
+        Returns:
+            MDS 2.0 vehicle status (optional fields omitted when unset)
+        """
+        vehicle = {
+            'device_id': self.device_id,
+            'provider_id': self.provider_id,
+            'data_provider_id': self.data_provider_id,
+            'vehicle_id': self.vehicle_id,
+            'vehicle_type': self.vehicle_type,
+            'propulsion_types': PROPULSION_TYPES.unmask(self.propulsion_mask)
+        }
+        if self.vehicle_attributes is not None:
+            vehicle['vehicle_attributes'] = self.vehicle_attributes
+        vehicle['vehicle_state'] = self.vehicle_state
+        vehicle['last_event_types'] = EVENT_TYPES.unmask(self.last_event_mask)
+        vehicle['last_event_time'] = self.last_event_time
+        if self.last_event_lon is not None:
+            vehicle['last_event_location'] = _point([self.last_event_lon, self.last_event_lat])
+        if self.lon is not None:
+            vehicle['current_location'] = _point([self.lon, self.lat])
+        if self.battery_percent is not None:
+            vehicle['battery_percent'] = self.battery_percent
+        if self.rental_uris is not None:
+            vehicle['rental_uris'] = self.rental_uris
+        return vehicle
+
+class TripRecord:
+    """Compact MDS trip record with the route stored as a flat float array"""
+
+    __slots__ = (
+        'provider_id', 'data_provider_id', 'device_id', 'trip_id',
+        'trip_duration', 'trip_distance', 'route', 'accuracy',
+        'start_time', 'end_time', 'publication_time',
+        'start_lon', 'start_lat', 'end_lon', 'end_lat',
+        'parking_verification_url', 'standard_cost', 'actual_cost',
+        'currency_code', 'trip_attributes'
+    )
+
+    @classmethod
+    def from_mds(cls, trip: Dict[str, Any]) -> 'TripRecord':
+        """
+        Build a record from an MDS trip dict
+
+        Args:
+            trip: MDS 2.0 trip
+
+        Returns:
+            Compact record
+        """
+        record = cls()
+        record.provider_id = _intern(trip.get('provider_id'))
+        record.data_provider_id = _intern(trip.get('data_provider_id'))
+        record.device_id = trip['device_id']
+        record.trip_id = trip['trip_id']
+        record.trip_duration = trip.get('trip_duration')
+        record.trip_distance = trip.get('trip_distance')
+
+        route = array('d')
+        for position in (trip.get('route') or {}).get('coordinates', ()):
+            route.extend(position[:2])
+        record.route = route
+
+        record.accuracy = trip.get('accuracy')
+        record.start_time = trip['start_time']
+        record.end_time = trip.get('end_time')
+        record.publication_time = trip.get('publication_time')
+        record.start_lon, record.start_lat = trip['start_location']['coordinates'][:2]
+        record.end_lon, record.end_lat = trip['end_location']['coordinates'][:2]
+        record.parking_verification_url = trip.get('parking_verification_url')
+        record.standard_cost = trip.get('standard_cost')
+        record.actual_cost = trip.get('actual_cost')
+        currency = trip.get('currency')
+        record.currency_code = CURRENCIES.code(currency) if currency else None
+        record.trip_attributes = trip.get('trip_attributes') or None
+        return record
+
+    def points(self) -> Iterator[Tuple[float, float]]:
+        """Start, end and route positions as (lon, lat) pairs"""
+        yield self.start_lon, self.start_lat
+        yield self.end_lon, self.end_lat
+        route = self.route
+        for i in range(0, len(route), 2):
+            yield route[i], route[i + 1]
+
+    def to_mds(self) -> Dict[str, Any]:
+        """
+        Serialize to an MDS trip dict
+
+        Returns:
+            MDS 2.0 trip (optional fields omitted when unset)
+        """
+        route = self.route
+        trip = {
+            'provider_id': self.provider_id,
+            'data_provider_id': self.data_provider_id,
+            'device_id': self.device_id,
+            'trip_id': self.trip_id,
+            'trip_duration': self.trip_duration,
+            'trip_distance': self.trip_distance,
+            'route': {
+                'type': 'LineString',
+                'coordinates': [[route[i], route[i + 1]] for i in range(0, len(route), 2)]
+            },
+            'accuracy': self.accuracy,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'publication_time': self.publication_time,
+            'start_location': _point([self.start_lon, self.start_lat]),
+            'end_location': _point([self.end_lon, self.end_lat])
+        }
+        if self.parking_verification_url is not None:
+            trip['parking_verification_url'] = self.parking_verification_url
+        if self.standard_cost is not None:
+            trip['standard_cost'] = self.standard_cost
+        if self.actual_cost is not None:
+            trip['actual_cost'] = self.actual_cost
+        if self.currency_code is not None:
+            trip['currency'] = CURRENCIES.value(self.currency_code)
+        if self.trip_attributes is not None:
+            trip['trip_attributes'] = self.trip_attributes
+        return trip
@@ -0,0 +1,178 @@
+"""
+Circuit Provider API Response Spillover
+Moves oversized response bodies to object storage and redirects to them
+"""
+
+import base64
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Any, Optional
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Lambda proxy responses are capped at 6 MB; leave headroom for headers
+SPILLOVER_THRESHOLD_BYTES = int(os.environ.get('SPILLOVER_THRESHOLD_BYTES', 5 * 1024 * 1024))
+ARTIFACT_BUCKET = os.environ.get('ARTIFACT_BUCKET')
+ARTIFACT_PREFIX = os.environ.get('ARTIFACT_PREFIX', 'responses')
+ARTIFACT_URL_TTL = int(os.environ.get('ARTIFACT_URL_TTL', 900))
+ARTIFACT_LOCAL_DIR = os.environ.get('ARTIFACT_LOCAL_DIR')
+
+FILE_EXTENSIONS = {
+    'application/json': '.json',
+    'application/x-ndjson': '.ndjson',
+    'application/vnd.apache.arrow.stream': '.arrow'
+}
+
+class S3ArtifactStore:
+    """Stores artifacts in S3 and hands out presigned download URLs"""
+
+    def __init__(self, bucket: str, url_ttl: int = ARTIFACT_URL_TTL):
+        import boto3
+
+        self.bucket = bucket
+        self.url_ttl = url_ttl
+        self.client = boto3.client('s3')
+
+    def put(self, key: str, body: bytes, content_type: str) -> str:
+        """
+        Upload an artifact
+
+        Args:
+            key: Object key
+            body: Artifact bytes
+            content_type: MIME type served on download
+
+        Returns:
+            Presigned URL valid for url_ttl seconds
+        """
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=body, ContentType=content_type)
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': key},
+            ExpiresIn=self.url_ttl
+        )
+
+class LocalArtifactStore:
+    """Stores artifacts on the local filesystem (tests and local runs)"""
+
+    def __init__(self, root_dir: str, base_url: Optional[str] = None):
+        self.root_dir = root_dir
+        self.base_url = base_url
+        self.url_ttl = None
+
+    def put(self, key: str, body: bytes, content_type: str) -> str:
+        """
+        Write an artifact under root_dir
+
+        Args:
+            key: Relative artifact path
+            body: Artifact bytes
+            content_type: MIME type (unused for files)
+
+        Returns:
+            base_url/key if a base URL is configured, else a file:// URL
+        """
+        path = os.path.join(self.root_dir, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+
+        if self.base_url:
+            return f"{self.base_url.rstrip('/')}/{key}"
+        return f"file://{os.path.abspath(path)}"
+
+_store = None
+
+def get_artifact_store():
+    """
+    Get the artifact store configured for this function
+
+    ARTIFACT_BUCKET selects S3, ARTIFACT_LOCAL_DIR the filesystem backend.
+
+    Returns:
+        Artifact store, or None if spillover is not configured
+    """
+    global _store
+    if _store is None:
+        if ARTIFACT_BUCKET:
+            _store = S3ArtifactStore(ARTIFACT_BUCKET)
+        elif ARTIFACT_LOCAL_DIR:
+            _store = LocalArtifactStore(ARTIFACT_LOCAL_DIR)
+    return _store
+
+def set_artifact_store(store):
+    """Override the artifact store (local runs and tests)"""
+    global _store
+    _store = store
+
+def body_size(response: Dict[str, Any]) -> int:
+    """Size in bytes of the response body as sent by the Lambda proxy"""
+    return len(response.get('body', '').encode('utf-8'))
+
+def spill_if_oversized(response: Dict[str, Any], endpoint: str,
+                       threshold: Optional[int] = None, store=None) -> Dict[str, Any]:
+    """
+    Replace an oversized response with a redirect to a stored artifact
+
+    Responses under the threshold are returned unchanged. Larger bodies
+    are written to the artifact store and the client receives a 303 with
+    a Location header and a small JSON body describing the artifact.
+
+    Args:
+        response: API Gateway proxy response
+        endpoint: Endpoint name used in the artifact key
+        threshold: Maximum inline body size in bytes
+        store: Artifact store (defaults to get_artifact_store())
+
+    Returns:
+        Original response, or the redirect response
+    """
+    threshold = SPILLOVER_THRESHOLD_BYTES if threshold is None else threshold
+    size = body_size(response)
+    if size <= threshold:
+        return response
+
+    store = store or get_artifact_store()
+    if store is None:
+        logger.warning(f"{endpoint} response is {size} bytes but no artifact store is configured")
+        return response
+
+    if response.get('isBase64Encoded'):
+        body = base64.b64decode(response['body'])
+    else:
+        body = response['body'].encode('utf-8')
+
+    headers = response.get('headers', {})
+    content_type = headers.get('Content-Type', 'application/json')
+    now = datetime.now(timezone.utc)
+    key = (f"{ARTIFACT_PREFIX}/{endpoint}/{now.strftime('%Y/%m/%d')}/"
+           f"{uuid.uuid4()}{FILE_EXTENSIONS.get(content_type, '')}")
+    url = store.put(key, body, content_type)
+    logger.info(f"Spilled {len(body)} byte {endpoint} response to {key}")
+
+    artifact = {
+        'url': url,
+        'content_type': content_type,
+        'bytes': len(body)
+    }
+    if store.url_ttl:
+        artifact['expires_at'] = int((now.timestamp() + store.url_ttl) * 1000)
+
+    return {
+        'statusCode': 303,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Cache-Control': 'no-store',
+            'Location': url
+        },
+        'body': json.dumps({'artifact': artifact}),
+        'isBase64Encoded': False
+    }
@@ -0,0 +1,863 @@
+"""
+Circuit Provider API Telemetry Store
+Per-vehicle position and battery history in raw, 1-minute and 15-minute tiers
+
+Telemetry points are appended to hourly hot segments (NDJSON). The
+scheduled rollup rewrites each closed hour as a raw segment, then builds
+each downsampled tier from the tier below once its segment has closed:
+1-minute buckets in daily segments and 15-minute buckets in 30-day
+segments. A segment file holds one block per device in which every
+column (time, longitude, latitude, battery, ...) is delta encoded as
+zigzag varints, so a slowly moving, slowly draining vehicle costs a few
+bytes per point.
+
+A range query picks the coarsest tier whose resolution satisfies the
+request and still retains the range, and decodes only the requested
+device's block from each segment. Parts of the range whose segment has
+not been built yet are downsampled on the fly from the tier below.
+
+With a membership index, every row also carries a bitmask of the
+agencies whose jurisdiction contains its position (bit i for the i-th
+agency id in sorted order, which each index records). It is computed
+when a point is appended (rollup fills it in for points appended
+without one) and carried through the downsampled tiers, a bucket taking
+the mask of its last position, so an agency-scoped history query is a
+bit test per row.
+
+Layout under the store root:
+    hot/<segment>.ndjson                live appends
+    hot/<segment>.<generation>.rolling  hot data being rolled up
+    <tier>/<segment>.<generation>.tsd   delta-encoded device blocks
+    <tier>/<segment>.idx.json           index, names the current data file
+
+As in the event store, the index switch is the commit point: readers
+ignore rolling files whose generation the raw index already covers, so a
+rollup that crashes at any point loses no points and duplicates none.
+Readers skip a final hot line that is still being appended; a rollup
+finding one at the end of a renamed hot file leaves the hour for the
+next run.
+Superseded files are deleted right after the switch; a reader that finds
+a data file gone, or whose raw segment's generation or rolling files
+changed while it read, reads the segment again.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Tuple
+
+from mds_shared.jurisdictions import MembershipIndex
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+TELEMETRY_RAW_RETENTION_DAYS = int(os.environ.get('TELEMETRY_RAW_RETENTION_DAYS', 7))
+TELEMETRY_1M_RETENTION_DAYS = int(os.environ.get('TELEMETRY_1M_RETENTION_DAYS', 90))
+TELEMETRY_15M_RETENTION_DAYS = int(os.environ.get('TELEMETRY_15M_RETENTION_DAYS', 730))
+
+DAY_MS = 86400 * 1000
+
+# Coordinates are stored as integer microdegrees (about 0.1 m)
+COORD_SCALE = 1000000
+
+# Resolutions a query is coarsened to when it would return too many points
+STEP_RESOLUTIONS_MS = [1000, 5000, 15000, 30000, 60000, 300000, 900000, 1800000, 3600000, 21600000, DAY_MS]
+
+HOT_DIR = 'hot'
+
+# Times a segment is re-read when a rollup changes it mid-read
+READ_ATTEMPTS = 3
+
+_ROLLING_RE = re.compile(r'^(\d+)\.(\d+)\.rolling$')
+
+# Row layout shared by every tier. A raw point is a bucket of one sample.
+T, SAMPLES, LON, LAT, BATTERY, BATTERY_MIN, BATTERY_MAX, BATTERY_SUM, BATTERY_SAMPLES, AGENCIES = range(10)
+
+# Agency mask of rows stored without a membership index
+UNCLASSIFIED = -1
+
+class Tier:
+    """One resolution of the store"""
+
+    def __init__(self, name: str, resolution_ms: int, segment_ms: int, retention_ms: int):
+        """
+        Args:
+            name: Directory name and the tier reported to clients
+            resolution_ms: Bucket width (0 for raw points)
+            segment_ms: Time covered by one segment file (a multiple of resolution_ms)
+            retention_ms: How long segments are kept
+        """
+        self.name = name
+        self.resolution_ms = resolution_ms
+        self.segment_ms = segment_ms
+        self.retention_ms = retention_ms
+
+    def segment_start(self, timestamp: int) -> int:
+        return timestamp - timestamp % self.segment_ms
+
+TIERS = [
+    Tier('raw', 0, 3600 * 1000, TELEMETRY_RAW_RETENTION_DAYS * DAY_MS),
+    Tier('1m', 60 * 1000, DAY_MS, TELEMETRY_1M_RETENTION_DAYS * DAY_MS),
+    Tier('15m', 15 * 60 * 1000, 30 * DAY_MS, TELEMETRY_15M_RETENTION_DAYS * DAY_MS)
+]
+
+def point_from_mds(record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Telemetry point from an MDS event or vehicle status
+
+    Args:
+        record: Event (timestamp, event_location) or vehicle (last_event_time, current_location)
+
+    Returns:
+        Point with device_id, timestamp, lon, lat and battery_percent, or None without a location
+    """
+    timestamp = record.get('timestamp', record.get('last_event_time'))
+    location = record.get('event_location') or record.get('current_location')
+    if timestamp is None or not location or not location.get('coordinates'):
+        return None
+    lon, lat = location['coordinates'][:2]
+    return {
+        'device_id': record['device_id'],
+        'timestamp': int(timestamp),
+        'lon': lon,
+        'lat': lat,
+        'battery_percent': record.get('battery_percent')
+    }
+
+def step_resolution(span_ms: int, max_points: int) -> int:
+    """
+    Finest step resolution that yields at most max_points buckets over a span
+
+    Args:
+        span_ms: Length of the queried range
+        max_points: Upper bound on buckets
+
+    Returns:
+        Resolution in milliseconds (whole days beyond the largest step)
+    """
+    for resolution in STEP_RESOLUTIONS_MS:
+        if span_ms // resolution + 1 <= max_points:
+            return resolution
+    return -(-span_ms // (max(max_points - 1, 1) * DAY_MS)) * DAY_MS
+
+def _raw_row(timestamp: int, lon: int, lat: int, battery: int, agencies: int = UNCLASSIFIED) -> List[int]:
+    if battery < 0:
+        return [timestamp, 1, lon, lat, -1, -1, -1, 0, 0, agencies]
+    return [timestamp, 1, lon, lat, battery, battery, battery, battery, 1, agencies]
+
+def downsample(rows: List[List[int]], resolution_ms: int) -> List[List[int]]:
+    """
+    Merge time-ordered rows into buckets of resolution_ms
+
+    Each bucket keeps the sample count, the last position with its agency
+    mask, the last battery level, and the battery minimum, maximum and sum
+    over samples that reported one.
+
+    Args:
+        rows: Rows ordered by time
+        resolution_ms: Bucket width, aligned to the Unix epoch
+
+    Returns:
+        One row per non-empty bucket, timestamped with the bucket start
+    """
+    buckets: List[List[int]] = []
+    current = None
+    for row in rows:
+        bucket = row[T] - row[T] % resolution_ms
+        if current is None or current[T] != bucket:
+            current = [bucket] + row[1:]
+            buckets.append(current)
+            continue
+        current[SAMPLES] += row[SAMPLES]
+        current[LON], current[LAT], current[AGENCIES] = row[LON], row[LAT], row[AGENCIES]
+        if not row[BATTERY_SAMPLES]:
+            continue
+        if current[BATTERY_SAMPLES]:
+            current[BATTERY] = row[BATTERY]
+            current[BATTERY_MIN] = min(current[BATTERY_MIN], row[BATTERY_MIN])
+            current[BATTERY_MAX] = max(current[BATTERY_MAX], row[BATTERY_MAX])
+            current[BATTERY_SUM] += row[BATTERY_SUM]
+            current[BATTERY_SAMPLES] += row[BATTERY_SAMPLES]
+        else:
+            current[BATTERY:BATTERY_SAMPLES + 1] = row[BATTERY:BATTERY_SAMPLES + 1]
+    return buckets
+
+def _put_varint(out: bytearray, value: int):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def encode_block(columns: List[List[int]]) -> bytes:
+    """
+    Delta-encode equal-length integer columns as zigzag varints
+
+    Args:
+        columns: Columns of one device's rows
+
+    Returns:
+        Row count followed by each column's deltas
+    """
+    out = bytearray()
+    _put_varint(out, len(columns[0]) if columns else 0)
+    for column in columns:
+        previous = 0
+        for value in column:
+            delta = value - previous
+            previous = value
+            _put_varint(out, delta << 1 if delta >= 0 else ((-delta) << 1) - 1)
+    return bytes(out)
+
+def decode_block(data: bytes, width: int) -> List[List[int]]:
+    """
+    Decode a block written by encode_block()
+
+    Args:
+        data: Encoded block
+        width: Number of columns
+
+    Returns:
+        Columns
+    """
+    pos = 0
+    count = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        count |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            break
+        shift += 7
+
+    columns = []
+    for _ in range(width):
+        column = []
+        value = 0
+        for _ in range(count):
+            zigzag = shift = 0
+            while True:
+                byte = data[pos]
+                pos += 1
+                zigzag |= (byte & 0x7f) << shift
+                if byte < 0x80:
+                    break
+                shift += 7
+            value += (zigzag >> 1) ^ -(zigzag & 1)
+            column.append(value)
+        columns.append(column)
+    return columns
+
+class TelemetryStore:
+    """Filesystem time-series store for per-vehicle telemetry"""
+
+    def __init__(self, root_dir: str, tiers: List[Tier] = TIERS, membership: Optional[MembershipIndex] = None):
+        self.root_dir = root_dir
+        self.tiers = tiers
+        self.membership = membership
+        # Bit order of the agency masks written by this store
+        self.agencies = sorted(membership.jurisdictions) if membership is not None else []
+        self.hot_dir = os.path.join(root_dir, HOT_DIR)
+        os.makedirs(self.hot_dir, exist_ok=True)
+        for tier in tiers:
+            os.makedirs(os.path.join(root_dir, tier.name), exist_ok=True)
+        # Parsed indexes, reused while the index file is unchanged
+        self._index_cache: Dict[str, Tuple[Tuple[int, int], Dict[str, Any]]] = {}
+
+    def _hot_path(self, segment: int) -> str:
+        return os.path.join(self.hot_dir, f"{segment}.ndjson")
+
+    def _rolling_path(self, segment: int, generation: int) -> str:
+        return os.path.join(self.hot_dir, f"{segment}.{generation}.rolling")
+
+    def _index_path(self, level: int, segment: int) -> str:
+        return os.path.join(self.root_dir, self.tiers[level].name, f"{segment}.idx.json")
+
+    def _data_path(self, level: int, data_file: str) -> str:
+        return os.path.join(self.root_dir, self.tiers[level].name, data_file)
+
+    def append(self, points: Iterable[Dict[str, Any]]):
+        """
+        Append telemetry points to their hot segments
+
+        Each segment receives one write per call so concurrent appenders
+        do not interleave partial lines. Re-appending a point is harmless:
+        rollup keeps one point per device and timestamp.
+
+        Args:
+            points: Points with device_id, timestamp, lon, lat and optional battery_percent
+                (see point_from_mds)
+        """
+        raw = self.tiers[0]
+        by_segment: Dict[int, List[str]] = {}
+        for point in points:
+            battery = point.get('battery_percent')
+            values = [
+                point['device_id'], int(point['timestamp']),
+                round(point['lon'] * COORD_SCALE), round(point['lat'] * COORD_SCALE),
+                -1 if battery is None else int(battery)
+            ]
+            if self.membership is not None:
+                values.append(sorted(self.membership.agencies_at(point['lon'], point['lat'])))
+            line = json.dumps(values, separators=(',', ':'))
+            by_segment.setdefault(raw.segment_start(int(point['timestamp'])), []).append(line)
+
+        for segment, lines in by_segment.items():
+            with open(self._hot_path(segment), 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+
+    def _mask(self, agency_ids: Iterable[str]) -> int:
+        agency_ids = set(agency_ids)
+        return sum(1 << bit for bit, agency_id in enumerate(self.agencies) if agency_id in agency_ids)
+
+    def _remap(self, masks: List[int], agencies: List[str]) -> List[int]:
+        # Masks written with another agency order (jurisdictions changed since)
+        if agencies == self.agencies:
+            return masks
+        bits = [(source, self.agencies.index(agency_id)) for source, agency_id in enumerate(agencies)
+                if agency_id in self.agencies]
+        return [mask if mask < 0 else sum(1 << target for source, target in bits if mask >> source & 1)
+                for mask in masks]
+
+    def _classify(self, row: List[int]):
+        row[AGENCIES] = self._mask(self.membership.agencies_at(row[LON] / COORD_SCALE, row[LAT] / COORD_SCALE))
+
+    def _in_agency(self, row: List[int], bit: int) -> bool:
+        if row[AGENCIES] < 0:
+            # Stored without a membership index; rollup records it
+            if self.membership is None:
+                return False
+            self._classify(row)
+        return bool(row[AGENCIES] >> bit & 1)
+
+    def _rolling_files(self) -> Dict[int, List[Tuple[int, str]]]:
+        files: Dict[int, List[Tuple[int, str]]] = {}
+        for name in os.listdir(self.hot_dir):
+            match = _ROLLING_RE.match(name)
+            if match:
+                files.setdefault(int(match.group(1)), []).append(
+                    (int(match.group(2)), os.path.join(self.hot_dir, name)))
+        return files
+
+    def hot_segments(self) -> List[int]:
+        """Raw segments with live or rolling hot files"""
+        segments = {int(name.split('.')[0]) for name in os.listdir(self.hot_dir) if name.endswith('.ndjson')}
+        return sorted(segments | set(self._rolling_files()))
+
+    def built_segments(self, level: int) -> List[int]:
+        """Segments of a tier with an index"""
+        tier_dir = os.path.join(self.root_dir, self.tiers[level].name)
+        return sorted(int(name.split('.')[0]) for name in os.listdir(tier_dir) if name.endswith('.idx.json'))
+
+    def _load_index(self, level: int, segment: int) -> Optional[Dict[str, Any]]:
+        path = self._index_path(level, segment)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._index_cache.pop(path, None)
+            return None
+        # Indexes are replaced, never rewritten in place, so a new inode means a new generation
+        version = (stat.st_ino, stat.st_mtime_ns)
+        cached = self._index_cache.get(path)
+        if cached and cached[0] == version:
+            return cached[1]
+        try:
+            with open(path) as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            return None
+        self._index_cache[path] = (version, index)
+        return index
+
+    def _read_hot(self, path: str, start_ms: int, end_ms: int, device_id: Optional[str],
+                  complete: bool = False) -> Iterator[Tuple[str, List[int]]]:
+        try:
+            f = open(path)
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                # A line without its newline is still being appended
+                if not line.endswith('\n'):
+                    if complete:
+                        raise RuntimeError(f"{path} ends in a partially written line")
+                    break
+                if not line.strip():
+                    continue
+                device, timestamp, lon, lat, battery, *agencies = json.loads(line)
+                if start_ms <= timestamp <= end_ms and (device_id is None or device == device_id):
+                    mask = self._mask(agencies[0]) if agencies and self.membership is not None else UNCLASSIFIED
+                    yield device, _raw_row(timestamp, lon, lat, battery, mask)
+
+    def _read_segment(self, level: int, index: Dict[str, Any], start_ms: int, end_ms: int,
+                      device_id: Optional[str]) -> Iterator[Tuple[str, List[List[int]]]]:
+        tier = self.tiers[level]
+        if device_id is not None:
+            entry = index['devices'].get(device_id)
+            if entry is None:
+                return
+            blocks = [(device_id, entry)]
+        else:
+            blocks = sorted(index['devices'].items(), key=lambda item: item[1][0])
+
+        # Segments written before agency masks were recorded have no mask column
+        agencies = index.get('agencies')
+        with open(self._data_path(level, index['data_file']), 'rb') as f:
+            for device, (offset, length, _) in blocks:
+                f.seek(offset)
+                data = f.read(length)
+                if level == 0:
+                    columns = decode_block(data, 4 if agencies is None else 5)
+                else:
+                    columns = decode_block(data, 9 if agencies is None else 10)
+                    columns[T] = [bucket * tier.resolution_ms for bucket in columns[T]]
+                if agencies is None:
+                    columns.append([UNCLASSIFIED] * len(columns[0]))
+                else:
+                    columns[-1] = self._remap(columns[-1], agencies)
+                if level == 0:
+                    rows = [_raw_row(*values) for values in zip(*columns)]
+                else:
+                    rows = [list(values) for values in zip(*columns)]
+                # Bucket rows overlap the range if the bucket does
+                lower = start_ms - start_ms % tier.resolution_ms if tier.resolution_ms else start_ms
+                yield device, [row for row in rows if lower <= row[T] <= end_ms]
+
+    def _raw_state(self, segment: int) -> Tuple[Optional[Dict[str, Any]], List[Tuple[int, str]]]:
+        # Index before rolling files: a hot file renamed aside after the
+        # index was loaded then shows up in the listing
+        index = self._load_index(0, segment)
+        return index, sorted(self._rolling_files().get(segment, []))
+
+    def _read_raw(self, segment: int, start_ms: int, end_ms: int,
+                  device_id: Optional[str]) -> Dict[str, List[List[int]]]:
+        for _ in range(READ_ATTEMPTS):
+            index, rolling = self._raw_state(segment)
+            covered = index['generation'] if index else 0
+            result: Dict[str, List[List[int]]] = {}
+            try:
+                if index:
+                    for device, device_rows in self._read_segment(0, index, start_ms, end_ms, device_id):
+                        result.setdefault(device, []).extend(device_rows)
+            except FileNotFoundError:
+                # The data file was superseded by a rollup after the index was loaded
+                continue
+            paths = [path for generation, path in rolling if generation > covered]
+            for path in paths + [self._hot_path(segment)]:
+                for device, row in self._read_hot(path, start_ms, end_ms, device_id):
+                    result.setdefault(device, []).append(row)
+            after, after_rolling = self._raw_state(segment)
+            if (after['generation'] if after else 0) == covered and after_rolling == rolling:
+                return result
+        raise RuntimeError(f"Raw telemetry segment {segment} changed during {READ_ATTEMPTS} consecutive reads")
+
+    def _read_built(self, level: int, segment: int, start_ms: int, end_ms: int,
+                    device_id: Optional[str]) -> Optional[List[Tuple[str, List[List[int]]]]]:
+        # None when the segment is not built; a rebuild keeps the bucket set
+        # complete, so only a vanished data file needs a second read
+        for _ in range(READ_ATTEMPTS):
+            index = self._load_index(level, segment)
+            if index is None:
+                return None
+            try:
+                return list(self._read_segment(level, index, start_ms, end_ms, device_id))
+            except FileNotFoundError:
+                continue
+        raise RuntimeError(f"{self.tiers[level].name} telemetry segment {segment} changed during "
+                           f"{READ_ATTEMPTS} consecutive reads")
+
+    def rows(self, level: int, start_ms: int, end_ms: int,
+             device_id: Optional[str] = None) -> Dict[str, List[List[int]]]:
+        """
+        Rows of one tier in [start_ms, end_ms], per device and ordered by time
+
+        Ranges whose segment is not built are downsampled from the tier below.
+
+        Args:
+            level: Index into the store's tiers
+            start_ms: Range start (inclusive); buckets overlapping it are included
+            end_ms: Range end (inclusive)
+            device_id: Only this device
+
+        Returns:
+            Rows keyed by device_id
+        """
+        tier = self.tiers[level]
+        result: Dict[str, List[List[int]]] = {}
+
+        if level == 0:
+            for segment in sorted(set(self.built_segments(0)) | set(self.hot_segments())):
+                if segment + tier.segment_ms <= start_ms or segment > end_ms:
+                    continue
+                for device, device_rows in self._read_raw(segment, start_ms, end_ms, device_id).items():
+                    result.setdefault(device, []).extend(device_rows)
+            for device, device_rows in result.items():
+                result[device] = _dedupe(device_rows)
+            return result
+
+        start_ms -= start_ms % tier.resolution_ms
+        gaps: List[Tuple[int, int]] = []
+        for segment in range(tier.segment_start(start_ms), end_ms + 1, tier.segment_ms):
+            lower, upper = max(segment, start_ms), min(segment + tier.segment_ms - 1, end_ms)
+            blocks = self._read_built(level, segment, lower, upper, device_id)
+            if blocks is None:
+                if gaps and gaps[-1][1] == lower - 1:
+                    gaps[-1] = (gaps[-1][0], upper)
+                else:
+                    gaps.append((lower, upper))
+                continue
+            for device, device_rows in blocks:
+                result.setdefault(device, []).extend(device_rows)
+
+        # Segments are bucket-aligned, so no bucket straddles a gap boundary
+        for lower, upper in gaps:
+            for device, device_rows in self.rows(level - 1, lower, upper, device_id).items():
+                result.setdefault(device, []).extend(downsample(device_rows, tier.resolution_ms))
+
+        for device_rows in result.values():
+            device_rows.sort(key=lambda row: row[T])
+        return result
+
+    def choose_tier(self, start_ms: int, resolution_ms: int, now_ms: Optional[int] = None) -> int:
+        """
+        Coarsest tier no coarser than resolution_ms that still retains start_ms
+
+        Falls back to coarser tiers when the finer ones have expired for the range.
+
+        Args:
+            start_ms: Range start
+            resolution_ms: Requested resolution (0 for raw points)
+            now_ms: Current time (defaults to the clock)
+
+        Returns:
+            Index into the store's tiers
+        """
+        now_ms = int(time.time() * 1000) if now_ms is None else now_ms
+        level = max(i for i, tier in enumerate(self.tiers) if tier.resolution_ms <= resolution_ms)
+        while level < len(self.tiers) - 1 and start_ms < now_ms - self.tiers[level].retention_ms:
+            level += 1
+        return level
+
+    def query(self, device_id: str, start_ms: int, end_ms: int, resolution_ms: int = 0,
+              max_points: Optional[int] = None, now_ms: Optional[int] = None,
+              agency_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Telemetry history of one vehicle
+
+        Args:
+            device_id: Vehicle device id
+            start_ms: Range start (inclusive)
+            end_ms: Range end (inclusive)
+            resolution_ms: Widest acceptable spacing between points (0 for raw points)
+            max_points: Coarsen to a step resolution when more points than this would be returned
+            now_ms: Current time, for retention (defaults to the clock)
+            agency_id: Only points inside this agency's jurisdiction (none for unknown agencies)
+
+        Returns:
+            Tier read, effective resolution and points ordered by time
+        """
+        span_ms = end_ms - start_ms
+        # A tier whose buckets alone would exceed max_points is never read
+        floor_ms = span_ms // max_points if max_points else 0
+        level = self.choose_tier(start_ms, max(resolution_ms, floor_ms), now_ms)
+        tier = self.tiers[level]
+        rows = self.rows(level, start_ms, end_ms, device_id).get(device_id, [])
+        if agency_id is not None:
+            bit = self.agencies.index(agency_id) if agency_id in self.agencies else None
+            rows = [row for row in rows if bit is not None and self._in_agency(row, bit)]
+
+        target_ms = resolution_ms
+        if max_points and len(rows) > max_points:
+            target_ms = max(target_ms, step_resolution(span_ms, max_points))
+        effective_ms = tier.resolution_ms
+        if target_ms > tier.resolution_ms:
+            rows = downsample(rows, target_ms)
+            effective_ms = target_ms
+        return {
+            'tier': tier.name,
+            'resolution_ms': effective_ms,
+            'points': [format_point(row, aggregated=effective_ms > 0) for row in rows]
+        }
+
+    def _write_segment(self, level: int, segment: int, generation: int,
+                       rows_by_device: Dict[str, List[List[int]]]) -> Dict[str, Any]:
+        tier = self.tiers[level]
+        data_name = f"{segment}.{generation}.tsd"
+        data_path = self._data_path(level, data_name)
+        devices = {}
+        count = 0
+        with open(f"{data_path}.tmp", 'wb') as f:
+            for device in sorted(rows_by_device):
+                rows = rows_by_device[device]
+                if not rows:
+                    continue
+                if level == 0:
+                    columns = [[row[T] for row in rows], [row[LON] for row in rows], [row[LAT] for row in rows],
+                               [row[BATTERY] for row in rows], [row[AGENCIES] for row in rows]]
+                else:
+                    columns = [list(column) for column in zip(*rows)]
+                    columns[T] = [timestamp // tier.resolution_ms for timestamp in columns[T]]
+                block = encode_block(columns)
+                devices[device] = [f.tell(), len(block), len(rows)]
+                count += len(rows)
+                f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(f"{data_path}.tmp", 0o444)
+        os.replace(f"{data_path}.tmp", data_path)
+
+        index = {
+            'tier': tier.name,
+            'segment_start': segment,
+            'segment_end': segment + tier.segment_ms,
+            'generation': generation,
+            'data_file': data_name,
+            'count': count,
+            'devices': devices,
+            'agencies': self.agencies
+        }
+        index_path = self._index_path(level, segment)
+        with open(f"{index_path}.tmp", 'w') as f:
+            json.dump(index, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        # The index switch is the commit point for this generation
+        os.replace(f"{index_path}.tmp", index_path)
+        return index
+
+    def roll_raw_segment(self, segment: int) -> Dict[str, Any]:
+        """
+        Rewrite a closed hot segment as a delta-encoded raw segment
+
+        Points already rolled up for the segment are merged in, so late
+        arrivals produce a new generation.
+
+        Args:
+            segment: Raw segment start
+
+        Returns:
+            Point count, bytes before and after, and whether an earlier generation was replaced
+        """
+        tier = self.tiers[0]
+        index = self._load_index(0, segment)
+        covered = index['generation'] if index else 0
+
+        pending = []
+        for generation, path in self._rolling_files().get(segment, []):
+            if generation > covered:
+                pending.append((generation, path))
+            else:
+                # Left over from a run that crashed after writing its index
+                os.remove(path)
+        generation = max([covered] + [g for g, _ in pending]) + 1
+        if os.path.exists(self._hot_path(segment)):
+            aside = self._rolling_path(segment, generation)
+            os.replace(self._hot_path(segment), aside)
+            pending.append((generation, aside))
+        if not pending:
+            return {'segment': segment, 'points': 0, 'bytes_before': 0, 'bytes_after': 0, 'replaced': False}
+        generation = max(g for g, _ in pending)
+
+        full_range = (segment, segment + tier.segment_ms - 1)
+        bytes_before = sum(os.path.getsize(path) for _, path in pending)
+        rows_by_device: Dict[str, List[List[int]]] = {}
+        if index:
+            bytes_before += (os.path.getsize(self._data_path(0, index['data_file'])) +
+                             os.path.getsize(self._index_path(0, segment)))
+            for device, device_rows in self._read_segment(0, index, *full_range, None):
+                rows_by_device.setdefault(device, []).extend(device_rows)
+        for _, path in pending:
+            # An appender that opened the hot file before it was renamed aside
+            # may still be writing; the segment is retried on the next run
+            for device, row in self._read_hot(path, *full_range, None, complete=True):
+                rows_by_device.setdefault(device, []).append(row)
+        rows_by_device = {device: _dedupe(rows) for device, rows in rows_by_device.items()}
+        if self.membership is not None:
+            for rows in rows_by_device.values():
+                for row in rows:
+                    if row[AGENCIES] < 0:
+                        self._classify(row)
+
+        new_index = self._write_segment(0, segment, generation, rows_by_device)
+        for _, path in pending:
+            os.remove(path)
+        if index and index['data_file'] != new_index['data_file']:
+            os.remove(self._data_path(0, index['data_file']))
+
+        return {
+            'segment': segment,
+            'points': new_index['count'],
+            'bytes_before': bytes_before,
+            'bytes_after': (os.path.getsize(self._data_path(0, new_index['data_file'])) +
+                            os.path.getsize(self._index_path(0, segment))),
+            'replaced': index is not None
+        }
+
+    def build_segment(self, level: int, segment: int) -> Dict[str, Any]:
+        """
+        Build (or rebuild) a downsampled segment from the tier below
+
+        Args:
+            level: Tier index (1 or above)
+            segment: Segment start
+
+        Returns:
+            Bucket count and bytes written
+        """
+        tier = self.tiers[level]
+        source = self.rows(level - 1, segment, segment + tier.segment_ms - 1)
+        rows_by_device = {device: downsample(rows, tier.resolution_ms) for device, rows in source.items()}
+        index = self._load_index(level, segment)
+        new_index = self._write_segment(level, segment, (index['generation'] if index else 0) + 1, rows_by_device)
+        if index and index['data_file'] != new_index['data_file']:
+            os.remove(self._data_path(level, index['data_file']))
+        return {
+            'segment': segment,
+            'buckets': new_index['count'],
+            'bytes': (os.path.getsize(self._data_path(level, new_index['data_file'])) +
+                      os.path.getsize(self._index_path(level, segment)))
+        }
+
+    def _delete_segment(self, level: int, segment: int) -> int:
+        index = self._load_index(level, segment)
+        # Index first, so readers never open a data file without one
+        paths = [self._index_path(level, segment)]
+        if index:
+            paths.append(self._data_path(level, index['data_file']))
+        reclaimed = 0
+        for path in paths:
+            if os.path.exists(path):
+                reclaimed += os.path.getsize(path)
+                os.remove(path)
+        return reclaimed
+
+    def rollup(self, now_ms: int, grace_ms: int = 5 * 60 * 1000) -> Dict[str, Any]:
+        """
+        Roll closed hot segments into the raw tier, then build closed downsampled segments
+
+        Late points for an hour that was already rolled up invalidate the
+        downsampled segments covering it; they are rebuilt in the same run.
+
+        Args:
+            now_ms: Current time in Unix milliseconds
+            grace_ms: Time to wait after a segment closes for late points
+
+        Returns:
+            Rollup metrics per tier
+        """
+        raw = self.tiers[0]
+        metrics: Dict[str, Any] = {'raw': {'segments': 0, 'points': 0, 'bytes_before': 0, 'bytes_after': 0}}
+        stale: List[int] = []
+        for segment in self.hot_segments():
+            if segment + raw.segment_ms + grace_ms > now_ms:
+                continue
+            try:
+                result = self.roll_raw_segment(segment)
+            except Exception as e:
+                logger.error(f"Failed to roll up telemetry segment {segment}: {str(e)}")
+                continue
+            metrics['raw']['segments'] += 1
+            metrics['raw']['points'] += result['points']
+            metrics['raw']['bytes_before'] += result['bytes_before']
+            metrics['raw']['bytes_after'] += result['bytes_after']
+            if result['replaced']:
+                stale.append(segment)
+
+        for level in range(1, len(self.tiers)):
+            tier = self.tiers[level]
+            built = set(self.built_segments(level))
+            rebuild = {tier.segment_start(segment) for segment in stale} & built
+            sources = set(self.built_segments(level - 1)) | (set(self.hot_segments()) if level == 1 else set())
+            candidates = {tier.segment_start(segment) for segment in sources} - built | rebuild
+            tier_metrics = {'segments': 0, 'buckets': 0, 'bytes': 0}
+            for segment in sorted(candidates):
+                closed = segment + tier.segment_ms + grace_ms <= now_ms
+                expired = segment + tier.segment_ms <= now_ms - tier.retention_ms
+                if not closed or expired:
+                    continue
+                try:
+                    result = self.build_segment(level, segment)
+                except Exception as e:
+                    logger.error(f"Failed to build {tier.name} telemetry segment {segment}: {str(e)}")
+                    continue
+                tier_metrics['segments'] += 1
+                tier_metrics['buckets'] += result['buckets']
+                tier_metrics['bytes'] += result['bytes']
+            metrics[tier.name] = tier_metrics
+            # A rebuilt segment makes the coarser segments covering it stale too
+            stale = sorted(rebuild)
+        return metrics
+
+    def _rolled_up(self, level: int, segment: int, now_ms: int) -> bool:
+        if level == len(self.tiers) - 1:
+            return True
+        coarser = self.tiers[level + 1]
+        parent = coarser.segment_start(segment)
+        return (self._load_index(level + 1, parent) is not None or
+                parent + coarser.segment_ms <= now_ms - coarser.retention_ms)
+
+    def apply_retention(self, now_ms: int) -> Dict[str, Any]:
+        """
+        Delete each tier's segments that ended before its retention window
+
+        A segment is kept past its window while the coarser segment covering
+        it is neither built nor expired, so a rollup that fell behind or
+        failed loses no data.
+
+        Args:
+            now_ms: Current time in Unix milliseconds
+
+        Returns:
+            Segments deleted per tier and bytes reclaimed
+        """
+        metrics: Dict[str, Any] = {'bytes_reclaimed': 0}
+        for level, tier in enumerate(self.tiers):
+            cutoff = now_ms - tier.retention_ms
+            deleted = 0
+            for segment in self.built_segments(level):
+                if segment + tier.segment_ms <= cutoff and self._rolled_up(level, segment, now_ms):
+                    metrics['bytes_reclaimed'] += self._delete_segment(level, segment)
+                    deleted += 1
+            if level == 0:
+                rolling = self._rolling_files()
+                for segment in self.hot_segments():
+                    if segment + tier.segment_ms > cutoff:
+                        continue
+                    for path in [self._hot_path(segment)] + [path for _, path in rolling.get(segment, [])]:
+                        if os.path.exists(path):
+                            metrics['bytes_reclaimed'] += os.path.getsize(path)
+                            os.remove(path)
+            metrics[tier.name] = deleted
+        return metrics
+
+def _dedupe(rows: List[List[int]]) -> List[List[int]]:
+    """Order raw rows by time, keeping the last point appended for each timestamp"""
+    by_time = {row[T]: row for row in rows}
+    return [by_time[timestamp] for timestamp in sorted(by_time)]
+
+def format_point(row: List[int], aggregated: bool) -> Dict[str, Any]:
+    """
+    Point as returned by the history API
+
+    Args:
+        row: Stored row
+        aggregated: Include bucket statistics
+
+    Returns:
+        Timestamp, [lon, lat] and battery_percent; buckets add samples and battery min/max/mean
+    """
+    point = {
+        'timestamp': row[T],
+        'location': [row[LON] / COORD_SCALE, row[LAT] / COORD_SCALE],
+        'battery_percent': row[BATTERY] if row[BATTERY_SAMPLES] else None
+    }
+    if aggregated:
+        point['samples'] = row[SAMPLES]
+        if row[BATTERY_SAMPLES]:
+            point['battery_min'] = row[BATTERY_MIN]
+            point['battery_max'] = row[BATTERY_MAX]
+            point['battery_mean'] = round(row[BATTERY_SUM] / row[BATTERY_SAMPLES], 1)
+    return point
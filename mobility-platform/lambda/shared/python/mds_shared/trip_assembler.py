@@ -0,0 +1,422 @@
+"""
+Circuit Provider API Trip Assembler
+Builds MDS 2.0 trips from trip_start/trip_end events and GPS telemetry
+
+The scheduled compaction function feeds each closed event segment through
+an assembler and appends the trips it completes to the trip store. Open
+trips and reorder buffers are carried between runs with snapshot() and
+restore(), so a trip that spans segments still completes.
+
+A trip is only emitted with a start and end location. Trips with neither
+an event location nor any telemetry point are withheld and counted, and
+trips whose points report no horizontal_accuracy take the configured
+default accuracy.
+"""
+
+import heapq
+import itertools
+import logging
+import math
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Iterable, Tuple
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+EARTH_RADIUS_METERS = 6371008.8
+
+# Event types that open and close a trip (MDS 2.0 event_types)
+TRIP_START_EVENTS = {'trip_start', 'trip_resume'}
+TRIP_END_EVENTS = {'trip_end', 'trip_cancel'}
+
+def haversine_distances(lons: List[float], lats: List[float]) -> List[float]:
+    """
+    Compute great-circle distances between consecutive points of a path
+
+    Coordinates are converted to radians and cosines once per point rather
+    than once per segment. The segments themselves are measured in a plain
+    Python loop; numpy is not part of the Lambda layer.
+
+    Args:
+        lons: Longitudes in degrees
+        lats: Latitudes in degrees
+
+    Returns:
+        List of segment lengths in meters (one shorter than the input)
+    """
+    if len(lons) < 2:
+        return []
+
+    rad_lons = [math.radians(lon) for lon in lons]
+    rad_lats = [math.radians(lat) for lat in lats]
+    cos_lats = [math.cos(lat) for lat in rad_lats]
+
+    distances = []
+    for i in range(1, len(rad_lons)):
+        dlat = rad_lats[i] - rad_lats[i - 1]
+        dlon = rad_lons[i] - rad_lons[i - 1]
+        a = (math.sin(dlat / 2) ** 2 +
+             cos_lats[i - 1] * cos_lats[i] * math.sin(dlon / 2) ** 2)
+        distances.append(2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a))))
+    return distances
+
+class _OpenTrip:
+    """In-progress trip for a single device"""
+
+    __slots__ = ('trip_id', 'start_time', 'start_location', 'route',
+                 'pending', 'last_point', 'distance', 'accuracy', 'last_time')
+
+    def __init__(self, trip_id: str, start_time: int, start_location: Optional[List[float]]):
+        self.trip_id = trip_id
+        self.start_time = start_time
+        self.start_location = start_location
+        self.route: List[List[float]] = []
+        self.pending: List[List[float]] = []
+        self.last_point: Optional[List[float]] = None
+        self.distance = 0.0
+        self.accuracy: Optional[float] = None
+        self.last_time = start_time
+
+    def to_state(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> '_OpenTrip':
+        trip = cls(state['trip_id'], state['start_time'], state['start_location'])
+        for name in cls.__slots__:
+            setattr(trip, name, state[name])
+        return trip
+
+class _DeviceState:
+    """Reorder buffer, watermark and open trip for a single device"""
+
+    __slots__ = ('buffer', 'max_seen', 'watermark', 'open_trip')
+
+    def __init__(self):
+        self.buffer: List[Tuple[int, int, Dict[str, Any]]] = []
+        self.max_seen = 0
+        self.watermark = 0
+        self.open_trip: Optional[_OpenTrip] = None
+
+class TripAssembler:
+    """
+    Streaming processor that assembles trips from events and telemetry
+
+    Records are keyed by device_id. Each device holds a small min-heap
+    that reorders arrivals within ``reorder_window_ms`` of the newest
+    timestamp seen for that device; anything older than the released
+    watermark is counted as late and dropped. Route geometry is decimated
+    once it exceeds ``max_route_points`` while the distance keeps
+    accumulating at full resolution, and idle devices are evicted in LRU
+    order past ``max_devices``, so memory stays bounded under a
+    continuous feed.
+    """
+
+    def __init__(self, provider_id: Optional[str],
+                 reorder_window_ms: int = 30000,
+                 max_buffered_per_device: int = 500,
+                 max_route_points: int = 1000,
+                 distance_chunk_size: int = 256,
+                 max_devices: int = 100000,
+                 trip_timeout_ms: int = 6 * 3600 * 1000,
+                 default_accuracy: Optional[int] = None):
+        self.provider_id = provider_id
+        self.reorder_window_ms = reorder_window_ms
+        self.max_buffered_per_device = max_buffered_per_device
+        self.max_route_points = max_route_points
+        self.distance_chunk_size = distance_chunk_size
+        self.max_devices = max_devices
+        self.trip_timeout_ms = trip_timeout_ms
+        self.default_accuracy = default_accuracy
+
+        self._devices: 'OrderedDict[str, _DeviceState]' = OrderedDict()
+        self._sequence = itertools.count()
+        self.stats = {
+            'records': 0,
+            'late_records': 0,
+            'invalid_records': 0,
+            'trips_emitted': 0,
+            'trips_withheld': 0,
+            'trips_expired': 0,
+            'devices_evicted': 0
+        }
+
+    def process(self, record: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        Add an event or telemetry record to the stream
+
+        Args:
+            record: MDS event (has ``event_types``) or telemetry record
+
+        Returns:
+            Trips completed as a result of this record
+        """
+        self.stats['records'] += 1
+        device_id = record.get('device_id')
+        timestamp = record.get('timestamp')
+        if not device_id or timestamp is None:
+            self.stats['invalid_records'] += 1
+            return []
+
+        timestamp = int(timestamp)
+        state = self._get_device(device_id)
+        if timestamp < state.watermark:
+            self.stats['late_records'] += 1
+            return []
+
+        heapq.heappush(state.buffer, (timestamp, next(self._sequence), record))
+        state.max_seen = max(state.max_seen, timestamp)
+
+        completed = self._release(device_id, state, state.max_seen - self.reorder_window_ms)
+        completed.extend(self._evict_idle_devices())
+        return completed
+
+    def process_batch(self, records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Add many records to the stream
+
+        Args:
+            records: Iterable of MDS events and telemetry records
+
+        Returns:
+            Trips completed while processing the batch
+        """
+        completed = []
+        for record in records:
+            completed.extend(self.process(record))
+        return completed
+
+    def flush(self, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Drain reorder buffers regardless of the reorder window
+
+        Open trips stay open; only buffered records are applied.
+
+        Args:
+            device_id: Only flush this device (all devices if omitted)
+
+        Returns:
+            Trips completed by the drained records
+        """
+        device_ids = [device_id] if device_id else list(self._devices)
+        completed = []
+        for key in device_ids:
+            state = self._devices.get(key)
+            if state is not None:
+                completed.extend(self._release(key, state, state.max_seen))
+        return completed
+
+    def expire(self, now_ms: int) -> int:
+        """
+        Discard open trips with no record for longer than trip_timeout_ms
+
+        Args:
+            now_ms: Current time in Unix milliseconds
+
+        Returns:
+            Number of trips discarded
+        """
+        expired = 0
+        for device_id, state in self._devices.items():
+            if state.open_trip and now_ms - state.open_trip.last_time > self.trip_timeout_ms:
+                logger.warning(f"Discarding stale trip {state.open_trip.trip_id} for device {device_id}")
+                state.open_trip = None
+                expired += 1
+        self.stats['trips_expired'] += expired
+        return expired
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        JSON-serializable state of every device (buffers, watermarks and open trips)
+
+        Returns:
+            State for restore()
+        """
+        devices = {}
+        for device_id, state in self._devices.items():
+            devices[device_id] = {
+                'buffer': [[timestamp, record] for timestamp, _, record in sorted(state.buffer)],
+                'max_seen': state.max_seen,
+                'watermark': state.watermark,
+                'open_trip': state.open_trip.to_state() if state.open_trip else None
+            }
+        return {'devices': devices}
+
+    def restore(self, snapshot: Optional[Dict[str, Any]]):
+        """
+        Replace the per-device state with one taken by snapshot()
+
+        Args:
+            snapshot: Saved state (None leaves the assembler empty)
+        """
+        self._devices.clear()
+        for device_id, saved in ((snapshot or {}).get('devices') or {}).items():
+            state = _DeviceState()
+            state.buffer = [(timestamp, next(self._sequence), record) for timestamp, record in saved['buffer']]
+            heapq.heapify(state.buffer)
+            state.max_seen = saved['max_seen']
+            state.watermark = saved['watermark']
+            if saved['open_trip']:
+                state.open_trip = _OpenTrip.from_state(saved['open_trip'])
+            self._devices[device_id] = state
+
+    @property
+    def open_trip_count(self) -> int:
+        """Number of devices currently on a trip"""
+        return sum(1 for state in self._devices.values() if state.open_trip)
+
+    def _get_device(self, device_id: str) -> _DeviceState:
+        state = self._devices.get(device_id)
+        if state is None:
+            state = _DeviceState()
+            self._devices[device_id] = state
+        else:
+            self._devices.move_to_end(device_id)
+        return state
+
+    def _evict_idle_devices(self) -> List[Dict[str, Any]]:
+        completed = []
+        while len(self._devices) > self.max_devices:
+            device_id, state = self._devices.popitem(last=False)
+            completed.extend(self._release(device_id, state, state.max_seen))
+            if state.open_trip:
+                self.stats['trips_expired'] += 1
+            self.stats['devices_evicted'] += 1
+        return completed
+
+    def _release(self, device_id: str, state: _DeviceState, watermark: int) -> List[Dict[str, Any]]:
+        completed = []
+        buffer = state.buffer
+        while buffer and (buffer[0][0] <= watermark or len(buffer) > self.max_buffered_per_device):
+            timestamp, _, record = heapq.heappop(buffer)
+            state.watermark = max(state.watermark, timestamp)
+            trip = self._apply(device_id, state, timestamp, record)
+            if trip:
+                completed.append(trip)
+        return completed
+
+    def _apply(self, device_id: str, state: _DeviceState, timestamp: int,
+               record: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        open_trip = state.open_trip
+        if open_trip and timestamp - open_trip.last_time > self.trip_timeout_ms:
+            logger.warning(f"Discarding stale trip {open_trip.trip_id} for device {device_id}")
+            self.stats['trips_expired'] += 1
+            state.open_trip = open_trip = None
+
+        event_types = record.get('event_types')
+        if event_types is None:
+            if open_trip:
+                point = _telemetry_point(record)
+                if point:
+                    self._add_point(open_trip, point, _accuracy(record.get('location')))
+                    open_trip.last_time = timestamp
+            return None
+
+        event_types = set(event_types)
+        location = _event_point(record)
+        accuracy = _accuracy(record.get('event_location') or record.get('location'))
+        if event_types & TRIP_START_EVENTS and not open_trip:
+            # Derived ids are stable, so a segment fed twice yields the same trip
+            trip_ids = record.get('trip_ids') or [str(uuid.uuid5(uuid.NAMESPACE_URL, f"{device_id}/{timestamp}"))]
+            state.open_trip = open_trip = _OpenTrip(trip_ids[0], timestamp, location)
+            if location:
+                self._add_point(open_trip, location, accuracy)
+            return None
+
+        if event_types & TRIP_END_EVENTS and open_trip:
+            if location:
+                self._add_point(open_trip, location, accuracy)
+            state.open_trip = None
+            if 'trip_cancel' in event_types:
+                return None
+            return self._build_trip(device_id, open_trip, timestamp, location)
+
+        # Any other event during a trip is a position on its route
+        if open_trip and location:
+            self._add_point(open_trip, location, accuracy)
+            open_trip.last_time = timestamp
+        return None
+
+    def _add_point(self, trip: _OpenTrip, point: List[float], accuracy: Optional[float]):
+        trip.pending.append(point)
+        if accuracy is not None:
+            trip.accuracy = accuracy if trip.accuracy is None else max(trip.accuracy, accuracy)
+        if len(trip.pending) >= self.distance_chunk_size:
+            self._measure_pending(trip)
+
+    def _measure_pending(self, trip: _OpenTrip):
+        if not trip.pending:
+            return
+        points = ([trip.last_point] if trip.last_point else []) + trip.pending
+        trip.distance += sum(haversine_distances([p[0] for p in points], [p[1] for p in points]))
+        trip.last_point = trip.pending[-1]
+        trip.route.extend(trip.pending)
+        trip.pending = []
+
+        # Decimate geometry only; distance has already been measured
+        if len(trip.route) > self.max_route_points:
+            trip.route = trip.route[:-1:2] + [trip.route[-1]]
+
+    def _build_trip(self, device_id: str, trip: _OpenTrip, end_time: int,
+                    end_location: Optional[List[float]]) -> Optional[Dict[str, Any]]:
+        self._measure_pending(trip)
+        route = trip.route
+        start_location = trip.start_location or (route[0] if route else None)
+        end_location = end_location or (route[-1] if route else None)
+        accuracy = trip.accuracy if trip.accuracy is not None else self.default_accuracy
+        if start_location is None or end_location is None or accuracy is None:
+            reason = 'no accuracy' if start_location and end_location else 'no location'
+            logger.warning(f"Withholding trip {trip.trip_id} for device {device_id}: {reason}")
+            self.stats['trips_withheld'] += 1
+            return None
+
+        self.stats['trips_emitted'] += 1
+
+        return {
+            'provider_id': self.provider_id,
+            'data_provider_id': self.provider_id,
+            'device_id': device_id,
+            'trip_id': trip.trip_id,
+            'trip_duration': max(0, (end_time - trip.start_time) // 1000),  # seconds
+            'trip_distance': int(round(trip.distance)),  # meters
+            'route': {
+                'type': 'LineString',
+                'coordinates': route
+            },
+            'accuracy': int(round(accuracy)),  # meters
+            'start_time': trip.start_time,
+            'end_time': end_time,
+            'publication_time': end_time,
+            'start_location': {
+                'type': 'Point',
+                'coordinates': start_location
+            },
+            'end_location': {
+                'type': 'Point',
+                'coordinates': end_location
+            }
+        }
+
+def _telemetry_point(record: Dict[str, Any]) -> Optional[List[float]]:
+    """Extract [lon, lat] from an MDS telemetry record"""
+    location = record.get('location') or {}
+    if 'lng' in location and 'lat' in location:
+        return [float(location['lng']), float(location['lat'])]
+    if location.get('type') == 'Point':
+        return list(location['coordinates'][:2])
+    return None
+
+def _event_point(record: Dict[str, Any]) -> Optional[List[float]]:
+    """Extract [lon, lat] from an MDS event record"""
+    location = record.get('event_location') or record.get('location') or {}
+    if 'lng' in location and 'lat' in location:
+        return [float(location['lng']), float(location['lat'])]
+    if location.get('type') == 'Point':
+        return list(location['coordinates'][:2])
+    return None
+
+def _accuracy(location: Optional[Dict[str, Any]]) -> Optional[float]:
+    """horizontal_accuracy of an MDS GPS location, if reported"""
+    return (location or {}).get('horizontal_accuracy')
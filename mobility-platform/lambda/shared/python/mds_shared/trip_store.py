@@ -0,0 +1,183 @@
+"""
+Circuit Provider API Trip Store
+Assembled MDS trips in hourly NDJSON segments keyed by trip start time
+
+The scheduled compaction function runs each closed event segment through
+the trip assembler (mds_shared.trip_assembler) and appends the trips it
+completes to the segment of their start_time. The assembler's open trips
+and reorder buffers are saved next to the segments between runs. Trips
+are immutable once emitted; a trip appended twice, by a run that failed
+after writing trips but before saving the assembler state, is returned
+once.
+
+With a membership index, each stored trip records the agencies whose
+jurisdiction contains its start, end or any route point (an "_agencies"
+list, never returned to callers), so agency-scoped queries are a set
+lookup per trip.
+
+Layout under the store root:
+    <segment>.ndjson   trips starting in the segment
+    assembler.json     assembler state between compaction runs
+"""
+
+import json
+import logging
+import os
+from typing import Dict, Any, List, Optional, Iterable, Iterator
+
+from mds_shared.jurisdictions import MembershipIndex
+
+# Configure logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SEGMENT_MS = 3600 * 1000
+
+STATE_FILE = 'assembler.json'
+
+# Stored with each trip: agencies whose jurisdiction the trip touches
+AGENCIES_KEY = '_agencies'
+
+class TripStore:
+    """Filesystem store for trips emitted by the trip assembler"""
+
+    def __init__(self, root_dir: str, segment_ms: int = SEGMENT_MS, membership: Optional[MembershipIndex] = None):
+        self.root_dir = root_dir
+        self.segment_ms = segment_ms
+        self.membership = membership
+        os.makedirs(root_dir, exist_ok=True)
+
+    def segment_start(self, timestamp: int) -> int:
+        """Start of the segment containing a timestamp"""
+        return timestamp - timestamp % self.segment_ms
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.root_dir, f"{segment}.ndjson")
+
+    def segments(self) -> List[int]:
+        """Segments holding trips"""
+        return sorted(int(name.split('.')[0]) for name in os.listdir(self.root_dir) if name.endswith('.ndjson'))
+
+    def append(self, trips: Iterable[Dict[str, Any]]) -> int:
+        """
+        Append trips to the segments of their start time
+
+        Each segment receives one write per call so concurrent appenders
+        do not interleave partial lines.
+
+        Args:
+            trips: MDS trips
+
+        Returns:
+            Number of trips appended
+        """
+        by_segment: Dict[int, List[str]] = {}
+        for trip in trips:
+            if self.membership is not None:
+                trip = self._classify(dict(trip))
+            segment = self.segment_start(int(trip['start_time']))
+            by_segment.setdefault(segment, []).append(json.dumps(trip, separators=(',', ':')))
+
+        for segment, lines in by_segment.items():
+            with open(self._segment_path(segment), 'a') as f:
+                f.write('\n'.join(lines) + '\n')
+        return sum(len(lines) for lines in by_segment.values())
+
+    def _classify(self, trip: Dict[str, Any]) -> Dict[str, Any]:
+        points = [location['coordinates'] for location in (trip.get('start_location'), trip.get('end_location'))
+                  if location]
+        points.extend((trip.get('route') or {}).get('coordinates') or [])
+        trip[AGENCIES_KEY] = sorted(self.membership.agencies_along(point[:2] for point in points))
+        return trip
+
+    def _in_agency(self, trip: Dict[str, Any], agency_id: str) -> bool:
+        if AGENCIES_KEY not in trip:
+            # Appended without a membership index
+            if self.membership is None:
+                return False
+            self._classify(trip)
+        return agency_id in trip[AGENCIES_KEY]
+
+    def query(self, start_ms: int, end_ms: int, device_id: Optional[str] = None,
+              agency_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Trips that started in [start_ms, end_ms]
+
+        Args:
+            start_ms: Range start (inclusive)
+            end_ms: Range end (inclusive)
+            device_id: Only return trips of this device
+            agency_id: Only return trips touching this agency's jurisdiction
+
+        Returns:
+            Trips ordered by start_time, one per trip_id
+        """
+        trips: Dict[str, Dict[str, Any]] = {}
+        for segment in self.segments():
+            if segment + self.segment_ms <= start_ms or segment > end_ms:
+                continue
+            for trip in self._read_segment(segment):
+                if start_ms <= trip['start_time'] <= end_ms and (device_id is None or trip['device_id'] == device_id):
+                    trips[trip['trip_id']] = trip
+        if agency_id is not None:
+            trips = {trip_id: trip for trip_id, trip in trips.items() if self._in_agency(trip, agency_id)}
+        for trip in trips.values():
+            trip.pop(AGENCIES_KEY, None)
+        return sorted(trips.values(), key=lambda trip: trip['start_time'])
+
+    def _read_segment(self, segment: int) -> Iterator[Dict[str, Any]]:
+        try:
+            f = open(self._segment_path(segment))
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                # A line without its newline is still being appended
+                if not line.endswith('\n'):
+                    break
+                if line.strip():
+                    yield json.loads(line)
+
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        """Assembler state saved by the previous run, or None"""
+        try:
+            with open(os.path.join(self.root_dir, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save_state(self, state: Dict[str, Any]):
+        """
+        Replace the saved assembler state
+
+        Args:
+            state: TripAssembler.snapshot()
+        """
+        path = os.path.join(self.root_dir, STATE_FILE)
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(f"{path}.tmp", path)
+
+    def apply_retention(self, now_ms: int, retention_ms: int) -> Dict[str, Any]:
+        """
+        Delete segments that ended before now_ms - retention_ms
+
+        Args:
+            now_ms: Current time in Unix milliseconds
+            retention_ms: How long to keep trips
+
+        Returns:
+            Retention metrics
+        """
+        cutoff = now_ms - retention_ms
+        metrics = {'segments_deleted': 0, 'bytes_reclaimed': 0}
+        for segment in self.segments():
+            if segment + self.segment_ms > cutoff:
+                continue
+            path = self._segment_path(segment)
+            metrics['bytes_reclaimed'] += os.path.getsize(path)
+            os.remove(path)
+            metrics['segments_deleted'] += 1
+        return metrics
@@ -9,6 +9,8 @@ import logging
 from datetime import datetime, timezone
 from typing import Dict, Any
 
+from mds_shared.warmup import Warmer, is_warmup_event
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -29,6 +31,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         API Gateway proxy response with API status
     """
+    if is_warmup_event(event):
+        return warmer.warm()
+    
     try:
         logger.info(f"Status request: {json.dumps(event, default=str)}")
         
@@ -175,4 +180,9 @@ def check_external_services() -> Dict[str, bool]:
         'mapping_service': True  # Check mapping/geocoding service
     }
     
-    return services
\ No newline at end of file
+    return services
+
+# Warm-up steps run on scheduled pings, or during init when PREWARM_ON_INIT is set
+warmer = Warmer('status')
+warmer.register('database_health', check_database_health)
+warmer.warm_on_init()
@@ -10,7 +10,17 @@ import boto3
 from datetime import datetime, timezone, timedelta
 from typing import Dict, Any, List, Optional
 from decimal import Decimal
-import uuid
+
+from mds_shared.warmup import Warmer, is_warmup_event
+from mds_shared.formats import negotiate_format, encode_body, NotAcceptableError
+from mds_shared.records import TripRecord
+from mds_shared.spillover import spill_if_oversized
+from mds_shared.query_cache import cached_query
+from mds_shared.jurisdictions import get_agency_id, get_membership_index, UnmappedAgencyError
+from mds_shared.fetch import fetch_all, Query, QueryTimeoutError
+from mds_shared.db import use_database, execute_hot_query
+from mds_shared.profiling import is_profile_report_event, get_profiler, profile_request, profile_step, profiled
+from mds_shared.trip_store import TripStore
 
 # Configure logging
 logger = logging.getLogger()
@@ -21,10 +31,16 @@ DB_SECRET_ARN = os.environ.get('DB_SECRET_ARN')
 MDS_VERSION = os.environ.get('MDS_VERSION', '2.0.2')
 PROVIDER_ID = os.environ.get('PROVIDER_ID')
 PROVIDER_NAME = os.environ.get('PROVIDER_NAME', 'Circuit Mobility Provider')
+QUERY_CACHE_TTL = int(os.environ.get('QUERY_CACHE_TTL', 300))
+TRIP_STORE_DIR = os.environ.get('TRIP_STORE_DIR')
+TRIP_ACCURACY_METERS = int(os.environ.get('TRIP_ACCURACY_METERS', 10))
 
 # AWS clients
 secrets_client = boto3.client('secretsmanager')
 
+# Opened on first use; holds the trips assembled by the compaction function
+_trip_store: Optional[TripStore] = None
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Handle GET /trips request
@@ -36,6 +52,11 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         API Gateway proxy response
     """
+    if is_warmup_event(event):
+        return warmer.warm()
+    if is_profile_report_event(event):
+        return get_profiler().report()
+    
     try:
         logger.info(f"Trips request: {json.dumps(event, default=str)}")
         
@@ -46,6 +67,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         bbox = query_params.get('bbox')
         device_id = query_params.get('device_id')
         
+        # Scope results to the jurisdiction of the calling agency
+        agency_id = get_agency_id(event)
+        
         # Validate required parameters
         if not start_time:
             return {
@@ -60,13 +84,26 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
         
-        # Get trips data
-        trips_data = get_trips(
-            start_time=start_time,
-            end_time=end_time,
-            bbox=bbox,
-            device_id=device_id
-        )
+        # Negotiate output format (JSON, NDJSON or Arrow)
+        output_format = negotiate_format(event)
+        
+        # Get trips data, shared across containers polled with the same parameters
+        params = {'start_time': start_time, 'end_time': end_time, 'bbox': bbox, 'device_id': device_id,
+                  'agency_id': agency_id}
+        with profile_request('trips', params):
+            trips_data, cache_status = cached_query(
+                'trips',
+                params,
+                lambda: get_trips(
+                    start_time=start_time,
+                    end_time=end_time,
+                    bbox=bbox,
+                    device_id=device_id,
+                    agency_id=agency_id
+                ),
+                ttl_seconds=QUERY_CACHE_TTL,
+                default=decimal_default
+            )
         
         # Build MDS compliant response
         response_data = {
@@ -78,19 +115,61 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'ttl': 3600  # Time to live in seconds
         }
         
+        encoded = encode_body(response_data, 'trips', output_format, default=decimal_default)
         response = {
             'statusCode': 200,
             'headers': {
-                'Content-Type': 'application/json',
+                **encoded['headers'],
                 'Access-Control-Allow-Origin': '*',
-                'Cache-Control': 'max-age=3600'
+                'Cache-Control': 'max-age=3600',
+                'X-Cache': cache_status
             },
-            'body': json.dumps(response_data, default=decimal_default)
+            'body': encoded['body'],
+            'isBase64Encoded': encoded['isBase64Encoded']
         }
         
-        logger.info(f"Returning {len(trips_data)} trips")
-        return response
+        logger.info(f"Returning {len(trips_data)} trips as {output_format}")
+        return spill_if_oversized(response, 'trips')
         
+    except NotAcceptableError as e:
+        logger.warning(f"Unsupported Accept header: {str(e)}")
+        return {
+            'statusCode': 406,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Not Acceptable',
+                'message': str(e)
+            })
+        }
+    except QueryTimeoutError as e:
+        logger.error(f"Trips query timed out: {str(e)}")
+        return {
+            'statusCode': 504,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Gateway Timeout',
+                'message': 'Trips query timed out'
+            })
+        }
+    except UnmappedAgencyError as e:
+        logger.warning(f"Refused request: {str(e)}")
+        return {
+            'statusCode': 403,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Forbidden',
+                'message': str(e)
+            })
+        }
     except ValueError as e:
         logger.warning(f"Invalid request parameters: {str(e)}")
         return {
@@ -119,15 +198,17 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 def get_trips(start_time: str, end_time: Optional[str] = None, 
-              bbox: Optional[str] = None, device_id: Optional[str] = None) -> List[Dict[str, Any]]:
+              bbox: Optional[str] = None, device_id: Optional[str] = None,
+              agency_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """
-    Get trips data from database or generate sample data
+    Get trips data from the database or the trip store
     
     Args:
         start_time: Unix timestamp for start of time range
         end_time: Unix timestamp for end of time range (optional)
         bbox: Bounding box filter (min_lon,min_lat,max_lon,max_lat)
         device_id: Specific device ID to filter by
+        agency_id: Only return trips touching this agency's jurisdiction
         
     Returns:
         List of trips in MDS format
@@ -143,114 +224,164 @@ def get_trips(start_time: str, end_time: Optional[str] = None,
     except ValueError:
         raise ValueError("Invalid timestamp format")
     
-    # For demo purposes, return sample data
-    # In production, this would query the database
-    sample_trips = [
-        {
-            'provider_id': PROVIDER_ID,
-            'data_provider_id': PROVIDER_ID,
-            'device_id': 'vehicle_001',
-            'trip_id': str(uuid.uuid4()),
-            'trip_duration': 1245,  # seconds
-            'trip_distance': 2340,  # meters
-            'route': {
-                'type': 'LineString',
-                'coordinates': [
-                    [-122.4194, 37.7749],
-                    [-122.4184, 37.7759],
-                    [-122.4174, 37.7769],
-                    [-122.4164, 37.7779]
-                ]
-            },
-            'accuracy': 15,
-            'start_time': start_timestamp + 3600000,  # 1 hour after start
-            'end_time': start_timestamp + 4845000,    # start + duration
-            'publication_time': start_timestamp + 4845000,
-            'start_location': {
-                'type': 'Point',
-                'coordinates': [-122.4194, 37.7749]
-            },
-            'end_location': {
-                'type': 'Point',
-                'coordinates': [-122.4164, 37.7779]
-            },
-            'parking_verification_url': 'https://example.com/parking/trip_123',
-            'standard_cost': 450,  # cents
-            'actual_cost': 400,    # cents
-            'currency': 'USD',
-            'trip_attributes': {
-                'accessibility_type': None,
-                'surface_type': 'paved_smooth'
-            }
-        },
-        {
-            'provider_id': PROVIDER_ID,
-            'data_provider_id': PROVIDER_ID,
-            'device_id': 'vehicle_002',
-            'trip_id': str(uuid.uuid4()),
-            'trip_duration': 892,   # seconds
-            'trip_distance': 1580,  # meters
-            'route': {
-                'type': 'LineString',
-                'coordinates': [
-                    [-122.4094, 37.7849],
-                    [-122.4084, 37.7859],
-                    [-122.4074, 37.7869]
-                ]
-            },
-            'accuracy': 12,
-            'start_time': start_timestamp + 7200000,  # 2 hours after start
-            'end_time': start_timestamp + 8092000,    # start + duration
-            'publication_time': start_timestamp + 8092000,
-            'start_location': {
-                'type': 'Point',
-                'coordinates': [-122.4094, 37.7849]
-            },
-            'end_location': {
-                'type': 'Point',
-                'coordinates': [-122.4074, 37.7869]
-            },
-            'standard_cost': 320,  # cents
-            'actual_cost': 320,    # cents
-            'currency': 'USD',
-            'trip_attributes': {
-                'accessibility_type': 'wheelchair_accessible',
-                'surface_type': 'paved_smooth'
-            }
-        }
+    # Trips, routes, costs and attributes are independent queries over the same
+    # time range, so they run concurrently and are joined by trip_id
+    tables = fetch_all([
+        Query('trips', lambda: query_trips(start_timestamp, end_timestamp, agency_id)),
+        Query('routes', lambda: query_trip_routes(start_timestamp, end_timestamp)),
+        Query('costs', lambda: query_trip_costs(start_timestamp, end_timestamp), required=False, default={}),
+        Query('attributes', lambda: query_trip_attributes(start_timestamp, end_timestamp), required=False, default={})
+    ])
+    
+    trip_records = [
+        TripRecord.from_mds(join_trip(row, tables['routes'], tables['costs'], tables['attributes']))
+        for row in tables['trips']
     ]
     
     # Filter by time range
-    filtered_trips = []
-    for trip in sample_trips:
-        if start_timestamp <= trip['start_time'] <= end_timestamp:
-            filtered_trips.append(trip)
+    with profile_step('trips.time_filter', len(trip_records)) as step:
+        filtered_trips = []
+        for trip in trip_records:
+            if start_timestamp <= trip.start_time <= end_timestamp:
+                filtered_trips.append(trip)
+        step.returned = len(filtered_trips)
     
     # Apply bbox filter if provided
     if bbox:
         try:
             min_lon, min_lat, max_lon, max_lat = map(float, bbox.split(','))
-            bbox_filtered = []
-            for trip in filtered_trips:
-                start_lon, start_lat = trip['start_location']['coordinates']
-                end_lon, end_lat = trip['end_location']['coordinates']
-                
-                # Check if either start or end point is within bbox
-                if ((min_lon <= start_lon <= max_lon and min_lat <= start_lat <= max_lat) or
-                    (min_lon <= end_lon <= max_lon and min_lat <= end_lat <= max_lat)):
-                    bbox_filtered.append(trip)
-            filtered_trips = bbox_filtered
+            with profile_step('trips.bbox_filter', len(filtered_trips)) as step:
+                bbox_filtered = []
+                for trip in filtered_trips:
+                    # Check if either start or end point is within bbox
+                    if ((min_lon <= trip.start_lon <= max_lon and min_lat <= trip.start_lat <= max_lat) or
+                        (min_lon <= trip.end_lon <= max_lon and min_lat <= trip.end_lat <= max_lat)):
+                        bbox_filtered.append(trip)
+                filtered_trips = bbox_filtered
+                step.returned = len(filtered_trips)
         except (ValueError, IndexError):
             logger.warning(f"Invalid bbox format: {bbox}")
     
     # Apply device_id filter if provided
     if device_id:
-        filtered_trips = [trip for trip in filtered_trips if trip['device_id'] == device_id]
+        with profile_step('trips.device_filter', len(filtered_trips)) as step:
+            filtered_trips = [trip for trip in filtered_trips if trip.device_id == device_id]
+            step.returned = len(filtered_trips)
+    
+    # The trip store has already scoped its trips. Database rows are indexed the
+    # first time this container loads them, then scoped by set lookup.
+    if agency_id and use_database():
+        membership = get_membership_index()
+        for trip in filtered_trips:
+            membership.add_trip(trip.trip_id, trip.points())
+        members = membership.trip_ids(agency_id)
+        with profile_step('trips.agency_filter', len(filtered_trips)) as step:
+            filtered_trips = [trip for trip in filtered_trips if trip.trip_id in members]
+            step.returned = len(filtered_trips)
+    
+    # Convert to MDS dicts only for serialization
+    return [trip.to_mds() for trip in filtered_trips]
+
+@profiled('trips.query_trips')
+def query_trips(start_timestamp: int, end_timestamp: int, agency_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Query trip rows (without route, costs or attributes) for a time range
+    
+    Args:
+        start_timestamp: Range start
+        end_timestamp: Range end
+        agency_id: Only trips touching this agency's jurisdiction (trip store only;
+            get_trips() scopes database rows)
+    
+    Returns:
+        Trip rows
+    """
+    if use_database():
+        return execute_hot_query('trips_by_time', (PROVIDER_ID, start_timestamp, end_timestamp, TRIP_ACCURACY_METERS))
+    
+    # Assembled trips are stored whole, so these rows already carry their route
+    store = get_trip_store()
+    return store.query(start_timestamp, end_timestamp, agency_id=agency_id) if store is not None else []
+
+@profiled('trips.query_trip_routes')
+def query_trip_routes(start_timestamp: int, end_timestamp: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Query trip routes for a time range
+    
+    Returns:
+        GeoJSON LineString routes keyed by trip_id
+    """
+    if use_database():
+        rows = execute_hot_query('trip_routes_by_time', (PROVIDER_ID, start_timestamp, end_timestamp))
+        return {row['trip_id']: row['route'] for row in rows}
+    
+    return {}
+
+@profiled('trips.query_trip_costs')
+def query_trip_costs(start_timestamp: int, end_timestamp: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Query trip costs for a time range
+    
+    Returns:
+        standard_cost, actual_cost and currency keyed by trip_id
+    """
+    if use_database():
+        rows = execute_hot_query('trip_costs_by_time', (PROVIDER_ID, start_timestamp, end_timestamp))
+        return {row.pop('trip_id'): row for row in rows}
     
-    return filtered_trips
+    # The trip assembler does not price trips
+    return {}
+
+@profiled('trips.query_trip_attributes')
+def query_trip_attributes(start_timestamp: int, end_timestamp: int) -> Dict[str, Dict[str, Any]]:
+    """
+    Query trip attributes for a time range
+    
+    Returns:
+        trip_attributes keyed by trip_id
+    """
+    # Trip attributes have no table in the schema yet, and the trip assembler does not derive them
+    return {}
+
+def join_trip(row: Dict[str, Any], routes: Dict[str, Dict[str, Any]], costs: Dict[str, Dict[str, Any]],
+              attributes: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Assemble an MDS trip from its row and the per-trip results of the other queries
+    
+    Args:
+        row: Trip row
+        routes: Routes keyed by trip_id
+        costs: Costs keyed by trip_id
+        attributes: Trip attributes keyed by trip_id
+        
+    Returns:
+        Trip in MDS format
+    """
+    trip_id = row['trip_id']
+    trip = dict(row)
+    trip['route'] = routes.get(trip_id) or row.get('route') or {
+        'type': 'LineString',
+        'coordinates': [row['start_location']['coordinates'], row['end_location']['coordinates']]
+    }
+    trip.update(costs.get(trip_id, {}))
+    if trip_id in attributes:
+        trip['trip_attributes'] = attributes[trip_id]
+    return trip
+
+def get_trip_store() -> Optional[TripStore]:
+    """Return the trip store, or None when TRIP_STORE_DIR is not configured"""
+    global _trip_store
+    if _trip_store is None and TRIP_STORE_DIR:
+        _trip_store = TripStore(TRIP_STORE_DIR, membership=get_membership_index())
+    return _trip_store
 
 def decimal_default(obj):
     """JSON serializer for objects not serializable by default json code"""
     if isinstance(obj, Decimal):
         return float(obj)
-    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
\ No newline at end of file
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+# Warm-up steps run on scheduled pings, or during init when PREWARM_ON_INIT is set
+warmer = Warmer('trips')
+warmer.register('query_path', lambda: get_trips(start_time='0', end_time='0'))
+warmer.warm_on_init()
@@ -0,0 +1,134 @@
+"""
+Circuit Provider API Vehicle Cell Index
+Precomputed map-tile cells for aggregated /vehicles responses
+
+Every vehicle's Web Mercator tile is computed once at MAX_ZOOM; a coarser
+zoom is just a bit shift of those coordinates, so counts for any
+resolution are built from the index without touching coordinates again
+and are cached per resolution for the lifetime of the fleet snapshot.
+"""
+
+import math
+from array import array
+from typing import Dict, Any, List, Optional, Tuple
+
+from mds_shared.records import VehicleRecord, VEHICLE_TYPES, VEHICLE_STATES
+
+MAX_ZOOM = 20
+MAX_LATITUDE = 85.05112878
+
+def tile_xy(lon: float, lat: float, zoom: int) -> Tuple[int, int]:
+    """
+    Web Mercator tile containing a point
+
+    Args:
+        lon: Longitude in degrees
+        lat: Latitude in degrees
+        zoom: Tile zoom level
+
+    Returns:
+        (x, y) tile coordinates
+    """
+    n = 1 << zoom
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = int((lon + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def tile_bbox(x: int, y: int, zoom: int) -> List[float]:
+    """
+    Bounds of a tile
+
+    Returns:
+        [min_lon, min_lat, max_lon, max_lat]
+    """
+    n = 1 << zoom
+
+    def lat_of(row: int) -> float:
+        return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+
+    return [
+        round(x / n * 360.0 - 180.0, 6),
+        round(lat_of(y + 1), 6),
+        round((x + 1) / n * 360.0 - 180.0, 6),
+        round(lat_of(y), 6)
+    ]
+
+class CellIndex:
+    """Tile index over a fleet snapshot with per-resolution count caches"""
+
+    def __init__(self, fleet: List[VehicleRecord]):
+        self.fleet = fleet
+        self.xs = array('L')
+        self.ys = array('L')
+        self.type_codes = array('H')
+        self.state_codes = array('H')
+        for vehicle in fleet:
+            if vehicle.lon is None:
+                continue
+            x, y = tile_xy(vehicle.lon, vehicle.lat, MAX_ZOOM)
+            self.xs.append(x)
+            self.ys.append(y)
+            self.type_codes.append(vehicle.vehicle_type_code)
+            self.state_codes.append(vehicle.vehicle_state_code)
+        self._counts: Dict[int, Dict[Tuple[int, int], Dict[Tuple[int, int], int]]] = {}
+
+    def counts(self, zoom: int) -> Dict[Tuple[int, int], Dict[Tuple[int, int], int]]:
+        """
+        Vehicle counts per cell at a zoom level, cached per zoom
+
+        Args:
+            zoom: Resolution (0..MAX_ZOOM)
+
+        Returns:
+            Mapping of (x, y) to counts keyed by (type code, state code)
+        """
+        cells = self._counts.get(zoom)
+        if cells is None:
+            shift = MAX_ZOOM - zoom
+            cells = {}
+            for x, y, type_code, state_code in zip(self.xs, self.ys, self.type_codes, self.state_codes):
+                cell = cells.setdefault((x >> shift, y >> shift), {})
+                key = (type_code, state_code)
+                cell[key] = cell.get(key, 0) + 1
+            self._counts[zoom] = cells
+        return cells
+
+    def aggregate(self, zoom: int, bbox: Optional[Tuple[float, float, float, float]] = None) -> List[Dict[str, Any]]:
+        """
+        Aggregated cells for a zoom level, optionally limited to a bbox
+
+        Cells intersecting the bbox are returned whole, so edge cells may
+        count vehicles just outside it.
+
+        Args:
+            zoom: Resolution (0..MAX_ZOOM)
+            bbox: (min_lon, min_lat, max_lon, max_lat)
+
+        Returns:
+            Cells with total count and counts by vehicle_type and vehicle_state
+        """
+        cells = self.counts(zoom)
+        if bbox:
+            min_lon, min_lat, max_lon, max_lat = bbox
+            min_x, min_y = tile_xy(min_lon, max_lat, zoom)
+            max_x, max_y = tile_xy(max_lon, min_lat, zoom)
+        else:
+            min_x = min_y = 0
+            max_x = max_y = (1 << zoom) - 1
+
+        result = []
+        for (x, y), cell in sorted(cells.items()):
+            if not (min_x <= x <= max_x and min_y <= y <= max_y):
+                continue
+            counts: Dict[str, Dict[str, int]] = {}
+            for (type_code, state_code), count in cell.items():
+                by_state = counts.setdefault(VEHICLE_TYPES.value(type_code), {})
+                by_state[VEHICLE_STATES.value(state_code)] = count
+            result.append({
+                'cell': f"{zoom}/{x}/{y}",
+                'bbox': tile_bbox(x, y, zoom),
+                'count': sum(cell.values()),
+                'counts': counts
+            })
+        return result
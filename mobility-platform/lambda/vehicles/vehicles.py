@@ -6,11 +6,23 @@ Returns real-time vehicle status data compliant with MDS 2.0
 import json
 import os
 import logging
+import time
 import boto3
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from decimal import Decimal
 
+from mds_shared.warmup import Warmer, is_warmup_event
+from mds_shared.records import VehicleRecord
+from mds_shared.spillover import spill_if_oversized
+from mds_shared.query_cache import cached_query
+from mds_shared.jurisdictions import get_agency_id, get_membership_index, UnmappedAgencyError
+from mds_shared.db import use_database, execute_hot_query, get_db_credentials
+from mds_shared.profiling import is_profile_report_event, get_profiler, profile_request, profile_step, profiled
+from mds_shared.telemetry_store import TelemetryStore
+
+from cell_index import CellIndex, MAX_ZOOM
+
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
@@ -20,10 +32,24 @@ DB_SECRET_ARN = os.environ.get('DB_SECRET_ARN')
 MDS_VERSION = os.environ.get('MDS_VERSION', '2.0.2')
 PROVIDER_ID = os.environ.get('PROVIDER_ID')
 PROVIDER_NAME = os.environ.get('PROVIDER_NAME', 'Circuit Mobility Provider')
+QUERY_CACHE_TTL = int(os.environ.get('QUERY_CACHE_TTL', 30))
+# Never longer than the 300 s ttl advertised in responses
+FLEET_CACHE_TTL = min(int(os.environ.get('FLEET_CACHE_TTL', 60)), 300)
+TELEMETRY_STORE_DIR = os.environ.get('TELEMETRY_STORE_DIR')
+TELEMETRY_MAX_POINTS = int(os.environ.get('TELEMETRY_MAX_POINTS', 5000))
 
 # AWS clients
 secrets_client = boto3.client('secretsmanager')
 
+# Fleet snapshot as (loaded_at, compact records), reloaded after FLEET_CACHE_TTL seconds
+_fleet_cache: Optional[Tuple[float, List[VehicleRecord]]] = None
+
+# Cell indexes for aggregated responses, per agency, with the fleet snapshot they cover
+_cell_indexes: Dict[Optional[str], Tuple[List[VehicleRecord], CellIndex]] = {}
+
+# Opened on first use; reads pick the coarsest tier that satisfies the requested interval
+_telemetry_store: Optional[TelemetryStore] = None
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Handle GET /vehicles request
@@ -35,6 +61,11 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         API Gateway proxy response
     """
+    if is_warmup_event(event):
+        return warmer.warm()
+    if is_profile_report_event(event):
+        return get_profiler().report()
+    
     try:
         logger.info(f"Vehicles request: {json.dumps(event, default=str)}")
         
@@ -42,19 +73,77 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         query_params = event.get('queryStringParameters') or {}
         bbox = query_params.get('bbox')
         last_updated = query_params.get('last_updated')
+        aggregate = query_params.get('aggregate')
+        start_time = query_params.get('start_time')
         
-        # Get vehicles data
-        vehicles_data = get_vehicles(bbox=bbox, last_updated=last_updated)
+        # Scope results to the jurisdiction of the calling agency
+        agency_id = get_agency_id(event)
         
-        # Build MDS compliant response
-        response_data = {
-            'version': MDS_VERSION,
-            'data': {
-                'vehicles': vehicles_data
-            },
-            'last_updated': int(datetime.now(timezone.utc).timestamp() * 1000),
-            'ttl': 300  # Time to live in seconds
-        }
+        if aggregate:
+            # Counts per map cell instead of individual vehicles
+            resolution = query_params.get('resolution')
+            with profile_request('vehicles', {'aggregate': aggregate, 'resolution': resolution,
+                                              'bbox': bbox, 'agency_id': agency_id}):
+                cells_data = get_vehicle_cells(
+                    aggregate=aggregate,
+                    resolution=resolution,
+                    bbox=bbox,
+                    agency_id=agency_id
+                )
+            response_data = {
+                'version': MDS_VERSION,
+                'data': {
+                    'cells': cells_data
+                },
+                'last_updated': int(datetime.now(timezone.utc).timestamp() * 1000),
+                'ttl': 300  # Time to live in seconds
+            }
+            vehicles_data = cells_data
+            cache_status = None
+            result_kind = 'cells'
+        elif start_time:
+            # Telemetry history of one vehicle instead of current status
+            params = {'device_id': query_params.get('device_id'), 'start_time': start_time,
+                      'end_time': query_params.get('end_time'), 'interval': query_params.get('interval'),
+                      'agency_id': agency_id}
+            with profile_request('vehicles', params):
+                history_data, cache_status = cached_query(
+                    'vehicle_history',
+                    params,
+                    lambda: get_vehicle_history(**params),
+                    ttl_seconds=QUERY_CACHE_TTL,
+                    default=decimal_default
+                )
+            response_data = {
+                'version': MDS_VERSION,
+                'data': history_data,
+                'last_updated': int(datetime.now(timezone.utc).timestamp() * 1000),
+                'ttl': 300  # Time to live in seconds
+            }
+            vehicles_data = history_data['points']
+            result_kind = 'history points'
+        else:
+            # Get vehicles data, shared across containers polled with the same parameters
+            params = {'bbox': bbox, 'last_updated': last_updated, 'agency_id': agency_id}
+            with profile_request('vehicles', params):
+                vehicles_data, cache_status = cached_query(
+                    'vehicles',
+                    params,
+                    lambda: get_vehicles(bbox=bbox, last_updated=last_updated, agency_id=agency_id),
+                    ttl_seconds=QUERY_CACHE_TTL,
+                    default=decimal_default
+                )
+            
+            # Build MDS compliant response
+            response_data = {
+                'version': MDS_VERSION,
+                'data': {
+                    'vehicles': vehicles_data
+                },
+                'last_updated': int(datetime.now(timezone.utc).timestamp() * 1000),
+                'ttl': 300  # Time to live in seconds
+            }
+            result_kind = 'vehicles'
         
         response = {
             'statusCode': 200,
@@ -65,10 +154,38 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             },
             'body': json.dumps(response_data, default=decimal_default)
         }
+        if cache_status:
+            response['headers']['X-Cache'] = cache_status
         
-        logger.info(f"Returning {len(vehicles_data)} vehicles")
-        return response
+        logger.info(f"Returning {len(vehicles_data)} {result_kind}")
+        return spill_if_oversized(response, 'vehicles')
         
+    except UnmappedAgencyError as e:
+        logger.warning(f"Refused request: {str(e)}")
+        return {
+            'statusCode': 403,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Forbidden',
+                'message': str(e)
+            })
+        }
+    except ValueError as e:
+        logger.warning(f"Invalid request parameters: {str(e)}")
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+            },
+            'body': json.dumps({
+                'error': 'Bad Request',
+                'message': str(e)
+            })
+        }
     except Exception as e:
         logger.error(f"Error processing vehicles request: {str(e)}")
         return {
@@ -83,19 +200,217 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             })
         }
 
-def get_vehicles(bbox: Optional[str] = None, last_updated: Optional[str] = None) -> List[Dict[str, Any]]:
+def get_vehicles(bbox: Optional[str] = None, last_updated: Optional[str] = None,
+                 agency_id: Optional[str] = None) -> List[Dict[str, Any]]:
     """
     Get vehicles data from database or generate sample data
     
     Args:
         bbox: Bounding box filter (min_lon,min_lat,max_lon,max_lat)
         last_updated: Unix timestamp for filtering by last update time
+        agency_id: Only return vehicles inside this agency's jurisdiction
         
     Returns:
         List of vehicles in MDS format
     """
+    vehicles = get_fleet()
+    
+    # Jurisdiction membership is precomputed, so scoping is a set lookup
+    if agency_id:
+        members = get_membership_index().vehicle_ids(agency_id)
+        with profile_step('vehicles.agency_filter', len(vehicles)) as step:
+            vehicles = [vehicle for vehicle in vehicles if vehicle.device_id in members]
+            step.returned = len(vehicles)
+    
+    # Apply bbox filter if provided
+    if bbox:
+        try:
+            min_lon, min_lat, max_lon, max_lat = map(float, bbox.split(','))
+            with profile_step('vehicles.bbox_filter', len(vehicles)) as step:
+                vehicles = [
+                    vehicle for vehicle in vehicles
+                    if vehicle.lon is not None and
+                    min_lon <= vehicle.lon <= max_lon and min_lat <= vehicle.lat <= max_lat
+                ]
+                step.returned = len(vehicles)
+        except (ValueError, IndexError):
+            logger.warning(f"Invalid bbox format: {bbox}")
+    
+    # Apply last_updated filter if provided
+    if last_updated:
+        try:
+            last_updated_timestamp = int(last_updated)
+            with profile_step('vehicles.last_updated_filter', len(vehicles)) as step:
+                vehicles = [vehicle for vehicle in vehicles if vehicle.last_event_time >= last_updated_timestamp]
+                step.returned = len(vehicles)
+        except ValueError:
+            logger.warning(f"Invalid last_updated format: {last_updated}")
+    
+    # Convert to MDS dicts only for serialization
+    return [vehicle.to_mds() for vehicle in vehicles]
+
+def get_vehicle_cells(aggregate: str, resolution: Optional[str] = None,
+                      bbox: Optional[str] = None, agency_id: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Get vehicle counts per map cell from the precomputed cell index
+    
+    Args:
+        aggregate: Aggregation mode (only 'cells' is supported)
+        resolution: Web Mercator zoom level of the cells (0-20)
+        bbox: Bounding box filter (min_lon,min_lat,max_lon,max_lat)
+        agency_id: Only count vehicles inside this agency's jurisdiction
+        
+    Returns:
+        List of cells with counts by vehicle_type and vehicle_state
+    """
+    if aggregate != 'cells':
+        raise ValueError("aggregate must be 'cells'")
+    try:
+        zoom = int(resolution)
+    except (TypeError, ValueError):
+        raise ValueError(f"resolution must be an integer zoom level between 0 and {MAX_ZOOM}")
+    if not 0 <= zoom <= MAX_ZOOM:
+        raise ValueError(f"resolution must be an integer zoom level between 0 and {MAX_ZOOM}")
+    
+    bounds = None
+    if bbox:
+        try:
+            bounds = tuple(map(float, bbox.split(',')))
+        except ValueError:
+            bounds = ()
+        if len(bounds) != 4:
+            raise ValueError("bbox must be min_lon,min_lat,max_lon,max_lat")
+    
+    with profile_step('vehicles.cell_aggregate') as step:
+        cells = get_cell_index(agency_id).aggregate(zoom, bounds)
+        step.returned = len(cells)
+    return cells
+
+def get_vehicle_history(device_id: Optional[str], start_time: str, end_time: Optional[str] = None,
+                        interval: Optional[str] = None, agency_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Get the position and battery history of one vehicle from the telemetry store
+    
+    Args:
+        device_id: Vehicle device id (required)
+        start_time: Unix timestamp for start of time range
+        end_time: Unix timestamp for end of time range (optional)
+        interval: Widest acceptable spacing between points in seconds (raw points if unset)
+        agency_id: Only return points inside this agency's jurisdiction
+        
+    Returns:
+        device_id, the tier read, the effective resolution and the points
+    """
+    if not device_id:
+        raise ValueError("device_id is required with start_time")
+    try:
+        start_timestamp = int(start_time)
+        if end_time:
+            end_timestamp = int(end_time)
+        else:
+            # Default to current time if end_time not provided
+            end_timestamp = int(datetime.now(timezone.utc).timestamp() * 1000)
+    except ValueError:
+        raise ValueError("Invalid timestamp format")
+    if end_timestamp < start_timestamp:
+        raise ValueError("end_time must not be before start_time")
+    try:
+        interval_ms = int(interval) * 1000 if interval else 0
+    except ValueError:
+        raise ValueError("interval must be a whole number of seconds")
+    if interval_ms < 0:
+        raise ValueError("interval must be a whole number of seconds")
+    
+    store = get_telemetry_store()
+    if store is None:
+        return {'device_id': device_id, 'tier': None, 'resolution_ms': interval_ms, 'points': []}
+    
+    # Long ranges are answered at a coarser resolution rather than with unbounded points.
+    # Past positions may lie outside the jurisdiction even if the vehicle is inside it now,
+    # so points are scoped by the agencies recorded with each of them.
+    with profile_step('vehicles.telemetry_query') as step:
+        history = store.query(device_id, start_timestamp, end_timestamp, interval_ms,
+                              max_points=TELEMETRY_MAX_POINTS, agency_id=agency_id)
+        step.returned = len(history['points'])
+    
+    return {'device_id': device_id, **history}
+
+def get_telemetry_store() -> Optional[TelemetryStore]:
+    """Return the telemetry store, or None when TELEMETRY_STORE_DIR is not configured"""
+    global _telemetry_store
+    if _telemetry_store is None and TELEMETRY_STORE_DIR:
+        _telemetry_store = TelemetryStore(TELEMETRY_STORE_DIR, membership=get_membership_index())
+    return _telemetry_store
+
+def get_cell_index(agency_id: Optional[str] = None) -> CellIndex:
+    """
+    Get the cell index for the current fleet snapshot, building it on first use
+    after each fleet reload
+    
+    Args:
+        agency_id: Index only vehicles inside this agency's jurisdiction
+        
+    Returns:
+        Cell index with per-resolution count caches
+    """
+    fleet = get_fleet()
+    cached = _cell_indexes.get(agency_id)
+    if cached is None or cached[0] is not fleet:
+        vehicles = fleet
+        if agency_id:
+            members = get_membership_index().vehicle_ids(agency_id)
+            vehicles = [vehicle for vehicle in fleet if vehicle.device_id in members]
+        cached = _cell_indexes[agency_id] = (fleet, CellIndex(vehicles))
+    return cached[1]
+
+def warm_cell_indexes():
+    """
+    Build the cell index each agency's requests read: one per configured
+    jurisdiction, or the unscoped index when none are configured
+    """
+    for agency_id in sorted(get_membership_index().jurisdictions) or [None]:
+        get_cell_index(agency_id)
+
+def get_fleet() -> List[VehicleRecord]:
+    """
+    Get the fleet snapshot, reloading it once it is older than FLEET_CACHE_TTL
+    
+    Jurisdiction membership is updated from each reload, and cell indexes
+    built from the previous snapshot are dropped.
+    
+    Returns:
+        List of compact vehicle records
+    """
+    global _fleet_cache
+    if _fleet_cache is not None and time.time() - _fleet_cache[0] < FLEET_CACHE_TTL:
+        return _fleet_cache[1]
+    
+    fleet = [VehicleRecord.from_mds(vehicle) for vehicle in load_fleet()]
+    membership = get_membership_index()
+    for vehicle in fleet:
+        membership.update_vehicle(vehicle.device_id, vehicle.lon, vehicle.lat)
+    if _fleet_cache is not None:
+        current = {vehicle.device_id for vehicle in fleet}
+        for vehicle in _fleet_cache[1]:
+            if vehicle.device_id not in current:
+                membership.remove_vehicle(vehicle.device_id)
+    _cell_indexes.clear()
+    _fleet_cache = (time.time(), fleet)
+    logger.info(f"Loaded {len(fleet)} vehicles into fleet cache")
+    return fleet
+
+@profiled('vehicles.load_fleet')
+def load_fleet() -> List[Dict[str, Any]]:
+    """
+    Load the current fleet from database or generate sample data
+    
+    Returns:
+        List of vehicles in MDS format
+    """
+    if use_database():
+        return execute_hot_query('vehicles_current', (PROVIDER_ID,))
+    
     # For demo purposes, return sample data
-    # In production, this would query the database
     sample_vehicles = [
         {
             'device_id': 'vehicle_001',
@@ -207,31 +522,6 @@ def get_vehicles(bbox: Optional[str] = None, last_updated: Optional[str] = None)
         }
     ]
     
-    # Apply bbox filter if provided
-    if bbox:
-        try:
-            min_lon, min_lat, max_lon, max_lat = map(float, bbox.split(','))
-            filtered_vehicles = []
-            for vehicle in sample_vehicles:
-                lon, lat = vehicle['current_location']['coordinates']
-                if min_lon <= lon <= max_lon and min_lat <= lat <= max_lat:
-                    filtered_vehicles.append(vehicle)
-            sample_vehicles = filtered_vehicles
-        except (ValueError, IndexError):
-            logger.warning(f"Invalid bbox format: {bbox}")
-    
-    # Apply last_updated filter if provided
-    if last_updated:
-        try:
-            last_updated_timestamp = int(last_updated)
-            filtered_vehicles = []
-            for vehicle in sample_vehicles:
-                if vehicle['last_event_time'] >= last_updated_timestamp:
-                    filtered_vehicles.append(vehicle)
-            sample_vehicles = filtered_vehicles
-        except ValueError:
-            logger.warning(f"Invalid last_updated format: {last_updated}")
-    
     return sample_vehicles
 
 def decimal_default(obj):
@@ -240,31 +530,9 @@ def decimal_default(obj):
         return float(obj)
     raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
 
-def get_db_connection():
-    """
-    Get database connection using credentials from Secrets Manager
-    
-    Returns:
-        Database connection object
-    """
-    try:
-        # Get database credentials from Secrets Manager
-        response = secrets_client.get_secret_value(SecretId=DB_SECRET_ARN)
-        secret = json.loads(response['SecretString'])
-        
-        # In a real implementation, you would establish a database connection here
-        # import psycopg2
-        # conn = psycopg2.connect(
-        #     host=secret['host'],
-        #     port=secret['port'],
-        #     database=secret['dbname'],
-        #     user=secret['username'],
-        #     password=secret['password']
-        # )
-        # return conn
-        
-        return None  # Placeholder for demo
-        
-    except Exception as e:
-        logger.error(f"Failed to get database connection: {str(e)}")
-        raise
\ No newline at end of file
+# Warm-up steps run on scheduled pings, or during init when PREWARM_ON_INIT is set
+warmer = Warmer('vehicles')
+warmer.register('db_credentials', get_db_credentials)
+warmer.register('fleet_cache', get_fleet)
+warmer.register('cell_indexes', warm_cell_indexes)
+warmer.warm_on_init()
@@ -229,6 +229,31 @@ resource "aws_db_instance" "mds_database" {
   }
 }
 
+locals {
+  # Replicas are only read when the functions query the database
+  db_replica_count = coalesce(var.db_replica_count, var.data_source == "database" ? 1 : 0)
+}
+
+# Read replicas for the read-mostly endpoint queries
+resource "aws_db_instance" "mds_replica" {
+  count               = local.db_replica_count
+  identifier          = "${var.project_name}-replica-${count.index + 1}"
+  replicate_source_db = aws_db_instance.mds_database.identifier
+  instance_class      = coalesce(var.db_replica_instance_class, var.db_instance_class)
+  storage_encrypted   = true
+
+  vpc_security_group_ids = [aws_security_group.rds_sg.id]
+
+  backup_retention_period = 0
+  skip_final_snapshot     = true
+
+  performance_insights_enabled = true
+
+  tags = {
+    Name = "${var.project_name}-replica-${count.index + 1}"
+  }
+}
+
 # Secrets Manager for database credentials
 resource "aws_secretsmanager_secret" "db_credentials" {
   name = "${var.project_name}-db-credentials"
@@ -250,6 +275,151 @@ resource "aws_secretsmanager_secret_version" "db_credentials" {
   })
 }
 
+# S3 bucket for oversized API responses (served via presigned URLs)
+resource "aws_s3_bucket" "response_artifacts" {
+  bucket_prefix = "${var.project_name}-artifacts-"
+  force_destroy = var.environment == "dev" ? true : false
+
+  tags = {
+    Name = "${var.project_name}-response-artifacts"
+  }
+}
+
+resource "aws_s3_bucket_public_access_block" "response_artifacts" {
+  bucket = aws_s3_bucket.response_artifacts.id
+
+  block_public_acls       = true
+  block_public_policy     = true
+  ignore_public_acls      = true
+  restrict_public_buckets = true
+}
+
+resource "aws_s3_bucket_server_side_encryption_configuration" "response_artifacts" {
+  bucket = aws_s3_bucket.response_artifacts.id
+
+  rule {
+    apply_server_side_encryption_by_default {
+      sse_algorithm = "AES256"
+    }
+  }
+}
+
+resource "aws_s3_bucket_lifecycle_configuration" "response_artifacts" {
+  bucket = aws_s3_bucket.response_artifacts.id
+
+  rule {
+    id     = "expire-response-artifacts"
+    status = "Enabled"
+
+    filter {}
+
+    expiration {
+      days = var.artifact_retention_days
+    }
+  }
+}
+
+# Redis query result cache shared by the endpoint functions
+resource "aws_elasticache_subnet_group" "query_cache" {
+  count      = var.enable_query_cache ? 1 : 0
+  name       = "${var.project_name}-query-cache"
+  subnet_ids = aws_subnet.private_subnet[*].id
+}
+
+resource "aws_security_group" "query_cache_sg" {
+  count       = var.enable_query_cache ? 1 : 0
+  name_prefix = "${var.project_name}-query-cache-"
+  vpc_id      = aws_vpc.mds_vpc.id
+
+  ingress {
+    from_port       = 6379
+    to_port         = 6379
+    protocol        = "tcp"
+    security_groups = [aws_security_group.lambda_sg.id]
+  }
+
+  tags = {
+    Name = "${var.project_name}-query-cache-sg"
+  }
+}
+
+resource "aws_elasticache_cluster" "query_cache" {
+  count                = var.enable_query_cache ? 1 : 0
+  cluster_id           = "${var.project_name}-query-cache"
+  engine               = "redis"
+  node_type            = var.query_cache_node_type
+  num_cache_nodes      = 1
+  parameter_group_name = "default.redis7"
+  port                 = 6379
+  subnet_group_name    = aws_elasticache_subnet_group.query_cache[0].name
+  security_group_ids   = [aws_security_group.query_cache_sg[0].id]
+
+  tags = {
+    Name = "${var.project_name}-query-cache"
+  }
+}
+
+locals {
+  # Empty when disabled, which turns the cache off in the functions
+  query_cache_url = var.enable_query_cache ? "redis://${aws_elasticache_cluster.query_cache[0].cache_nodes[0].address}:6379/0" : ""
+}
+
+# EFS file system for the event store (hot and compacted tiers)
+resource "aws_efs_file_system" "event_store" {
+  creation_token = "${var.project_name}-event-store"
+  encrypted      = true
+
+  tags = {
+    Name = "${var.project_name}-event-store"
+  }
+}
+
+resource "aws_security_group" "efs_sg" {
+  name_prefix = "${var.project_name}-efs-"
+  vpc_id      = aws_vpc.mds_vpc.id
+
+  ingress {
+    from_port       = 2049
+    to_port         = 2049
+    protocol        = "tcp"
+    security_groups = [aws_security_group.lambda_sg.id]
+  }
+
+  tags = {
+    Name = "${var.project_name}-efs-sg"
+  }
+}
+
+resource "aws_efs_mount_target" "event_store" {
+  count           = length(aws_subnet.private_subnet)
+  file_system_id  = aws_efs_file_system.event_store.id
+  subnet_id       = aws_subnet.private_subnet[count.index].id
+  security_groups = [aws_security_group.efs_sg.id]
+}
+
+resource "aws_efs_access_point" "event_store" {
+  file_system_id = aws_efs_file_system.event_store.id
+
+  posix_user {
+    uid = 1000
+    gid = 1000
+  }
+
+  root_directory {
+    path = "/event-store"
+
+    creation_info {
+      owner_uid   = 1000
+      owner_gid   = 1000
+      permissions = "750"
+    }
+  }
+
+  tags = {
+    Name = "${var.project_name}-event-store"
+  }
+}
+
 # IAM Role for Lambda
 resource "aws_iam_role" "lambda_role" {
   name = "${var.project_name}-lambda-role"
@@ -302,6 +472,27 @@ resource "aws_iam_role_policy" "lambda_policy" {
           "secretsmanager:GetSecretValue"
         ]
         Resource = aws_secretsmanager_secret.db_credentials.arn
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "s3:PutObject",
+          "s3:GetObject"
+        ]
+        Resource = "${aws_s3_bucket.response_artifacts.arn}/*"
+      },
+      {
+        Effect = "Allow"
+        Action = [
+          "elasticfilesystem:ClientMount",
+          "elasticfilesystem:ClientWrite"
+        ]
+        Resource = aws_efs_file_system.event_store.arn
+        Condition = {
+          StringEquals = {
+            "elasticfilesystem:AccessPointArn" = aws_efs_access_point.event_store.arn
+          }
+        }
       }
     ]
   })
@@ -317,6 +508,9 @@ resource "aws_api_gateway_rest_api" "mds_api" {
   name        = "${var.project_name}-api"
   description = "MDS 2.0 Provider API compliant with OMF specifications"
 
+  # Arrow IPC bulk responses are returned base64 encoded by the Lambda proxy
+  binary_media_types = ["application/vnd.apache.arrow.stream"]
+
   endpoint_configuration {
     types = ["REGIONAL"]
   }
@@ -27,6 +27,12 @@ output "database_endpoint" {
   sensitive   = true
 }
 
+output "database_replica_endpoints" {
+  description = "RDS read replica endpoints"
+  value       = aws_db_instance.mds_replica[*].endpoint
+  sensitive   = true
+}
+
 output "database_port" {
   description = "RDS PostgreSQL database port"
   value       = aws_db_instance.mds_database.port
@@ -55,15 +61,31 @@ output "public_subnet_ids" {
 output "lambda_functions" {
   description = "Lambda function ARNs"
   value = {
-    auth     = aws_lambda_function.auth_lambda.arn
-    vehicles = aws_lambda_function.vehicles_lambda.arn
-    trips    = aws_lambda_function.trips_lambda.arn
-    events   = aws_lambda_function.events_lambda.arn
-    reports  = aws_lambda_function.reports_lambda.arn
-    status   = aws_lambda_function.status_lambda.arn
+    auth       = aws_lambda_function.auth_lambda.arn
+    vehicles   = aws_lambda_function.vehicles_lambda.arn
+    trips      = aws_lambda_function.trips_lambda.arn
+    events     = aws_lambda_function.events_lambda.arn
+    reports    = aws_lambda_function.reports_lambda.arn
+    status     = aws_lambda_function.status_lambda.arn
+    compaction = aws_lambda_function.compaction_lambda.arn
   }
 }
 
+output "response_artifacts_bucket" {
+  description = "S3 bucket holding oversized API responses"
+  value       = aws_s3_bucket.response_artifacts.id
+}
+
+output "query_cache_endpoint" {
+  description = "Redis endpoint of the shared query cache (if enabled)"
+  value       = var.enable_query_cache ? aws_elasticache_cluster.query_cache[0].cache_nodes[0].address : null
+}
+
+output "event_store_file_system_id" {
+  description = "EFS file system holding the event store"
+  value       = aws_efs_file_system.event_store.id
+}
+
 output "secrets_manager_secret_arn" {
   description = "ARN of the Secrets Manager secret containing database credentials"
   value       = aws_secretsmanager_secret.db_credentials.arn
@@ -95,6 +117,7 @@ output "cloudwatch_log_groups" {
     events      = aws_cloudwatch_log_group.events_lambda_logs.name
     reports     = aws_cloudwatch_log_group.reports_lambda_logs.name
     status      = aws_cloudwatch_log_group.status_lambda_logs.name
+    compaction  = aws_cloudwatch_log_group.compaction_lambda_logs.name
   }
 }
 
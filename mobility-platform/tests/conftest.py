@@ -0,0 +1,10 @@
+"""
+Circuit Provider API Tests
+Puts the shared layer on sys.path, as the Lambda runtime does
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'lambda', 'shared', 'python'))
@@ -0,0 +1,63 @@
+"""
+Tests for the vehicles function's cell index
+"""
+
+import os
+import sys
+
+import pytest
+
+# The cell index ships with the vehicles function rather than the shared layer
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lambda', 'vehicles'))
+
+from cell_index import MAX_ZOOM, CellIndex, tile_bbox, tile_xy
+from mds_shared.records import VehicleRecord
+
+SAN_FRANCISCO = (-122.4194, 37.7749)
+
+def vehicle(device_id, lon, lat, vehicle_type='scooter', vehicle_state='available'):
+    return VehicleRecord.from_mds({
+        'device_id': device_id, 'vehicle_type': vehicle_type, 'vehicle_state': vehicle_state,
+        'current_location': {'type': 'Point', 'coordinates': [lon, lat]} if lon is not None else None
+    })
+
+def test_tile_xy_known_tiles():
+    assert tile_xy(0.0, 0.0, 0) == (0, 0)
+    assert tile_xy(0.0, 0.0, 1) == (1, 1)
+    assert tile_xy(-0.1, 0.1, 1) == (0, 0)
+    assert tile_xy(*SAN_FRANCISCO, 12) == (655, 1583)
+
+def test_tile_xy_clamps_to_the_map():
+    assert tile_xy(180.0, 90.0, 3) == (7, 0)
+    assert tile_xy(-180.0, -90.0, 3) == (0, 7)
+    assert tile_xy(-200.0, 0.0, 3)[0] == 0
+
+@pytest.mark.parametrize('zoom', [0, 5, 12, MAX_ZOOM])
+def test_tile_bbox_contains_the_point(zoom):
+    min_lon, min_lat, max_lon, max_lat = tile_bbox(*tile_xy(*SAN_FRANCISCO, zoom), zoom)
+    assert min_lon <= SAN_FRANCISCO[0] <= max_lon
+    assert min_lat <= SAN_FRANCISCO[1] <= max_lat
+
+@pytest.mark.parametrize('zoom', [0, 1, 8, 15, MAX_ZOOM])
+def test_coarser_tiles_are_a_shift_of_the_max_zoom_tile(zoom):
+    x, y = tile_xy(*SAN_FRANCISCO, MAX_ZOOM)
+    assert (x >> (MAX_ZOOM - zoom), y >> (MAX_ZOOM - zoom)) == tile_xy(*SAN_FRANCISCO, zoom)
+
+def test_aggregate_counts_by_type_and_state():
+    index = CellIndex([
+        vehicle('v1', -122.4194, 37.7749),
+        vehicle('v2', -122.4195, 37.7750, vehicle_state='reserved'),
+        vehicle('v3', -122.4195, 37.7750, vehicle_type='bicycle'),
+        vehicle('v4', 2.35, 48.85),
+        vehicle('v5', None, None)
+    ])
+    cells = index.aggregate(12)
+    # Cells are ordered by tile x, then y
+    assert [cell['count'] for cell in cells] == [3, 1]
+    san_francisco = cells[0]
+    assert san_francisco['cell'] == '12/655/1583'
+    assert san_francisco['counts'] == {'scooter': {'available': 1, 'reserved': 1}, 'bicycle': {'available': 1}}
+
+    # Only cells intersecting the bbox are returned
+    assert [cell['cell'] for cell in index.aggregate(12, (-123.0, 37.0, -122.0, 38.0))] == ['12/655/1583']
+    assert index.aggregate(0)[0]['count'] == 4
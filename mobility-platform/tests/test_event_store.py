@@ -0,0 +1,96 @@
+"""
+Tests for mds_shared.event_store
+"""
+
+import json
+import os
+
+from mds_shared.event_store import EventStore
+
+SEGMENT_MS = 1000
+
+def event(device_id, timestamp):
+    return {'device_id': device_id, 'timestamp': timestamp, 'event_types': ['located']}
+
+def store(tmp_path, **kwargs):
+    return EventStore(str(tmp_path), segment_ms=SEGMENT_MS, **kwargs)
+
+def hot_dir(tmp_path):
+    return os.path.join(str(tmp_path), 'hot')
+
+def test_compaction_commits_a_generation_through_the_index(tmp_path):
+    events = store(tmp_path, block_size=2)
+    events.append([event('d2', 100), event('d1', 300), event('d1', 200)])
+
+    result = events.compact_segment(0)
+    assert result['events'] == 3
+    assert os.listdir(hot_dir(tmp_path)) == []
+    index = json.load(open(os.path.join(str(tmp_path), 'compacted', '0.idx.json')))
+    assert index['generation'] == 1 and index['data_file'] == '0.1.ndjson.gz'
+    assert [(block['devices'], block['min_ts'], block['max_ts']) for block in index['blocks']] == [
+        (['d1'], 200, 300), (['d2'], 100, 100)]
+
+    # Late events are merged into the next generation, which supersedes the first
+    events.append([event('d3', 150)])
+    assert events.compact_segment(0)['events'] == 4
+    assert sorted(os.listdir(os.path.join(str(tmp_path), 'compacted'))) == ['0.2.ndjson.gz', '0.idx.json']
+    assert [e['timestamp'] for e in events.query(0, SEGMENT_MS)] == [100, 150, 200, 300]
+
+def test_compacting_files_the_index_covers_are_ignored(tmp_path):
+    events = store(tmp_path)
+    events.append([event('d1', 100)])
+    events.compact_segment(0)
+
+    # A crash after the index switch leaves the renamed hot file behind
+    with open(os.path.join(hot_dir(tmp_path), '0.1.compacting'), 'w') as f:
+        f.write(json.dumps(event('d1', 100)) + '\n')
+    assert len(events.query(0, SEGMENT_MS)) == 1
+    events.compact_segment(0)
+    assert os.listdir(hot_dir(tmp_path)) == []
+    assert len(events.query(0, SEGMENT_MS)) == 1
+
+def test_query_merges_hot_and_compacted_tiers(tmp_path):
+    events = store(tmp_path)
+    events.append([event('d1', 100), event('d2', 1100)])
+    events.compact_segment(0)
+    events.append([event('d2', 50), event('d1', 1200), event('d1', 2100)])
+
+    assert [(e['device_id'], e['timestamp']) for e in events.query(0, 3000)] == [
+        ('d2', 50), ('d1', 100), ('d2', 1100), ('d1', 1200), ('d1', 2100)]
+    assert [e['timestamp'] for e in events.query(0, 3000, device_id='d1')] == [100, 1200, 2100]
+    assert [e['timestamp'] for e in events.query(100, 1100)] == [100, 1100]
+
+def test_hot_reads_skip_a_line_still_being_written(tmp_path):
+    events = store(tmp_path)
+    events.append([event('d1', 100)])
+    with open(os.path.join(hot_dir(tmp_path), '0.ndjson'), 'a') as f:
+        f.write('{"device_id": "d1", "times')
+    assert [e['timestamp'] for e in events.query(0, SEGMENT_MS)] == [100]
+
+def test_compaction_waits_for_a_line_still_being_written(tmp_path):
+    events = store(tmp_path)
+    events.append([event('d1', 100)])
+    path = os.path.join(hot_dir(tmp_path), '0.ndjson')
+    with open(path, 'a') as f:
+        f.write('{"device_id": "d1", ')
+
+    metrics = events.compact(now_ms=10 * SEGMENT_MS, grace_ms=0)
+    assert metrics['segments_compacted'] == 0
+    assert os.listdir(hot_dir(tmp_path)) == ['0.1.compacting']
+
+    # The appender finishes its write into the renamed file
+    with open(os.path.join(hot_dir(tmp_path), '0.1.compacting'), 'a') as f:
+        f.write('"timestamp": 200, "event_types": ["located"]}\n')
+    metrics = events.compact(now_ms=10 * SEGMENT_MS, grace_ms=0)
+    assert metrics['segments_compacted'] == 1 and metrics['events_compacted'] == 2
+    assert [e['timestamp'] for e in events.query(0, SEGMENT_MS)] == [100, 200]
+
+def test_compact_probes_a_device_from_the_first_closed_segment(tmp_path):
+    events = store(tmp_path)
+    events.append([event('d1', 100), event('d2', 1100)])
+    assert events._sample_device(0) == 'd1'
+    assert events._sample_device(5000) is None
+
+    metrics = events.compact(now_ms=SEGMENT_MS + 500, grace_ms=0)
+    assert metrics['segments_compacted'] == 1
+    assert metrics['query_ms_before'] is not None and metrics['query_ms_after'] is not None
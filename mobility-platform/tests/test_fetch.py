@@ -0,0 +1,63 @@
+"""
+Tests for mds_shared.fetch
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from mds_shared import fetch
+from mds_shared.fetch import PoolExhaustedError, Query, QueryTimeoutError, abandoned_workers, fetch_all
+
+@pytest.fixture
+def pool(monkeypatch):
+    executor = ThreadPoolExecutor(max_workers=2)
+    monkeypatch.setattr(fetch, 'FETCH_MAX_WORKERS', 2)
+    monkeypatch.setattr(fetch, '_executor', executor)
+    yield executor
+    executor.shutdown(wait=True)
+
+def test_results_and_optional_defaults(pool):
+    def fail():
+        raise RuntimeError('boom')
+
+    assert fetch_all([
+        Query('a', lambda: 1),
+        Query('b', fail, required=False, default=[])
+    ]) == {'a': 1, 'b': []}
+    with pytest.raises(RuntimeError):
+        fetch_all([Query('b', fail)])
+
+def test_timed_out_workers_are_tracked_until_they_return(pool):
+    release = threading.Event()
+    assert fetch_all([Query('slow', lambda: release.wait(5), timeout_ms=20, required=False, default='late')]) == {
+        'slow': 'late'}
+    assert abandoned_workers() == 1
+    with pytest.raises(QueryTimeoutError):
+        fetch_all([Query('slow', lambda: release.wait(5), timeout_ms=20)])
+    assert abandoned_workers() == 2
+
+    # Every worker is held: queries fail at once instead of queueing
+    with pytest.raises(PoolExhaustedError):
+        fetch_all([Query('fast', lambda: 1)])
+    assert fetch_all([Query('fast', lambda: 1, required=False, default=0)]) == {'fast': 0}
+
+    release.set()
+    pool.shutdown(wait=True)
+    assert abandoned_workers() == 0
+
+def test_queued_query_that_times_out_is_cancelled(pool):
+    release = threading.Event()
+    ran = []
+    results = fetch_all([
+        Query('first', lambda: release.wait(5), timeout_ms=50, required=False),
+        Query('second', lambda: release.wait(5), timeout_ms=50, required=False),
+        Query('queued', lambda: ran.append(1), timeout_ms=20, required=False, default='skipped')
+    ])
+    assert results['queued'] == 'skipped'
+    # Only the two running queries hold workers
+    assert abandoned_workers() == 2
+    release.set()
+    pool.shutdown(wait=True)
+    assert ran == [] and abandoned_workers() == 0
@@ -0,0 +1,82 @@
+"""
+Tests for mds_shared.formats
+"""
+
+import base64
+import json
+import sys
+from decimal import Decimal
+
+import pytest
+
+from mds_shared.formats import (
+    FORMAT_ARROW, FORMAT_JSON, FORMAT_NDJSON, NotAcceptableError, encode_arrow, encode_body, negotiate_format
+)
+
+def request(accept=None, header='Accept'):
+    return {'headers': {header: accept} if accept is not None else None}
+
+def response(records):
+    return {'version': '2.0.2', 'last_updated': 1700000000000, 'data': {'trips': records}}
+
+@pytest.mark.parametrize('accept, expected', [
+    (None, FORMAT_JSON),
+    ('', FORMAT_JSON),
+    ('*/*', FORMAT_JSON),
+    ('application/vnd.mds+json', FORMAT_JSON),
+    ('application/x-ndjson', FORMAT_NDJSON),
+    ('Application/VND.Apache.Arrow.Stream', FORMAT_ARROW),
+    ('application/json;q=0.5, application/x-ndjson', FORMAT_NDJSON),
+    ('application/x-ndjson;q=0.2, application/vnd.apache.arrow.stream;q=0.9', FORMAT_ARROW),
+    # Equal q values keep the client's order
+    ('application/x-ndjson, application/json', FORMAT_NDJSON),
+    ('text/html, application/*;q=0.1', FORMAT_JSON),
+    ('application/vnd.apache.arrow.stream;q=0, application/json', FORMAT_JSON),
+    ('application/x-ndjson;q=bogus, application/json;q=0.1', FORMAT_JSON)
+])
+def test_negotiate_format(accept, expected):
+    assert negotiate_format(request(accept)) == expected
+
+def test_negotiate_format_reads_headers_case_insensitively():
+    assert negotiate_format(request('application/x-ndjson', header='accept')) == FORMAT_NDJSON
+
+def test_negotiate_format_rejects_unsupported_types():
+    with pytest.raises(NotAcceptableError):
+        negotiate_format(request('text/csv, application/xml;q=0.5'))
+    with pytest.raises(NotAcceptableError):
+        negotiate_format(request('application/json;q=0'))
+
+def test_json_keeps_the_envelope_and_ndjson_moves_it_to_headers():
+    data = response([{'trip_id': 't1', 'cost': Decimal('1.5')}, {'trip_id': 't2'}])
+    default = lambda obj: float(obj)
+
+    encoded = encode_body(data, 'trips', FORMAT_JSON, default)
+    assert json.loads(encoded['body'])['data']['trips'][0]['cost'] == 1.5
+    assert encoded['headers']['Vary'] == 'Accept' and not encoded['isBase64Encoded']
+
+    encoded = encode_body(data, 'trips', FORMAT_NDJSON, default)
+    assert [json.loads(line)['trip_id'] for line in encoded['body'].splitlines()] == ['t1', 't2']
+    assert encoded['headers']['X-MDS-Version'] == '2.0.2'
+    assert encoded['headers']['X-MDS-Last-Updated'] == '1700000000000'
+
+def test_arrow_without_pyarrow_is_not_acceptable(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'pyarrow', None)
+    with pytest.raises(NotAcceptableError):
+        encode_arrow([{'trip_id': 't1'}])
+
+def test_arrow_stream_keeps_every_field_of_every_record():
+    pa = pytest.importorskip('pyarrow')
+    records = [
+        {'trip_id': 't1', 'start_location': {'type': 'Point', 'coordinates': [1.0, 2.0]}},
+        {'trip_id': 't2', 'trip_ids': ['a'], 'cost': Decimal('2.5'),
+         'start_location': {'type': 'Point', 'coordinates': [3.0, 4.0], 'altitude': 9.0}}
+    ]
+    encoded = encode_body(response(records), 'trips', FORMAT_ARROW, default=lambda obj: float(obj))
+    assert encoded['isBase64Encoded']
+
+    table = pa.ipc.open_stream(base64.b64decode(encoded['body'])).read_all()
+    assert table.column_names == ['trip_id', 'start_location', 'trip_ids', 'cost']
+    rows = table.to_pylist()
+    assert rows[0]['trip_ids'] is None and rows[1]['cost'] == 2.5
+    assert rows[0]['start_location'] == {'type': 'Point', 'coordinates': [1.0, 2.0], 'altitude': None}
+    assert rows[1]['start_location']['altitude'] == 9.0
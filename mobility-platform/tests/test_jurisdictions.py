@@ -0,0 +1,162 @@
+"""
+Tests for mds_shared.jurisdictions and agency scoping in the stores
+"""
+
+import json
+import os
+
+import pytest
+
+from mds_shared.jurisdictions import (
+    Jurisdiction, MembershipIndex, UnmappedAgencyError, get_agency_id
+)
+from mds_shared.event_store import EventStore
+from mds_shared.telemetry_store import TelemetryStore, Tier
+from mds_shared.trip_store import TripStore
+
+SQUARE = {'type': 'Polygon', 'coordinates': [[[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]]]}
+WITH_HOLE = {'type': 'Polygon', 'coordinates': [
+    [[0, 0], [10, 0], [10, 10], [0, 10], [0, 0]],
+    [[4, 4], [6, 4], [6, 6], [4, 6], [4, 4]]
+]}
+EAST = {'type': 'Polygon', 'coordinates': [[[20, 0], [30, 0], [30, 10], [20, 10], [20, 0]]]}
+
+def membership():
+    return MembershipIndex([Jurisdiction('west', SQUARE), Jurisdiction('east', EAST)])
+
+def test_contains_polygon_and_bbox():
+    square = Jurisdiction('a', SQUARE)
+    assert square.contains(5, 5)
+    assert not square.contains(15, 5)
+    assert not square.contains(-1, 5)
+    assert square.bbox == (0, 0, 10, 10)
+
+def test_contains_excludes_holes():
+    holed = Jurisdiction('a', WITH_HOLE)
+    assert holed.contains(2, 2)
+    assert not holed.contains(5, 5)
+
+def test_contains_multipolygon():
+    multi = Jurisdiction('a', {'type': 'MultiPolygon', 'coordinates': [SQUARE['coordinates'], EAST['coordinates']]})
+    assert multi.contains(5, 5) and multi.contains(25, 5)
+    assert not multi.contains(15, 5)
+
+def test_unsupported_geometry():
+    with pytest.raises(ValueError):
+        Jurisdiction('a', {'type': 'Point', 'coordinates': [0, 0]})
+
+def test_get_agency_id():
+    assert get_agency_id({}) is None
+    assert get_agency_id({'requestContext': {'authorizer': {'agency_id': 'west'}}}) == 'west'
+    with pytest.raises(UnmappedAgencyError):
+        get_agency_id({'requestContext': {'authorizer': {'principalId': 'x'}}})
+
+def test_vehicle_membership_follows_position():
+    index = membership()
+    index.update_vehicle('v1', 5, 5)
+    assert index.vehicle_ids('west') == {'v1'}
+    index.update_vehicle('v1', 25, 5)
+    assert index.vehicle_ids('west') == set() and index.vehicle_ids('east') == {'v1'}
+    index.update_vehicle('v1', None, None)
+    assert index.vehicle_ids('east') == set()
+    index.update_vehicle('v2', 5, 5)
+    index.remove_vehicle('v2')
+    assert index.vehicle_ids('west') == set()
+    assert index.vehicle_ids('unknown') == set()
+
+def test_trip_and_event_membership_is_bounded():
+    index = MembershipIndex([Jurisdiction('west', SQUARE), Jurisdiction('east', EAST)], max_trips=2, max_events=1)
+    index.add_trip('t1', [(5, 5), (25, 5)])
+    index.add_trip('t2', [(15, 5)])
+    assert index.trip_ids('west') == {'t1'} and index.trip_ids('east') == {'t1'}
+    index.add_trip('t3', [(5, 5)])
+    assert index.trip_ids('west') == {'t3'}
+
+    index.add_event('e1', 5, 5)
+    index.add_event('e2', 25, 5)
+    assert index.event_ids('west') == set() and index.event_ids('east') == {'e2'}
+
+def test_event_store_scopes_by_agencies_recorded_on_append(tmp_path):
+    index = membership()
+    store = EventStore(str(tmp_path), membership=index)
+    events = [
+        {'device_id': 'd1', 'timestamp': 1000, 'event_types': ['located'],
+         'event_location': {'type': 'Point', 'coordinates': [5, 5, 12.0]}},
+        {'device_id': 'd2', 'timestamp': 2000, 'event_types': ['located'],
+         'event_location': {'type': 'Point', 'coordinates': [25, 5]}}
+    ]
+    store.append(events)
+    assert all('_agencies' in json.loads(line) for line in open(os.path.join(str(tmp_path), 'hot', '0.ndjson')))
+
+    # Recorded membership is used as is; the jurisdictions are not consulted again
+    index.jurisdictions.clear()
+    assert [e['device_id'] for e in store.query(0, 10 ** 6, agency_id='west')] == ['d1']
+    assert [e['device_id'] for e in store.query(0, 10 ** 6, agency_id='east')] == ['d2']
+    assert store.query(0, 10 ** 6, agency_id='nowhere') == []
+    assert all('_agencies' not in e for e in store.query(0, 10 ** 6))
+
+def test_event_store_compaction_classifies_and_indexes_blocks(tmp_path):
+    EventStore(str(tmp_path)).append([
+        {'device_id': f"d{i}", 'timestamp': 1000 + i, 'event_types': ['located'],
+         'event_location': {'type': 'Point', 'coordinates': [5 if i < 2 else 25, 5]}}
+        for i in range(4)
+    ])
+    store = EventStore(str(tmp_path), block_size=2, membership=membership())
+    store.compact_segment(0)
+    index = json.load(open(os.path.join(str(tmp_path), 'compacted', '0.idx.json')))
+    assert [block['agencies'] for block in index['blocks']] == [['west'], ['east']]
+    assert [e['device_id'] for e in store.query(0, 10 ** 6, agency_id='east')] == ['d2', 'd3']
+
+    # Recorded agencies need no membership index to read; unrecorded events
+    # match no agency without one
+    assert len(EventStore(str(tmp_path)).query(0, 10 ** 6, agency_id='west')) == 2
+    unclassified = tmp_path / 'plain'
+    EventStore(str(unclassified)).append([{'device_id': 'd1', 'timestamp': 1, 'event_location': {
+        'type': 'Point', 'coordinates': [5, 5]}}])
+    assert EventStore(str(unclassified)).query(0, 10, agency_id='west') == []
+    assert len(EventStore(str(unclassified), membership=membership()).query(0, 10, agency_id='west')) == 1
+
+def test_telemetry_store_scopes_points_by_mask(tmp_path):
+    tiers = [Tier('raw', 0, 3600 * 1000, 10 ** 12), Tier('1m', 60000, 86400 * 1000, 10 ** 12)]
+    store = TelemetryStore(str(tmp_path), tiers, membership=membership())
+    points = [
+        {'device_id': 'd1', 'timestamp': 1000, 'lon': 5.0, 'lat': 5.0, 'battery_percent': 80},
+        {'device_id': 'd1', 'timestamp': 2000, 'lon': 25.0, 'lat': 5.0, 'battery_percent': 79},
+        {'device_id': 'd1', 'timestamp': 61000, 'lon': 5.0, 'lat': 5.0, 'battery_percent': 78}
+    ]
+    store.append(points)
+    now = 10 ** 9
+
+    def timestamps(agency_id, resolution_ms=0):
+        history = store.query('d1', 0, 120000, resolution_ms, now_ms=now, agency_id=agency_id)
+        return [point['timestamp'] for point in history['points']]
+
+    assert timestamps('west') == [1000, 61000]
+    assert timestamps('east') == [2000]
+    assert timestamps('nowhere') == []
+
+    # Masks survive rollup; a bucket takes the mask of its last position
+    store.rollup(now, grace_ms=0)
+    assert timestamps('west') == [1000, 61000]
+    assert timestamps('west', 60000) == [60000]
+    assert timestamps('east', 60000) == [0]
+
+    # A store whose agency order differs reads the masks remapped
+    reordered = MembershipIndex([Jurisdiction('east', EAST), Jurisdiction('middle', SQUARE),
+                                 Jurisdiction('west', SQUARE)])
+    other = TelemetryStore(str(tmp_path), tiers, membership=reordered)
+    history = other.query('d1', 0, 120000, now_ms=now, agency_id='east')
+    assert [point['timestamp'] for point in history['points']] == [2000]
+
+def test_trip_store_scopes_by_agencies_recorded_on_append(tmp_path):
+    store = TripStore(str(tmp_path), membership=membership())
+    trip = {
+        'trip_id': 't1', 'device_id': 'd1', 'start_time': 1000,
+        'start_location': {'type': 'Point', 'coordinates': [5, 5]},
+        'end_location': {'type': 'Point', 'coordinates': [6, 6]},
+        'route': {'type': 'LineString', 'coordinates': [[5, 5], [25, 5], [6, 6]]}
+    }
+    store.append([trip])
+    assert [t['trip_id'] for t in store.query(0, 10 ** 6, agency_id='east')] == ['t1']
+    assert store.query(0, 10 ** 6, agency_id='nowhere') == []
+    assert '_agencies' not in store.query(0, 10 ** 6)[0]
@@ -0,0 +1,96 @@
+"""
+Tests for mds_shared.query_cache
+"""
+
+import threading
+
+from mds_shared.query_cache import (
+    CACHE_BYPASS, CACHE_COALESCED, CACHE_HIT, CACHE_MISS, CACHE_STALE,
+    FileCacheBackend, QueryCache, normalize_params
+)
+
+class ObservedBackend(FileCacheBackend):
+    """File backend that signals when a lock is found held"""
+
+    def __init__(self, root_dir):
+        super().__init__(root_dir)
+        self.contended = threading.Event()
+
+    def acquire(self, key, token, ttl_ms):
+        acquired = super().acquire(key, token, ttl_ms)
+        if not acquired:
+            self.contended.set()
+        return acquired
+
+class BrokenBackend:
+    def get(self, key):
+        raise ConnectionError('unreachable')
+
+def test_normalize_params():
+    assert normalize_params({
+        'bbox': ' -122.40,37.7,-122.3,37.80 ',
+        'start_time': '1700000000000',
+        'device_id': '0012',
+        'agency_id': '',
+        'end_time': None
+    }) == {'bbox': '-122.4,37.7,-122.3,37.8', 'start_time': '1700000000000.0', 'device_id': '0012'}
+    # Unparseable numbers are kept as given
+    assert normalize_params({'start_time': 'yesterday'}) == {'start_time': 'yesterday'}
+
+def test_equivalent_params_share_a_key(tmp_path):
+    cache = QueryCache(FileCacheBackend(str(tmp_path)))
+    key = cache.make_key('vehicles', {'bbox': '-122.40,37.7,-122.3,37.8'})
+    assert cache.make_key('vehicles', {'bbox': '-122.4,37.70,-122.30,37.8', 'device_id': ''}) == key
+    assert cache.make_key('trips', {'bbox': '-122.4,37.7,-122.3,37.8'}) != key
+    assert cache.make_key('vehicles', {'device_id': '12'}) != cache.make_key('vehicles', {'device_id': '0012'})
+
+def test_hit_after_miss(tmp_path):
+    cache = QueryCache(FileCacheBackend(str(tmp_path)))
+    calls = []
+    compute = lambda: calls.append(1) or ['row']
+    assert cache.get_or_compute('vehicles', {}, compute, ttl_seconds=60) == (['row'], CACHE_MISS)
+    assert cache.get_or_compute('vehicles', {}, compute, ttl_seconds=60) == (['row'], CACHE_HIT)
+    assert len(calls) == 1
+
+def test_concurrent_misses_run_the_query_once(tmp_path):
+    backend = ObservedBackend(str(tmp_path))
+    started, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return ['row']
+
+    results = {}
+    leader = threading.Thread(target=lambda: results.update(
+        leader=QueryCache(backend).get_or_compute('vehicles', {}, slow_compute, ttl_seconds=60)))
+    leader.start()
+    started.wait(5)
+
+    # A second container finds the key locked and waits for the leader's result
+    follower = threading.Thread(target=lambda: results.update(
+        follower=QueryCache(backend, wait_ms=5000).get_or_compute('vehicles', {}, slow_compute, ttl_seconds=60)))
+    follower.start()
+    backend.contended.wait(5)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert results['leader'] == (['row'], CACHE_MISS)
+    assert results['follower'] == (['row'], CACHE_COALESCED)
+    assert len(calls) == 1
+
+def test_expired_entry_is_served_stale_while_another_container_refreshes(tmp_path):
+    backend = FileCacheBackend(str(tmp_path))
+    cache = QueryCache(backend)
+    cache.get_or_compute('vehicles', {}, lambda: ['old'], ttl_seconds=0)
+    # Another container holds the refresh lock
+    assert backend.acquire(f"{cache.make_key('vehicles', {})}:lock", 'other', 60000)
+    assert cache.get_or_compute('vehicles', {}, lambda: ['new'], ttl_seconds=60) == (['old'], CACHE_STALE)
+
+def test_backend_errors_bypass_the_cache():
+    cache = QueryCache(BrokenBackend())
+    assert cache.get_or_compute('vehicles', {}, lambda: ['row'], ttl_seconds=60) == (['row'], CACHE_BYPASS)
+    assert cache.stats['errors'] == 1 and cache.stats['bypassed'] == 1
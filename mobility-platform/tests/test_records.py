@@ -0,0 +1,98 @@
+"""
+Tests for mds_shared.records
+"""
+
+import copy
+
+from mds_shared.records import EnumTable, TripRecord, VehicleRecord
+
+VEHICLE = {
+    'device_id': 'vehicle_001',
+    'provider_id': 'p1',
+    'data_provider_id': 'p1',
+    'vehicle_id': 'SCO001',
+    'vehicle_type': 'scooter',
+    'propulsion_types': ['electric_assist', 'human'],
+    'vehicle_attributes': {'accessible': False},
+    'vehicle_state': 'available',
+    'last_event_types': ['service_start', 'located'],
+    'last_event_time': 1700000000000,
+    'last_event_location': {'type': 'Point', 'coordinates': [-122.4194, 37.7749]},
+    'current_location': {'type': 'Point', 'coordinates': [-122.4195, 37.775]},
+    'battery_percent': 85,
+    'rental_uris': {'web': 'https://example.com/web?vehicle=SCO001'}
+}
+
+TRIP = {
+    'provider_id': 'p1',
+    'data_provider_id': 'p1',
+    'device_id': 'vehicle_001',
+    'trip_id': 't1',
+    'trip_duration': 600,
+    'trip_distance': 1500,
+    'route': {'type': 'LineString', 'coordinates': [[-122.41, 37.78], [-122.42, 37.79], [-122.43, 37.8]]},
+    'accuracy': 10,
+    'start_time': 1700000000000,
+    'end_time': 1700000600000,
+    'publication_time': 1700000600000,
+    'start_location': {'type': 'Point', 'coordinates': [-122.41, 37.78]},
+    'end_location': {'type': 'Point', 'coordinates': [-122.43, 37.8]},
+    'standard_cost': 350,
+    'actual_cost': 300,
+    'currency': 'USD',
+    'trip_attributes': {'permit_licensed': True}
+}
+
+def test_enum_table_codes_and_masks():
+    table = EnumTable(['a', 'b', 'c'])
+    assert [table.code(value) for value in ('a', 'b', 'c')] == [0, 1, 2]
+    assert table.value(1) == 'b'
+
+    # Unknown values are assigned the next code and round-trip
+    assert table.code('new') == 3 and table.code('new') == 3
+    assert table.value(3) == 'new'
+
+    mask = table.mask(['c', 'a', 'new'])
+    assert mask == 0b1101
+    assert table.unmask(mask) == ['a', 'c', 'new']
+    assert table.mask(None) == 0 and table.unmask(0) == []
+
+def test_vehicle_round_trip():
+    vehicle = VehicleRecord.from_mds(copy.deepcopy(VEHICLE))
+    assert vehicle.vehicle_type == 'scooter' and vehicle.vehicle_state == 'available'
+    mds = vehicle.to_mds()
+    # Multi-valued enums come back in table order
+    assert mds['propulsion_types'] == ['human', 'electric_assist']
+    assert mds['last_event_types'] == ['located', 'service_start']
+    mds['propulsion_types'], mds['last_event_types'] = VEHICLE['propulsion_types'], VEHICLE['last_event_types']
+    assert mds == VEHICLE
+
+def test_vehicle_round_trip_omits_unset_optional_fields():
+    minimal = {
+        'device_id': 'd1', 'provider_id': 'p1', 'data_provider_id': None, 'vehicle_id': 'v1',
+        'vehicle_type': 'bicycle', 'propulsion_types': [], 'vehicle_state': 'unknown',
+        'last_event_types': [], 'last_event_time': None
+    }
+    assert VehicleRecord.from_mds(minimal).to_mds() == minimal
+
+def test_vehicle_locations_drop_altitude():
+    vehicle = dict(VEHICLE, current_location={'type': 'Point', 'coordinates': [-122.4, 37.7, 12.0]})
+    assert VehicleRecord.from_mds(vehicle).to_mds()['current_location']['coordinates'] == [-122.4, 37.7]
+
+def test_trip_round_trip():
+    trip = TripRecord.from_mds(copy.deepcopy(TRIP))
+    assert trip.to_mds() == TRIP
+    assert list(trip.points()) == [(-122.41, 37.78), (-122.43, 37.8),
+                                   (-122.41, 37.78), (-122.42, 37.79), (-122.43, 37.8)]
+
+def test_trip_round_trip_omits_unset_optional_fields():
+    trip = {key: value for key, value in TRIP.items()
+            if key not in ('standard_cost', 'actual_cost', 'currency', 'trip_attributes')}
+    assert TripRecord.from_mds(trip).to_mds() == trip
+
+def test_trip_positions_drop_altitude():
+    trip = dict(TRIP, route={'type': 'LineString', 'coordinates': [[-122.41, 37.78, 5.0], [-122.43, 37.8, 6.0]]},
+                start_location={'type': 'Point', 'coordinates': [-122.41, 37.78, 5.0]})
+    mds = TripRecord.from_mds(trip).to_mds()
+    assert mds['route']['coordinates'] == [[-122.41, 37.78], [-122.43, 37.8]]
+    assert mds['start_location']['coordinates'] == [-122.41, 37.78]
@@ -0,0 +1,102 @@
+"""
+Tests for mds_shared.telemetry_store
+"""
+
+import os
+
+from mds_shared.telemetry_store import (
+    DAY_MS, TelemetryStore, Tier, decode_block, downsample, encode_block, step_resolution
+)
+
+HOUR_MS = 3600 * 1000
+
+TIERS = [
+    Tier('raw', 0, HOUR_MS, 2 * DAY_MS),
+    Tier('1m', 60000, DAY_MS, 10 * DAY_MS),
+    Tier('15m', 900000, 30 * DAY_MS, 100 * DAY_MS)
+]
+
+def point(timestamp, lon=-122.4, lat=37.78, battery=None):
+    return {'device_id': 'd1', 'timestamp': timestamp, 'lon': lon, 'lat': lat, 'battery_percent': battery}
+
+def test_block_round_trip_with_negative_and_large_deltas():
+    columns = [
+        [1700000000000, 1700000001000, 1700000000500, 1700000000500],
+        [-122400000, -122400001, -122399000, 0],
+        [0, 63, 64, -64],
+        [2 ** 40, -(2 ** 40), 1, -1]
+    ]
+    assert decode_block(encode_block(columns), len(columns)) == columns
+    assert decode_block(encode_block([]), 0) == []
+
+def test_zigzag_keeps_small_deltas_to_one_byte():
+    # Row count, then deltas 0, +1, -1, +63, -64: each a single byte
+    encoded = encode_block([[0, 1, 0, 63, -1]])
+    assert encoded == bytes([5, 0, 2, 1, 126, 127])
+    # A delta of +64 no longer fits in seven bits
+    assert len(encode_block([[64]])) == 3
+
+def test_downsample_keeps_last_position_and_battery_range():
+    rows = [
+        [1000, 1, 10, 20, 80, 80, 80, 80, 1, 1],
+        [30000, 1, 11, 21, -1, -1, -1, 0, 0, 2],
+        [59000, 1, 12, 22, 70, 70, 70, 70, 1, 2],
+        [61000, 1, 13, 23, 69, 69, 69, 69, 1, 1]
+    ]
+    assert downsample(rows, 60000) == [
+        [0, 3, 12, 22, 70, 70, 80, 150, 2, 2],
+        [60000, 1, 13, 23, 69, 69, 69, 69, 1, 1]
+    ]
+
+def test_step_resolution():
+    assert step_resolution(60000, 100) == 1000
+    assert step_resolution(HOUR_MS, 100) == 60000
+    assert step_resolution(365 * DAY_MS, 100) == 4 * DAY_MS
+
+def test_choose_tier_by_resolution_and_retention(tmp_path):
+    store = TelemetryStore(str(tmp_path), TIERS)
+    now = 1000 * DAY_MS
+    assert store.choose_tier(now - HOUR_MS, 0, now) == 0
+    assert store.choose_tier(now - HOUR_MS, 59999, now) == 0
+    assert store.choose_tier(now - HOUR_MS, 60000, now) == 1
+    assert store.choose_tier(now - HOUR_MS, DAY_MS, now) == 2
+    # Expired finer tiers fall back to the next one that retains the start
+    assert store.choose_tier(now - 5 * DAY_MS, 0, now) == 1
+    assert store.choose_tier(now - 50 * DAY_MS, 0, now) == 2
+    assert store.choose_tier(now - 500 * DAY_MS, 0, now) == 2
+
+def test_query_reads_the_chosen_tier_after_rollup(tmp_path):
+    store = TelemetryStore(str(tmp_path), TIERS)
+    now = 1000 * DAY_MS
+    start = now - 3 * DAY_MS
+    store.append([point(start + i * 20000, battery=90 - i) for i in range(6)])
+    store.rollup(now, grace_ms=0)
+
+    history = store.query('d1', start, start + HOUR_MS, now_ms=now)
+    assert history['tier'] == '1m' and history['resolution_ms'] == 60000
+    assert [p['timestamp'] for p in history['points']] == [start, start + 60000]
+
+    history = store.query('d1', now - HOUR_MS, now, now_ms=now)
+    assert history['tier'] == 'raw' and history['points'] == []
+
+def test_hot_reads_skip_a_line_still_being_written(tmp_path):
+    store = TelemetryStore(str(tmp_path), TIERS)
+    store.append([point(1000, battery=80)])
+    with open(os.path.join(str(tmp_path), 'hot', '0.ndjson'), 'a') as f:
+        f.write('["d1",2000,-1224')
+    history = store.query('d1', 0, HOUR_MS, now_ms=HOUR_MS)
+    assert [p['timestamp'] for p in history['points']] == [1000]
+
+def test_rollup_waits_for_a_line_still_being_written(tmp_path):
+    store = TelemetryStore(str(tmp_path), TIERS)
+    store.append([point(1000)])
+    with open(os.path.join(str(tmp_path), 'hot', '0.ndjson'), 'a') as f:
+        f.write('["d1",2000,')
+    assert store.rollup(2 * HOUR_MS, grace_ms=0)['raw']['segments'] == 0
+    assert os.listdir(os.path.join(str(tmp_path), 'hot')) == ['0.1.rolling']
+
+    # The appender finishes its write into the renamed file
+    with open(os.path.join(str(tmp_path), 'hot', '0.1.rolling'), 'a') as f:
+        f.write('-122400000,37780000,-1]\n')
+    metrics = store.rollup(2 * HOUR_MS, grace_ms=0)
+    assert metrics['raw']['segments'] == 1 and metrics['raw']['points'] == 2
@@ -0,0 +1,167 @@
+"""
+Tests for mds_shared.trip_assembler and mds_shared.trip_store
+"""
+
+import json
+import math
+import os
+
+from mds_shared.trip_assembler import TripAssembler, haversine_distances
+from mds_shared.trip_store import TripStore
+
+def event(device_id, timestamp, event_types, lon, lat, **fields):
+    return {
+        'device_id': device_id,
+        'timestamp': timestamp,
+        'event_types': event_types,
+        'event_location': {'type': 'Point', 'coordinates': [lon, lat]},
+        **fields
+    }
+
+def telemetry(device_id, timestamp, lon, lat, accuracy=None):
+    location = {'lng': lon, 'lat': lat}
+    if accuracy is not None:
+        location['horizontal_accuracy'] = accuracy
+    return {'device_id': device_id, 'timestamp': timestamp, 'location': location}
+
+def trip_records(device_id='d1', start=1000):
+    return [
+        event(device_id, start, ['trip_start'], -122.40, 37.78, trip_ids=['t1']),
+        telemetry(device_id, start + 10000, -122.41, 37.78, accuracy=8),
+        telemetry(device_id, start + 20000, -122.42, 37.78, accuracy=12),
+        event(device_id, start + 30000, ['trip_end'], -122.43, 37.78)
+    ]
+
+def test_haversine_distances():
+    # One degree of latitude along a meridian
+    distances = haversine_distances([0.0, 0.0], [0.0, 1.0])
+    assert len(distances) == 1
+    assert math.isclose(distances[0], 111195, rel_tol=0.001)
+    assert haversine_distances([0.0], [0.0]) == []
+
+def test_reorder_buffer_applies_records_in_timestamp_order():
+    records = trip_records()
+    shuffled = [records[2], records[0], records[3], records[1]]
+    assembler = TripAssembler('p1', reorder_window_ms=60000)
+
+    assert assembler.process_batch(shuffled) == []
+    trips = assembler.flush()
+
+    assert len(trips) == 1
+    trip = trips[0]
+    assert trip['trip_id'] == 't1'
+    assert trip['start_time'] == 1000 and trip['end_time'] == 31000
+    assert trip['trip_duration'] == 30
+    assert trip['route']['coordinates'] == [[-122.40, 37.78], [-122.41, 37.78],
+                                           [-122.42, 37.78], [-122.43, 37.78]]
+    assert trip['accuracy'] == 12
+    assert assembler.stats['late_records'] == 0
+
+def test_records_behind_the_watermark_are_dropped_as_late():
+    assembler = TripAssembler('p1', reorder_window_ms=1000)
+    assembler.process(telemetry('d1', 10000, 0.0, 0.0))
+    assembler.process(telemetry('d1', 20000, 0.0, 0.0))
+    assert assembler.process(telemetry('d1', 5000, 0.0, 0.0)) == []
+    assert assembler.stats['late_records'] == 1
+
+def test_buffer_is_released_once_it_exceeds_the_per_device_limit():
+    assembler = TripAssembler('p1', reorder_window_ms=10 ** 9, max_buffered_per_device=2)
+    trips = assembler.process_batch(trip_records())
+    assert [trip['trip_id'] for trip in trips] == []
+    assert len(assembler._devices['d1'].buffer) == 2
+    assert [trip['trip_id'] for trip in assembler.flush()] == ['t1']
+
+def test_trip_cancel_emits_nothing():
+    records = trip_records()
+    records[-1]['event_types'] = ['trip_cancel']
+    assembler = TripAssembler('p1')
+    assembler.process_batch(records)
+    assert assembler.flush() == []
+    assert assembler.open_trip_count == 0
+
+def test_trip_without_location_is_withheld():
+    assembler = TripAssembler('p1', default_accuracy=10)
+    start = {'device_id': 'd1', 'timestamp': 1000, 'event_types': ['trip_start']}
+    end = {'device_id': 'd1', 'timestamp': 2000, 'event_types': ['trip_end']}
+    assembler.process_batch([start, end])
+    assert assembler.flush() == []
+    assert assembler.stats['trips_withheld'] == 1
+
+def test_missing_accuracy_takes_the_default_or_withholds():
+    records = [trip_records()[0], trip_records()[3]]
+    assembler = TripAssembler('p1', default_accuracy=10)
+    assembler.process_batch(records)
+    assert assembler.flush()[0]['accuracy'] == 10
+
+    assembler = TripAssembler('p1')
+    assembler.process_batch(records)
+    assert assembler.flush() == []
+    assert assembler.stats['trips_withheld'] == 1
+
+def test_derived_trip_ids_are_stable():
+    records = trip_records()
+    del records[0]['trip_ids']
+    ids = []
+    for _ in range(2):
+        assembler = TripAssembler('p1', default_accuracy=10)
+        assembler.process_batch(records)
+        ids.append(assembler.flush()[0]['trip_id'])
+    assert ids[0] == ids[1]
+
+def test_snapshot_carries_open_trips_across_runs():
+    records = trip_records()
+    first = TripAssembler('p1')
+    first.process_batch(records[:2])
+    assert first.flush() == []
+    state = json.loads(json.dumps(first.snapshot()))
+
+    second = TripAssembler('p1')
+    second.restore(state)
+    assert second.open_trip_count == 1
+    second.process_batch(records[2:])
+    trips = second.flush()
+    assert [trip['trip_id'] for trip in trips] == ['t1']
+    assert len(trips[0]['route']['coordinates']) == 4
+
+    # The watermark survives too, so a segment fed again is ignored
+    assert second.process_batch(records) + second.flush() == []
+    # The trip_end sits exactly on the watermark and is applied, with no trip open
+    assert second.stats['late_records'] == len(records) - 1
+
+def test_expire_discards_stale_open_trips():
+    assembler = TripAssembler('p1', trip_timeout_ms=60000)
+    assembler.process_batch(trip_records()[:1])
+    assembler.flush()
+    assert assembler.expire(1000 + 30000) == 0
+    assert assembler.expire(1000 + 120000) == 1
+    assert assembler.open_trip_count == 0
+
+def test_trip_store_round_trip_and_duplicates(tmp_path):
+    store = TripStore(str(tmp_path))
+    assembler = TripAssembler('p1')
+    assembler.process_batch(trip_records())
+    trip = assembler.flush()[0]
+
+    assert store.append([trip, trip]) == 2
+    assert store.query(0, 10 ** 6) == [trip]
+    assert store.query(0, 10 ** 6, device_id='other') == []
+    assert store.query(2000, 10 ** 6) == []
+
+def test_trip_store_ignores_a_line_still_being_written(tmp_path):
+    store = TripStore(str(tmp_path))
+    store.append([{'trip_id': 't1', 'device_id': 'd1', 'start_time': 1000}])
+    with open(os.path.join(str(tmp_path), '0.ndjson'), 'a') as f:
+        f.write('{"trip_id": "t2", "device_')
+    assert [trip['trip_id'] for trip in store.query(0, 10 ** 6)] == ['t1']
+
+def test_trip_store_state_and_retention(tmp_path):
+    store = TripStore(str(tmp_path), segment_ms=1000)
+    assert store.load_state() is None
+    store.save_state({'devices': {}})
+    assert store.load_state() == {'devices': {}}
+
+    store.append([{'trip_id': 't1', 'device_id': 'd1', 'start_time': 500},
+                  {'trip_id': 't2', 'device_id': 'd1', 'start_time': 5500}])
+    metrics = store.apply_retention(now_ms=6000, retention_ms=3000)
+    assert metrics['segments_deleted'] == 1
+    assert [trip['trip_id'] for trip in store.query(0, 10 ** 6)] == ['t2']
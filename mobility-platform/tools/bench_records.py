@@ -0,0 +1,108 @@
+"""
+Circuit Provider API Record Memory Benchmark
+Compares per-record memory of MDS dicts and compact records
+
+Each record is decoded from JSON individually, as it would be when read
+from the database or a feed, so the dict form pays for its own keys and
+string values the way a cached fleet does in a warm container.
+
+Usage:
+    python tools/bench_records.py --count 50000
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+from typing import Callable, List, Any
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'lambda', 'shared', 'python'))
+
+from mds_shared.records import VehicleRecord, TripRecord
+
+PROVIDER_ID = '00000000-0000-0000-0000-000000000000'
+VEHICLE_TYPES = ['scooter', 'bicycle', 'car']
+VEHICLE_STATES = ['available', 'reserved', 'on_trip', 'non_operational']
+
+def vehicle_json(i: int) -> str:
+    lon, lat = -122.4194 + (i % 1000) * 1e-4, 37.7749 + (i // 1000) * 1e-4
+    return json.dumps({
+        'device_id': f"vehicle_{i:07d}",
+        'provider_id': PROVIDER_ID,
+        'data_provider_id': PROVIDER_ID,
+        'vehicle_id': f"SCO{i:07d}",
+        'vehicle_type': VEHICLE_TYPES[i % len(VEHICLE_TYPES)],
+        'propulsion_types': ['electric'],
+        'vehicle_attributes': {'accessible': bool(i % 2)},
+        'vehicle_state': VEHICLE_STATES[i % len(VEHICLE_STATES)],
+        'last_event_types': ['service_start'],
+        'last_event_time': 1700000000000 + i,
+        'last_event_location': {'type': 'Point', 'coordinates': [lon, lat]},
+        'current_location': {'type': 'Point', 'coordinates': [lon, lat]},
+        'battery_percent': i % 100
+    })
+
+def trip_json(i: int) -> str:
+    route = [[-122.4194 + j * 1e-4, 37.7749 + j * 1e-4] for j in range(20)]
+    return json.dumps({
+        'provider_id': PROVIDER_ID,
+        'data_provider_id': PROVIDER_ID,
+        'device_id': f"vehicle_{i % 5000:07d}",
+        'trip_id': f"{i:08d}-0000-4000-8000-000000000000",
+        'trip_duration': 600 + i % 600,
+        'trip_distance': 1000 + i % 2000,
+        'route': {'type': 'LineString', 'coordinates': route},
+        'accuracy': 10,
+        'start_time': 1700000000000 + i * 1000,
+        'end_time': 1700000600000 + i * 1000,
+        'publication_time': 1700000600000 + i * 1000,
+        'start_location': {'type': 'Point', 'coordinates': route[0]},
+        'end_location': {'type': 'Point', 'coordinates': route[-1]},
+        'standard_cost': 450,
+        'actual_cost': 400,
+        'currency': 'USD',
+        'trip_attributes': {'surface_type': 'paved_smooth'}
+    })
+
+def measure(build: Callable[[], List[Any]]) -> int:
+    """Bytes retained by the list returned from build()"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del items
+    return after - before
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Compare memory of MDS dicts and compact records')
+    parser.add_argument('--count', type=int, default=50000, help='Records per kind')
+    args = parser.parse_args(argv)
+
+    vehicles = [vehicle_json(i) for i in range(args.count)]
+    trips = [trip_json(i) for i in range(args.count)]
+
+    # Warm the enum tables so their one-off cost is not attributed to records
+    VehicleRecord.from_mds(json.loads(vehicles[0]))
+    TripRecord.from_mds(json.loads(trips[0]))
+
+    cases = [
+        ('vehicle', vehicles, VehicleRecord),
+        ('trip', trips, TripRecord)
+    ]
+    print(f"{'kind':<8} {'dict B/rec':>11} {'record B/rec':>13} {'saved':>7}")
+    for kind, payloads, record_cls in cases:
+        dict_bytes = measure(lambda: [json.loads(p) for p in payloads])
+        record_bytes = measure(lambda: [record_cls.from_mds(json.loads(p)) for p in payloads])
+        per_dict = dict_bytes / len(payloads)
+        per_record = record_bytes / len(payloads)
+        print(f"{kind:<8} {per_dict:>11.0f} {per_record:>13.0f} {1 - per_record / per_dict:>7.0%}")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
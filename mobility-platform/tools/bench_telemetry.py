@@ -0,0 +1,132 @@
+"""
+Circuit Provider API Telemetry Store Benchmark
+Measures storage per tier and history query latency by tier
+
+Generates synthetic telemetry (a random walk per vehicle with a slowly
+draining battery) into a temporary telemetry store, runs the rollup, and
+reports bytes per point for the hot NDJSON and each delta-encoded tier.
+History queries for one vehicle are then timed twice: served from the
+tier query() picks, and computed from raw points as a store without
+downsampled tiers would have to.
+
+Usage:
+    python tools/bench_telemetry.py --devices 50 --days 3 --interval-s 10
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, Any, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(REPO_ROOT, 'lambda', 'shared', 'python'))
+
+from mds_shared.telemetry_store import TelemetryStore, Tier, downsample, DAY_MS
+
+def generate(store: TelemetryStore, devices: int, start_ms: int, end_ms: int, interval_ms: int) -> int:
+    count = 0
+    for d in range(devices):
+        lon, lat, battery = -122.42 + random.uniform(-0.05, 0.05), 37.77 + random.uniform(-0.05, 0.05), 100
+        points = []
+        for timestamp in range(start_ms, end_ms, interval_ms):
+            lon += random.uniform(-0.0001, 0.0001)
+            lat += random.uniform(-0.0001, 0.0001)
+            if random.random() < 0.01:
+                battery = battery - 1 if battery > 5 else 100
+            points.append({'device_id': f"vehicle_{d:05d}", 'timestamp': timestamp + random.randint(0, 999),
+                           'lon': lon, 'lat': lat, 'battery_percent': battery})
+        store.append(points)
+        count += len(points)
+    return count
+
+def directory_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def time_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Benchmark telemetry storage and tiered history queries')
+    parser.add_argument('--devices', type=int, default=50, help='Vehicles to simulate')
+    parser.add_argument('--days', type=int, default=3, help='Days of telemetry')
+    parser.add_argument('--interval-s', type=int, default=10, help='Seconds between points per vehicle')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed runs per query')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp(prefix='telemetry-bench-')
+    try:
+        # Retention long enough that every generated point stays in every tier
+        tiers = [Tier('raw', 0, 3600 * 1000, 3650 * DAY_MS), Tier('1m', 60 * 1000, DAY_MS, 3650 * DAY_MS),
+                 Tier('15m', 15 * 60 * 1000, 30 * DAY_MS, 3650 * DAY_MS)]
+        store = TelemetryStore(root, tiers)
+        now_ms = int(time.time() * 1000)
+        end_ms = now_ms - now_ms % DAY_MS
+        start_ms = end_ms - args.days * DAY_MS
+
+        points = generate(store, args.devices, start_ms, end_ms, args.interval_s * 1000)
+        hot_bytes = directory_bytes(store.hot_dir)
+        started = time.perf_counter()
+        rollup = store.rollup(end_ms + 31 * DAY_MS)
+        rollup_s = round(time.perf_counter() - started, 2)
+
+        storage: Dict[str, Any] = {'hot_ndjson': {'bytes': hot_bytes, 'bytes_per_point': round(hot_bytes / points, 2)}}
+        for tier in tiers:
+            size = directory_bytes(os.path.join(root, tier.name))
+            storage[tier.name] = {'bytes': size, 'bytes_per_point': round(size / points, 2)}
+
+        device = 'vehicle_00000'
+        queries: List[Dict[str, Any]] = []
+        for label, span_ms, resolution_ms in [('1h raw', 3600 * 1000, 0), ('1d @ 1m', DAY_MS, 60 * 1000),
+                                              (f"{args.days}d @ 15m", args.days * DAY_MS, 15 * 60 * 1000)]:
+            query_start = end_ms - span_ms
+            tiered = store.query(device, query_start, end_ms - 1, resolution_ms, now_ms=end_ms)
+
+            def from_raw():
+                rows = store.rows(0, query_start, end_ms - 1, device).get(device, [])
+                return downsample(rows, resolution_ms) if resolution_ms else rows
+
+            queries.append({
+                'query': label,
+                'tier': tiered['tier'],
+                'points': len(tiered['points']),
+                'tiered_ms': time_ms(lambda: store.query(device, query_start, end_ms - 1, resolution_ms,
+                                                         now_ms=end_ms), args.repeat),
+                'from_raw_ms': time_ms(from_raw, args.repeat)
+            })
+
+        report = {
+            'devices': args.devices,
+            'points': points,
+            'rollup_s': rollup_s,
+            'rollup': rollup,
+            'storage': storage,
+            'queries': queries
+        }
+        if args.json:
+            print(json.dumps(report, indent=2))
+        else:
+            print(f"{points} points from {args.devices} vehicles over {args.days} days, rolled up in {rollup_s} s")
+            for name, size in storage.items():
+                print(f"  {name:<11} {size['bytes']:>12} bytes  {size['bytes_per_point']:>6} bytes/point")
+            print(f"{'query':<12} {'tier':<5} {'points':>7} {'tiered ms':>10} {'from raw ms':>12}")
+            for query in queries:
+                print(f"{query['query']:<12} {query['tier']:<5} {query['points']:>7} "
+                      f"{query['tiered_ms']:>10.2f} {query['from_raw_ms']:>12.2f}")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,320 @@
+"""
+Circuit Provider API Historical Export
+Backfills MDS trips and events for a time range into hourly files
+
+Each hour of the requested range is exported by a worker process using the
+same get_trips()/get_events() query logic as the API endpoints. Files are
+written atomically, checksummed and recorded in manifest.json, so an
+interrupted export can be re-run with the same arguments and only the
+missing or corrupt hours are redone.
+
+Usage:
+    python tools/export_history.py --start 2024-01-01T00:00:00Z \\
+        --end 2024-02-01T00:00:00Z --output ./export --workers 8
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Dict, Any, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAMBDA_PATHS = [
+    os.path.join(REPO_ROOT, 'lambda', 'shared', 'python'),
+    os.path.join(REPO_ROOT, 'lambda', 'trips'),
+    os.path.join(REPO_ROOT, 'lambda', 'events')
+]
+
+HOUR_MS = 3600 * 1000
+MANIFEST_NAME = 'manifest.json'
+DATASETS = ('trips', 'events')
+FORMATS = {
+    'ndjson': '.ndjson.gz',
+    'parquet': '.parquet'
+}
+
+# Query modules, loaded once per worker process
+_query_functions = {}
+
+def _init_worker(region: str):
+    """Import the endpoint modules in a worker process"""
+    os.environ.setdefault('AWS_DEFAULT_REGION', region)
+    for path in LAMBDA_PATHS:
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    import trips
+    import events
+    _query_functions['trips'] = trips.get_trips
+    _query_functions['events'] = events.get_events
+
+def parse_time(value: str) -> int:
+    """
+    Parse an ISO 8601 timestamp or Unix milliseconds
+
+    Args:
+        value: '2024-01-01T00:00:00Z' or '1704067200000'
+
+    Returns:
+        Unix timestamp in milliseconds
+    """
+    if value.isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+def hour_shards(start_ms: int, end_ms: int) -> List[int]:
+    """
+    Split [start_ms, end_ms) into hour-aligned shard start times
+
+    Args:
+        start_ms: Range start in Unix milliseconds
+        end_ms: Range end in Unix milliseconds (exclusive)
+
+    Returns:
+        Shard start times in Unix milliseconds
+    """
+    first = start_ms - start_ms % HOUR_MS
+    return list(range(first, end_ms, HOUR_MS))
+
+def shard_range(hour_ms: int, start_ms: int, end_ms: int) -> Tuple[int, int]:
+    """
+    Part of one shard hour inside the requested range
+
+    Args:
+        hour_ms: Shard start in Unix milliseconds
+        start_ms: Range start in Unix milliseconds
+        end_ms: Range end in Unix milliseconds (exclusive)
+
+    Returns:
+        (lower, upper) in Unix milliseconds, upper exclusive; the whole hour
+        except for the first and last shard of an unaligned range
+    """
+    return max(hour_ms, start_ms), min(hour_ms + HOUR_MS, end_ms)
+
+def shard_path(dataset: str, hour_ms: int, output_format: str) -> str:
+    """Relative path of the file holding one dataset hour"""
+    hour = datetime.fromtimestamp(hour_ms / 1000, tz=timezone.utc)
+    return os.path.join(dataset, hour.strftime('%Y/%m/%d/%H') + FORMATS[output_format])
+
+def file_sha256(path: str) -> str:
+    """Compute the SHA-256 checksum of a file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def decimal_default(obj):
+    """JSON serializer for objects not serializable by default json code"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj)} is not JSON serializable")
+
+def export_shard(output_dir: str, dataset: str, hour_ms: int, lower_ms: int, upper_ms: int,
+                 output_format: str) -> Dict[str, Any]:
+    """
+    Export the requested part of one dataset hour to a file
+
+    Runs in a worker process. The file is written under a temporary name
+    and renamed into place, so a partial file is never mistaken for a
+    finished shard.
+
+    Args:
+        output_dir: Export root directory
+        dataset: 'trips' or 'events'
+        hour_ms: Shard start in Unix milliseconds
+        lower_ms: Export start within the hour (see shard_range)
+        upper_ms: Export end within the hour, exclusive
+        output_format: 'ndjson' or 'parquet'
+
+    Returns:
+        Manifest entry for the shard
+    """
+    # Query functions treat end_time as inclusive
+    records = _query_functions[dataset](
+        start_time=str(lower_ms),
+        end_time=str(upper_ms - 1)
+    )
+
+    relative_path = shard_path(dataset, hour_ms, output_format)
+    path = os.path.join(output_dir, relative_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp.{os.getpid()}"
+
+    if output_format == 'parquet':
+        _write_parquet(tmp_path, records)
+    else:
+        # mtime=0 keeps the gzip bytes (and checksum) reproducible
+        with open(tmp_path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+            for record in records:
+                f.write(json.dumps(record, default=decimal_default).encode('utf-8') + b'\n')
+
+    os.replace(tmp_path, path)
+    return {
+        'dataset': dataset,
+        'hour': hour_ms,
+        'start_time': lower_ms,
+        'end_time': upper_ms,
+        'path': relative_path,
+        'records': len(records),
+        'bytes': os.path.getsize(path),
+        'sha256': file_sha256(path)
+    }
+
+def _write_parquet(path: str, records: List[Dict[str, Any]]):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    from mds_shared.formats import records_table
+
+    records = json.loads(json.dumps(records, default=decimal_default))
+    # Columns from every record, not just the first, so optional fields survive
+    pq.write_table(records_table(pa, records), path, compression='zstd')
+
+def load_manifest(output_dir: str) -> Dict[str, Any]:
+    """Load the export manifest, or start an empty one"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {'shards': {}}
+    with open(path) as f:
+        return json.load(f)
+
+def save_manifest(output_dir: str, manifest: Dict[str, Any]):
+    """Atomically write the export manifest"""
+    path = os.path.join(output_dir, MANIFEST_NAME)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def shard_key(dataset: str, hour_ms: int) -> str:
+    """Manifest key for one dataset hour"""
+    return f"{dataset}/{hour_ms}"
+
+def is_complete(output_dir: str, entry: Optional[Dict[str, Any]], output_format: str,
+                lower_ms: int, upper_ms: int) -> bool:
+    """
+    Check that a manifest entry points at an intact file covering the wanted range
+
+    Args:
+        output_dir: Export root directory
+        entry: Manifest entry (None if the shard was never finished)
+        output_format: Format requested for this run
+        lower_ms: Export start within the hour for this run
+        upper_ms: Export end within the hour for this run, exclusive
+
+    Returns:
+        True if the shard can be skipped on resume
+    """
+    if not entry or not entry['path'].endswith(FORMATS[output_format]):
+        return False
+    # Entries without a range were written for the whole hour
+    covered = (entry.get('start_time', entry['hour']), entry.get('end_time', entry['hour'] + HOUR_MS))
+    if covered != (lower_ms, upper_ms):
+        return False
+    path = os.path.join(output_dir, entry['path'])
+    return os.path.exists(path) and file_sha256(path) == entry['sha256']
+
+def run_export(start_ms: int, end_ms: int, output_dir: str, datasets: List[str],
+               output_format: str, workers: int, region: str) -> Dict[str, Any]:
+    """
+    Export all pending shards of a time range
+
+    Args:
+        start_ms: Range start in Unix milliseconds
+        end_ms: Range end in Unix milliseconds (exclusive)
+        output_dir: Export root directory
+        datasets: Datasets to export
+        output_format: 'ndjson' or 'parquet'
+        workers: Worker process count
+        region: AWS region for the endpoint modules
+
+    Returns:
+        Updated manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest(output_dir)
+    manifest.update({
+        'start_time': start_ms,
+        'end_time': end_ms,
+        'format': output_format,
+        'datasets': datasets
+    })
+
+    pending: List[Tuple[str, int]] = []
+    for hour_ms in hour_shards(start_ms, end_ms):
+        lower_ms, upper_ms = shard_range(hour_ms, start_ms, end_ms)
+        for dataset in datasets:
+            key = shard_key(dataset, hour_ms)
+            if not is_complete(output_dir, manifest['shards'].get(key), output_format, lower_ms, upper_ms):
+                pending.append((dataset, hour_ms))
+
+    total = len(pending)
+    logger.info(f"{total} shards to export, {len(manifest['shards'])} already in manifest")
+    failures = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(region,)) as pool:
+        futures = {
+            pool.submit(export_shard, output_dir, dataset, hour_ms, *shard_range(hour_ms, start_ms, end_ms),
+                        output_format): (dataset, hour_ms)
+            for dataset, hour_ms in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            dataset, hour_ms = futures[future]
+            try:
+                entry = future.result()
+            except Exception as e:
+                failures += 1
+                logger.error(f"Failed to export {dataset} hour {hour_ms}: {str(e)}")
+                continue
+
+            # The manifest is only written by this process, after each shard
+            manifest['shards'][shard_key(dataset, hour_ms)] = entry
+            save_manifest(output_dir, manifest)
+            logger.info(f"[{done}/{total}] {entry['path']}: {entry['records']} records")
+
+    manifest['complete'] = failures == 0
+    save_manifest(output_dir, manifest)
+    if failures:
+        logger.error(f"{failures} shards failed; re-run the same command to resume")
+    return manifest
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description='Export historical MDS trips and events into hourly files')
+    parser.add_argument('--start', required=True, help='Range start (ISO 8601 or Unix ms)')
+    parser.add_argument('--end', required=True, help='Range end, exclusive (ISO 8601 or Unix ms)')
+    parser.add_argument('--output', required=True, help='Output directory')
+    parser.add_argument('--datasets', default=','.join(DATASETS), help='Comma separated datasets (trips,events)')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson', help='Output file format')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker process count')
+    parser.add_argument('--region', default=os.environ.get('AWS_REGION', 'us-west-2'), help='AWS region')
+    args = parser.parse_args(argv)
+
+    datasets = [d.strip() for d in args.datasets.split(',') if d.strip()]
+    unknown = set(datasets) - set(DATASETS)
+    if unknown:
+        parser.error(f"Unknown datasets: {', '.join(sorted(unknown))}")
+
+    start_ms = parse_time(args.start)
+    end_ms = parse_time(args.end)
+    if end_ms <= start_ms:
+        parser.error('--end must be after --start')
+
+    manifest = run_export(start_ms, end_ms, args.output, datasets, args.format, args.workers, args.region)
+    return 0 if manifest['complete'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+Circuit Provider API Load Generator
+Simulates many agencies polling the API concurrently
+
+Each simulated agency polls every endpoint at its configured rate on an
+open-loop schedule (requests are started on time even if earlier ones are
+still in flight), so slow responses show up as latency rather than as a
+lower request rate. Results are reported per endpoint: throughput,
+latency percentiles and error rate.
+
+Usage:
+    python tools/local_gateway.py --port 8080 &
+    python tools/load_generator.py --base-url http://127.0.0.1:8080 \\
+        --agencies 50 --duration 60
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit, urlencode
+
+# Tokens known to the authorizer in lambda/auth/auth.py
+DEFAULT_TOKENS = ['circuit-token-12345', 'circuit-token-67890']
+
+# Polls per second, per agency
+DEFAULT_RATES = {
+    'vehicles': 1.0,
+    'trips': 0.1,
+    'events': 0.1,
+    'reports': 0.01,
+    'status': 0.05
+}
+
+def query_for(endpoint: str) -> Dict[str, str]:
+    """Query parameters an agency typically sends for an endpoint"""
+    now = datetime.now(timezone.utc)
+    now_ms = int(now.timestamp() * 1000)
+    if endpoint in ('trips', 'events'):
+        return {'start_time': str(now_ms - 3600 * 1000), 'end_time': str(now_ms)}
+    if endpoint == 'reports':
+        return {'start_date': now.strftime('%Y-%m-%d')}
+    return {}
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+class EndpointStats:
+    """Latency and outcome counters for one endpoint"""
+
+    def __init__(self):
+        self.latencies_ms: List[float] = []
+        self.statuses: Dict[str, int] = {}
+        self.errors = 0
+
+    def record(self, status: str, latency_ms: float, error: bool):
+        self.latencies_ms.append(latency_ms)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if error:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        latencies = sorted(self.latencies_ms)
+        count = len(latencies)
+        return {
+            'requests': count,
+            'throughput_rps': round(count / elapsed, 2) if elapsed else 0.0,
+            'error_rate': round(self.errors / count, 4) if count else 0.0,
+            'statuses': dict(sorted(self.statuses.items())),
+            'p50_ms': percentile(latencies, 50),
+            'p90_ms': percentile(latencies, 90),
+            'p99_ms': percentile(latencies, 99),
+            'max_ms': latencies[-1] if latencies else None
+        }
+
+async def http_get(host: str, port: int, path: str, headers: Dict[str, str], timeout: float) -> int:
+    """
+    Issue one HTTP/1.1 GET and read the full response
+
+    Returns:
+        HTTP status code
+    """
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        lines = [f"GET {path} HTTP/1.1", f"Host: {host}:{port}", 'Connection: close']
+        lines.extend(f"{key}: {value}" for key, value in headers.items())
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('ascii'))
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        status = int(status_line.split()[1])
+        await asyncio.wait_for(reader.read(), timeout)
+        return status
+    finally:
+        writer.close()
+
+class LoadGenerator:
+    """Open-loop multi-agency poller"""
+
+    def __init__(self, base_url: str, agencies: int, rates: Dict[str, float], duration: float,
+                 tokens: List[str], timeout: float, max_in_flight: int):
+        url = urlsplit(base_url)
+        self.host = url.hostname
+        self.port = url.port or 80
+        self.prefix = url.path.rstrip('/')
+        self.agencies = agencies
+        self.rates = {endpoint: rate for endpoint, rate in rates.items() if rate > 0}
+        self.duration = duration
+        self.tokens = tokens
+        self.timeout = timeout
+        self.in_flight = asyncio.Semaphore(max_in_flight)
+        self.stats = {endpoint: EndpointStats() for endpoint in self.rates}
+        self.pending = set()
+
+    async def request(self, endpoint: str, token: str):
+        query = query_for(endpoint)
+        path = f"{self.prefix}/{endpoint}" + (f"?{urlencode(query)}" if query else '')
+        headers = {'Authorization': f"Bearer {token}", 'Accept': 'application/json'}
+
+        async with self.in_flight:
+            started = time.perf_counter()
+            try:
+                status = await http_get(self.host, self.port, path, headers, self.timeout)
+                outcome, error = str(status), status >= 400
+            except asyncio.TimeoutError:
+                outcome, error = 'timeout', True
+            except OSError:
+                outcome, error = 'connection_error', True
+            latency_ms = (time.perf_counter() - started) * 1000
+        self.stats[endpoint].record(outcome, latency_ms, error)
+
+    async def poll(self, endpoint: str, rate: float, token: str, deadline: float):
+        interval = 1.0 / rate
+        # Spread agencies across the interval instead of polling in lockstep
+        next_at = time.perf_counter() + random.uniform(0, interval)
+        while next_at < deadline:
+            await asyncio.sleep(max(0.0, next_at - time.perf_counter()))
+            task = asyncio.create_task(self.request(endpoint, token))
+            self.pending.add(task)
+            task.add_done_callback(self.pending.discard)
+            next_at += interval
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        deadline = started + self.duration
+        pollers = [
+            self.poll(endpoint, rate, self.tokens[agency % len(self.tokens)], deadline)
+            for agency in range(self.agencies)
+            for endpoint, rate in self.rates.items()
+        ]
+        await asyncio.gather(*pollers)
+        if self.pending:
+            await asyncio.wait(self.pending)
+        elapsed = time.perf_counter() - started
+
+        return {
+            'agencies': self.agencies,
+            'duration_s': round(elapsed, 2),
+            'endpoints': {endpoint: stats.summary(elapsed) for endpoint, stats in self.stats.items()}
+        }
+
+def print_report(report: Dict[str, Any]):
+    def ms(value):
+        return '-' if value is None else f"{value:.1f}"
+
+    print(f"{report['agencies']} agencies, {report['duration_s']}s")
+    print(f"{'endpoint':<10} {'requests':>9} {'rps':>8} {'errors':>7} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  statuses")
+    for endpoint, summary in report['endpoints'].items():
+        print(f"{endpoint:<10} {summary['requests']:>9} {summary['throughput_rps']:>8.1f} "
+              f"{summary['error_rate']:>7.2%} {ms(summary['p50_ms']):>8} {ms(summary['p90_ms']):>8} "
+              f"{ms(summary['p99_ms']):>8} {ms(summary['max_ms']):>8}  {summary['statuses']}")
+
+def parse_rates(values: Optional[List[str]]) -> Dict[str, float]:
+    """Parse endpoint=rate overrides on top of DEFAULT_RATES"""
+    rates = dict(DEFAULT_RATES)
+    for value in values or []:
+        endpoint, _, rate = value.partition('=')
+        if endpoint not in rates or not rate:
+            raise ValueError(f"Invalid rate '{value}', expected one of {', '.join(rates)}=<polls/s>")
+        rates[endpoint] = float(rate)
+    return rates
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Simulate many agencies polling the MDS API')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8080', help='API base URL (http only)')
+    parser.add_argument('--agencies', type=int, default=20, help='Number of simulated agencies')
+    parser.add_argument('--duration', type=float, default=30.0, help='Test duration in seconds')
+    parser.add_argument('--rate', action='append', metavar='ENDPOINT=RPS',
+                        help='Per-agency poll rate override, e.g. --rate vehicles=2 (repeatable)')
+    parser.add_argument('--token', action='append', help='Bearer token(s) to rotate across agencies')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--max-in-flight', type=int, default=500, help='Maximum concurrent requests')
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args(argv)
+
+    try:
+        rates = parse_rates(args.rate)
+    except ValueError as e:
+        parser.error(str(e))
+
+    generator = LoadGenerator(args.base_url, args.agencies, rates, args.duration,
+                              args.token or DEFAULT_TOKENS, args.timeout, args.max_in_flight)
+    report = asyncio.run(generator.run())
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+Circuit Provider API Local Gateway
+Serves the Lambda handlers over HTTP the way API Gateway invokes them
+
+Routes, authorization and handler wiring are read from api_gateway.tf and
+lambda.tf, so the emulator follows the deployed configuration: CUSTOM
+methods go through the bearer token authorizer (with its result cached per
+token like API Gateway), NONE methods are invoked directly, and each
+handler receives an AWS_PROXY event.
+
+Usage:
+    python tools/local_gateway.py --port 8080
+    curl -H "Authorization: Bearer circuit-token-12345" localhost:8080/vehicles
+"""
+
+import argparse
+import base64
+import importlib.util
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import urlsplit, parse_qsl
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SHARED_LAYER_PATH = os.path.join(REPO_ROOT, 'lambda', 'shared', 'python')
+
+# Defaults from variables.tf, used for the handler environment
+LOCAL_ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'us-west-2',
+    'MDS_VERSION': '2.0.2',
+    'PROVIDER_ID': '00000000-0000-0000-0000-000000000000',
+    'PROVIDER_NAME': 'Circuit Mobility Provider'
+}
+
+# API Gateway TOKEN authorizers cache results for 300 seconds by default
+AUTHORIZER_CACHE_TTL = 300
+
+def read_blocks(path: str, block_type: str) -> Dict[str, str]:
+    """
+    Extract the bodies of Terraform blocks of one type
+
+    Args:
+        path: Terraform file
+        block_type: e.g. 'aws_api_gateway_method'
+
+    Returns:
+        Mapping of resource name to block body
+    """
+    with open(path) as f:
+        text = f.read()
+
+    blocks = {}
+    for match in re.finditer(r'(?:resource|data) "%s" "([\w-]+)" \{' % re.escape(block_type), text):
+        depth, end = 1, match.end()
+        while depth:
+            if text[end] == '{':
+                depth += 1
+            elif text[end] == '}':
+                depth -= 1
+            end += 1
+        blocks[match.group(1)] = text[match.end():end - 1]
+    return blocks
+
+def _attribute(body: str, name: str) -> Optional[str]:
+    match = re.search(r'^\s*%s\s*=\s*(.+)$' % name, body, re.M)
+    return match.group(1).strip().strip('"') if match else None
+
+def load_routes(root: str = REPO_ROOT) -> List[Dict[str, Any]]:
+    """
+    Build the route table from the Terraform configuration
+
+    Args:
+        root: Directory containing api_gateway.tf and lambda.tf
+
+    Returns:
+        Routes with path, method, authorization and handler location
+    """
+    methods = read_blocks(os.path.join(root, 'api_gateway.tf'), 'aws_api_gateway_method')
+    integrations = read_blocks(os.path.join(root, 'api_gateway.tf'), 'aws_api_gateway_integration')
+    functions = read_blocks(os.path.join(root, 'lambda.tf'), 'aws_lambda_function')
+    archives = read_blocks(os.path.join(root, 'lambda.tf'), 'archive_file')
+
+    integration_by_resource = {}
+    for body in integrations.values():
+        resource = re.search(r'mds_resource\["(\w+)"\]', body)
+        function = re.search(r'aws_lambda_function\.(\w+)\.invoke_arn', body)
+        if resource and function:
+            integration_by_resource[resource.group(1)] = function.group(1)
+
+    routes = []
+    for body in methods.values():
+        resource = re.search(r'mds_resource\["(\w+)"\]', body)
+        http_method = _attribute(body, 'http_method')
+        if not resource or http_method == 'OPTIONS' or resource.group(1) not in integration_by_resource:
+            continue
+
+        function_name = integration_by_resource[resource.group(1)]
+        function = functions[function_name]
+        archive = re.search(r'data\.archive_file\.(\w+)\.', function).group(1)
+        source_dir = _attribute(archives[archive], 'source_dir').replace('${path.module}', root)
+        module_name, handler_name = _attribute(function, 'handler').rsplit('.', 1)
+
+        routes.append({
+            'path': f"/{resource.group(1)}",
+            'method': http_method,
+            'authorization': _attribute(body, 'authorization'),
+            'function': function_name,
+            'source_dir': source_dir,
+            'module': module_name,
+            'handler': handler_name
+        })
+
+    authorizer = read_blocks(os.path.join(root, 'api_gateway.tf'), 'aws_api_gateway_authorizer')
+    auth_function = re.search(r'aws_lambda_function\.(\w+)\.invoke_arn', next(iter(authorizer.values()))).group(1)
+    auth_body = functions[auth_function]
+    auth_archive = re.search(r'data\.archive_file\.(\w+)\.', auth_body).group(1)
+    auth_module, auth_handler = _attribute(auth_body, 'handler').rsplit('.', 1)
+    routes.append({
+        'path': None,
+        'method': 'AUTHORIZER',
+        'authorization': 'NONE',
+        'function': auth_function,
+        'source_dir': _attribute(archives[auth_archive], 'source_dir').replace('${path.module}', root),
+        'module': auth_module,
+        'handler': auth_handler
+    })
+    return routes
+
+def load_handler(source_dir: str, module_name: str, handler_name: str):
+    """Import a Lambda module from its package directory"""
+    # The Lambda runtime puts the package directory on sys.path for sibling modules
+    if source_dir not in sys.path:
+        sys.path.insert(0, source_dir)
+    spec = importlib.util.spec_from_file_location(
+        f"local_{module_name}", os.path.join(source_dir, f"{module_name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return getattr(module, handler_name)
+
+class LocalGateway:
+    """In-process API Gateway: routing, authorizer, proxy events"""
+
+    def __init__(self, routes: List[Dict[str, Any]], stage: str = 'local'):
+        self.stage = stage
+        self.routes = {}
+        self.authorizer = None
+        for route in routes:
+            handler = load_handler(route['source_dir'], route['module'], route['handler'])
+            if route['method'] == 'AUTHORIZER':
+                self.authorizer = handler
+            else:
+                self.routes[(route['method'], route['path'])] = (route, handler)
+            logger.info(f"Loaded {route['function']} for {route['method']} {route['path'] or ''}".rstrip())
+
+        self._auth_cache: Dict[str, Tuple[float, Optional[Dict[str, Any]]]] = {}
+        self._auth_lock = threading.Lock()
+
+    def authorize(self, token: Optional[str], method_arn: str) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """
+        Run the TOKEN authorizer, caching its result per token
+
+        Returns:
+            (status, authorizer context); status is 200, 401 or 403
+        """
+        if not token:
+            return 401, None
+
+        now = time.monotonic()
+        with self._auth_lock:
+            cached = self._auth_cache.get(token)
+        if cached and cached[0] > now:
+            policy = cached[1]
+        else:
+            try:
+                policy = self.authorizer({
+                    'type': 'TOKEN',
+                    'authorizationToken': token,
+                    'methodArn': method_arn
+                }, None)
+            except Exception:
+                policy = None
+            with self._auth_lock:
+                self._auth_cache[token] = (now + AUTHORIZER_CACHE_TTL, policy)
+
+        if policy is None:
+            return 401, None
+        effects = {statement['Effect'] for statement in policy['policyDocument']['Statement']}
+        if effects != {'Allow'}:
+            return 403, None
+        return 200, dict(policy.get('context') or {}, principalId=policy['principalId'])
+
+    def invoke(self, method: str, raw_path: str, headers: Dict[str, str],
+               source_ip: str = '127.0.0.1') -> Dict[str, Any]:
+        """
+        Handle one HTTP request
+
+        Args:
+            method: HTTP method
+            raw_path: Path including the query string
+            headers: Request headers
+            source_ip: Client address
+
+        Returns:
+            API Gateway proxy response
+        """
+        url = urlsplit(raw_path)
+        route_handler = self.routes.get((method, url.path.rstrip('/') or '/'))
+        if route_handler is None:
+            return _gateway_error(403, 'Missing Authentication Token')
+        route, handler = route_handler
+
+        request_id = str(uuid.uuid4())
+        method_arn = f"arn:aws:execute-api:local:000000000000:local/{self.stage}/{method}{route['path']}"
+        authorizer_context = None
+        if route['authorization'] == 'CUSTOM':
+            authorization = next((v for k, v in headers.items() if k.lower() == 'authorization'), None)
+            status, authorizer_context = self.authorize(authorization, method_arn)
+            if status == 401:
+                return _gateway_error(401, 'Unauthorized')
+            if status == 403:
+                return _gateway_error(403, 'User is not authorized to access this resource')
+
+        query = dict(parse_qsl(url.query, keep_blank_values=True))
+        event = {
+            'resource': route['path'],
+            'path': url.path,
+            'httpMethod': method,
+            'headers': headers,
+            'multiValueHeaders': {k: [v] for k, v in headers.items()},
+            'queryStringParameters': query or None,
+            'multiValueQueryStringParameters': {k: [v] for k, v in query.items()} or None,
+            'pathParameters': None,
+            'stageVariables': None,
+            'requestContext': {
+                'resourcePath': route['path'],
+                'httpMethod': method,
+                'stage': self.stage,
+                'requestId': request_id,
+                'requestTimeEpoch': int(time.time() * 1000),
+                'identity': {'sourceIp': source_ip},
+                'authorizer': authorizer_context
+            },
+            'body': None,
+            'isBase64Encoded': False
+        }
+
+        try:
+            return handler(event, None)
+        except Exception as e:
+            logger.error(f"Handler {route['function']} raised: {str(e)}")
+            return _gateway_error(502, 'Internal server error')
+
+def _gateway_error(status: int, message: str) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'message': message})
+    }
+
+def make_request_handler(gateway: LocalGateway):
+    class RequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self._dispatch()
+
+        def do_POST(self):
+            self._dispatch()
+
+        def _dispatch(self):
+            response = gateway.invoke(self.command, self.path, dict(self.headers.items()), self.client_address[0])
+            body = response.get('body') or ''
+            payload = base64.b64decode(body) if response.get('isBase64Encoded') else body.encode('utf-8')
+
+            self.send_response(response['statusCode'])
+            for key, value in (response.get('headers') or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            logger.debug(format % args)
+
+    return RequestHandler
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='Serve the MDS Lambda handlers through a local API Gateway emulator')
+    parser.add_argument('--host', default='127.0.0.1', help='Bind address')
+    parser.add_argument('--port', type=int, default=8080, help='Listen port')
+    parser.add_argument('--stage', default='local', help='Stage name passed in requestContext')
+    args = parser.parse_args(argv)
+
+    for key, value in LOCAL_ENVIRONMENT.items():
+        os.environ.setdefault(key, value)
+    sys.path.insert(0, SHARED_LAYER_PATH)
+
+    gateway = LocalGateway(load_routes(), stage=args.stage)
+    server = ThreadingHTTPServer((args.host, args.port), make_request_handler(gateway))
+    logger.info(f"Local gateway listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
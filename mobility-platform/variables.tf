@@ -67,6 +67,47 @@ variable "db_max_allocated_storage" {
   default     = 100
 }
 
+variable "db_replica_count" {
+  description = "Number of RDS read replicas serving endpoint reads (null: 1 when data_source is database, otherwise 0)"
+  type        = number
+  default     = null
+}
+
+variable "db_replica_instance_class" {
+  description = "Instance class for read replicas (defaults to db_instance_class)"
+  type        = string
+  default     = ""
+}
+
+variable "db_max_replica_lag_seconds" {
+  description = "Replication lag above which reads fall back to the primary"
+  type        = number
+  default     = 5
+}
+
+variable "query_profiling_enabled" {
+  description = "Profile data access per endpoint and capture slow queries with EXPLAIN"
+  type        = bool
+  default     = false
+}
+
+variable "slow_query_ms" {
+  description = "Duration above which a data-access call is captured as a slow query"
+  type        = number
+  default     = 250
+}
+
+variable "data_source" {
+  description = "Where endpoint functions read data: sample or database"
+  type        = string
+  default     = "sample"
+
+  validation {
+    condition     = contains(["sample", "database"], var.data_source)
+    error_message = "data_source must be sample or database."
+  }
+}
+
 # Lambda Configuration
 variable "lambda_timeout" {
   description = "Lambda function timeout in seconds"
@@ -86,6 +127,119 @@ variable "lambda_runtime" {
   default     = "python3.11"
 }
 
+# Response Spillover Configuration
+variable "spillover_threshold_bytes" {
+  description = "Response body size above which results are written to S3 and returned as a redirect"
+  type        = number
+  default     = 5242880
+}
+
+variable "artifact_url_ttl_seconds" {
+  description = "Lifetime of presigned URLs for spilled response artifacts"
+  type        = number
+  default     = 900
+}
+
+variable "artifact_retention_days" {
+  description = "Days before spilled response artifacts are deleted from S3"
+  type        = number
+  default     = 1
+}
+
+# Warm-up Configuration
+variable "prewarm_on_init" {
+  description = "Build connections, caches and indexes during the Lambda init phase"
+  type        = bool
+  default     = false
+}
+
+variable "enable_warmup_schedule" {
+  description = "Ping the endpoint functions on a schedule to keep containers warm"
+  type        = bool
+  default     = false
+}
+
+variable "warmup_schedule_expression" {
+  description = "EventBridge schedule expression for warm-up pings"
+  type        = string
+  default     = "rate(5 minutes)"
+}
+
+# Query Cache Configuration
+variable "enable_query_cache" {
+  description = "Share query results across Lambda containers through ElastiCache Redis"
+  type        = bool
+  default     = false
+}
+
+variable "query_cache_node_type" {
+  description = "ElastiCache node type for the query cache"
+  type        = string
+  default     = "cache.t4g.micro"
+}
+
+variable "vehicles_cache_ttl_seconds" {
+  description = "Seconds a cached /vehicles query result stays fresh"
+  type        = number
+  default     = 30
+}
+
+variable "vehicles_fleet_cache_ttl_seconds" {
+  description = "Seconds a vehicles container reuses its fleet snapshot before reloading it (at most 300)"
+  type        = number
+  default     = 60
+}
+
+variable "trips_cache_ttl_seconds" {
+  description = "Seconds a cached /trips query result stays fresh"
+  type        = number
+  default     = 300
+}
+
+variable "query_timeout_ms" {
+  description = "Per-query timeout for concurrently fetched trip data"
+  type        = number
+  default     = 5000
+}
+
+# Event Store Configuration
+variable "event_retention_days" {
+  description = "Days of MDS events kept in the event store before deletion"
+  type        = number
+  default     = 90
+}
+
+# Telemetry Store Configuration
+variable "telemetry_raw_retention_days" {
+  description = "Days of raw vehicle telemetry kept in the telemetry store"
+  type        = number
+  default     = 7
+}
+
+variable "telemetry_1m_retention_days" {
+  description = "Days of 1-minute vehicle telemetry kept in the telemetry store"
+  type        = number
+  default     = 90
+}
+
+variable "telemetry_15m_retention_days" {
+  description = "Days of 15-minute vehicle telemetry kept in the telemetry store"
+  type        = number
+  default     = 730
+}
+
+variable "telemetry_max_points" {
+  description = "Most points returned by a vehicle history query; coarser resolutions are used beyond it"
+  type        = number
+  default     = 5000
+}
+
+variable "compaction_schedule_expression" {
+  description = "EventBridge schedule expression for event store compaction"
+  type        = string
+  default     = "rate(1 hour)"
+}
+
 # API Configuration
 variable "api_throttle_rate_limit" {
   description = "API Gateway throttle rate limit (requests per second)"